@@ -29,6 +29,7 @@ from pathlib import Path
 # Import das classes do bot
 from src.providers import ProviderManager, ProviderType
 from src.personas import PERSONAS
+from src.usage import read_totals
 import os
 
 # Configuração da página
@@ -193,6 +194,15 @@ class AdminPanel:
             for key, value in self.config.items():
                 f.write(f"{key}={value}\n")
     
+    def _get_usage_totals(self, by: str) -> Dict:
+        """Obtém totais de uso e custo gravados pelo bot"""
+        db_path = self.config.get('USAGE_DB') or os.getenv('USAGE_DB', 'usage.db')
+        try:
+            return read_totals(db_path, by)
+        except Exception as e:
+            logging.warning(f"Não foi possível ler o uso em {db_path}: {e}")
+            return {}
+    
     def _get_system_stats(self) -> Dict:
         """Obtém estatísticas do sistema"""
         return {
@@ -672,7 +682,10 @@ class AdminPanel:
             st.metric("🤖 Provedor Ativo", "OpenAI", "")
         
         with col4:
-            st.metric("💸 Custo Estimado", "$2.45", "+$0.15")
+            cost_by_day = self._get_usage_totals("day")
+            total_cost = sum(day["cost"] for day in cost_by_day.values())
+            today_cost = cost_by_day.get(datetime.now().date().isoformat(), {}).get("cost", 0.0)
+            st.metric("💸 Custo Estimado", f"${total_cost:.2f}", f"+${today_cost:.2f}")
         
         st.markdown("---")
         
@@ -738,12 +751,10 @@ class AdminPanel:
         
         with col2:
             st.subheader("🥧 Distribuição de Provedores")
-            # Placeholder para gráfico de pizza
+            # Requisições registradas pela contabilidade de uso
             provider_stats = {
-                "OpenAI": 45,
-                "Claude": 30, 
-                "Free": 20,
-                "Gemini": 5
+                provider: totals["requests"]
+                for provider, totals in self._get_usage_totals("provider").items()
             }
             st.bar_chart(provider_stats)
     
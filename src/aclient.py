@@ -1,15 +1,26 @@
 
+import io
 import os
 import discord
 import asyncio
 import logging
-from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
+from typing import List, Dict, Optional, Tuple
 from discord.ext import commands
 
 from src import personas
 from src.log import logger
-from src.providers import ProviderManager, ProviderType, ModelInfo
-from utils.message_utils import send_split_message
+from src.providers import ProviderManager, ProviderType, ModelInfo, TIMEOUT_RESPONSE
+from src.deadline import Deadline
+from src.context import ContextBuilder, ReplyBudget
+from src.tokens import load_tokenizer_async
+from src.usage import set_requester
+from src.settings import SettingsStore, ScopedSettings
+from src.conversations import ConversationStore
+from src.history import Message
+from src.turns import TurnQueue
+from src.memory import SummaryMemory
+from utils.message_utils import send_split_message, StreamSink
 
 from dotenv import load_dotenv
 from discord import app_commands
@@ -29,13 +40,25 @@ class DiscordClient(commands.Bot):
         
         # Initialize components
         self.provider_manager = ProviderManager()
-        self.conversation_histories = {}
+        self.conversation_histories = ConversationStore.from_env()
+        self.turns = TurnQueue.from_env()
+        self.memory = SummaryMemory.from_env(self.provider_manager, self.conversation_histories)
+        self.context_builder = ContextBuilder()
         self.current_persona = "helpful"
         
+        # Provider, model and persona chosen per guild, channel or user
+        self.settings = SettingsStore.from_env()
+        
         # Configuration
         self.max_message_length = int(os.getenv("MAX_MESSAGE_LENGTH", "2000"))
         self.conversation_limit = int(os.getenv("CONVERSATION_HISTORY_LIMIT", "20"))
         self.trim_size = int(os.getenv("TRIM_CONVERSATION_SIZE", "8"))
+        self.reply_budget = ReplyBudget(self.max_message_length)
+        self.streaming_enabled = os.getenv("STREAMING_ENABLED", "False").lower() in {"1", "true", "yes", "y"}
+        self.stream_edit_interval = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+        self.warmup_enabled = os.getenv("WARMUP_ENABLED", "False").lower() in {"1", "true", "yes", "y"}
+        self._warmup_task = None
+        self._tokenizer_task = None
         
         # Admin users (robust parsing; ignore inline comments and invalid tokens)
         admin_ids_raw = os.getenv("ADMIN_USER_IDS", "")
@@ -54,6 +77,14 @@ class DiscordClient(commands.Bot):
         logger.info(f"✅ Bot conectado como: {self.user}")
         logger.info(f"Bot ID: {self.user.id}")
         
+        # Load the tokenizer off the loop; context assembly estimates until it is ready
+        if self._tokenizer_task is None:
+            self._tokenizer_task = asyncio.create_task(load_tokenizer_async())
+        
+        # on_ready fires again after reconnects; warm up only once, in the background
+        if self.warmup_enabled and self._warmup_task is None:
+            self._warmup_task = asyncio.create_task(self.provider_manager.warm_up())
+        
         try:
             # Sync commands
             synced = await self.tree.sync()
@@ -80,7 +111,17 @@ class DiscordClient(commands.Bot):
         # Handle DMs
         if isinstance(message.channel, discord.DMChannel):
             try:
-                response = await self.handle_message(message.content, message.author.id)
+                # Messages sent in quick succession are answered together
+                content = await self.turns.collect(message.author.id, message.content)
+                if content is None:
+                    return
+                if self.streaming_enabled:
+                    sink = StreamSink(message.channel.send, self.max_message_length, self.stream_edit_interval)
+                    await self.handle_message_stream(content, message.author.id, sink,
+                                                     channel_id=message.channel.id)
+                    return
+                response = await self.handle_message(content, message.author.id,
+                                                     channel_id=message.channel.id)
                 await send_split_message(message.channel, response, self.max_message_length)
             except Exception as e:
                 logger.error(f"Error handling DM: {e}")
@@ -89,49 +130,168 @@ class DiscordClient(commands.Bot):
                 except Exception:
                     pass
     
-    async def handle_message(self, content: str, user_id: int) -> str:
-        """Handle message and generate AI response"""
+    async def handle_message(self, content: str, user_id: int, deadline: Optional[Deadline] = None,
+                             guild_id: Optional[int] = None, channel_id: Optional[int] = None,
+                             delivery: str = "split") -> str:
+        """Handle message and generate AI response before ``deadline``.
+        
+        ``delivery`` is how the reply will be sent (single, split or
+        attachment) and sizes the generation budget.
+        """
         try:
-            # Get or create conversation history
-            if user_id not in self.conversation_histories:
-                self.conversation_histories[user_id] = []
+            set_requester(user_id, guild_id)
+            if deadline is None:
+                deadline = Deadline.from_env()
             
-            history = self.conversation_histories[user_id]
+            # One turn at a time per conversation, in arrival order
+            async with self._turn(user_id):
+                # Bring the conversation back from disk on the first message after a restart
+                await self.conversation_histories.load(user_id)
+                settings = await self._resolve_settings(user_id, channel_id, guild_id)
+                provider, model = self._scoped_model(settings)
+                max_tokens = self.reply_budget.tokens_for(delivery, personas.get_persona_verbosity(settings.persona))
+                messages = self._prepare_messages(content, user_id, settings.persona, model, delivery)
             
-            # Add user message to history
-            history.append({"role": "user", "content": content})
-            
-            # Trim history if too long (keep recent pairs)
-            if len(history) > self.conversation_limit:
-                keep = self.trim_size * 2
-                recent_messages = history[-keep:]
-                self.conversation_histories[user_id] = recent_messages
-                history = recent_messages
+                # Get AI response
+                response = await self.provider_manager.get_response(
+                    messages, deadline=deadline, persona=settings.persona,
+                    provider=provider, model_name=settings.model, max_tokens=max_tokens
+                )
             
-            # Get current persona
-            persona_prompt = personas.get_persona_prompt(self.current_persona)
+                self._record_response(user_id, response)
+                return response
             
-            # Prepare messages for AI
-            messages = [{"role": "system", "content": persona_prompt}] + history
+        except Exception as e:
+            logger.error(f"Error handling message: {e}")
+            return "❌ Desculpe, ocorreu um erro ao processar sua mensagem."
+    
+    async def handle_message_stream(self, content: str, user_id: int, sink: StreamSink,
+                                    deadline: Optional[Deadline] = None, guild_id: Optional[int] = None,
+                                    channel_id: Optional[int] = None) -> str:
+        """Handle message streaming AI tokens into ``sink`` as they arrive"""
+        try:
+            set_requester(user_id, guild_id)
+            if deadline is None:
+                deadline = Deadline.from_env()
             
-            # Get AI response
-            response = await self.provider_manager.get_response(messages)
+            # One turn at a time per conversation, in arrival order
+            async with self._turn(user_id):
+                # Bring the conversation back from disk on the first message after a restart
+                await self.conversation_histories.load(user_id)
+                settings = await self._resolve_settings(user_id, channel_id, guild_id)
+                provider, model = self._scoped_model(settings)
+                # The sink splits long replies across messages
+                max_tokens = self.reply_budget.tokens_for("split", personas.get_persona_verbosity(settings.persona))
+                messages = self._prepare_messages(content, user_id, settings.persona, model, "split")
             
-            # Add AI response to history
-            history.append({"role": "assistant", "content": response})
+                async def pump():
+                    async for token in self.provider_manager.stream_response(
+                        messages, persona=settings.persona, provider=provider, model_name=settings.model,
+                        max_tokens=max_tokens
+                    ):
+                        await sink.write(token)
             
-            # Post-append trim to ensure max recent context (pairs)
-            max_keep = self.trim_size * 2
-            if len(history) > max_keep:
-                trimmed = history[-max_keep:]
-                self.conversation_histories[user_id] = trimmed
-                history = trimmed
+                try:
+                    await deadline.run(pump())
+                except asyncio.TimeoutError:
+                    logger.warning("Streaming request timed out")
+                    await sink.write(("\n\n" if sink.text else "") + TIMEOUT_RESPONSE)
+                response = await sink.finish()
             
-            return response
+                self._record_response(user_id, response)
+                return response
             
         except Exception as e:
-            logger.error(f"Error handling message: {e}")
-            return "❌ Desculpe, ocorreu um erro ao processar sua mensagem."
+            logger.error(f"Error streaming message: {e}")
+            error = "❌ Desculpe, ocorreu um erro ao processar sua mensagem."
+            await sink.write(error)
+            await sink.finish()
+            return error
+    
+    @asynccontextmanager
+    async def _turn(self, user_id: int):
+        """Serialize ``user_id``'s turns and keep its history in memory until the reply is recorded"""
+        async with self.turns.turn(user_id):
+            with self.conversation_histories.pinned(user_id):
+                yield
+    
+    async def _resolve_settings(self, user_id: int, channel_id: Optional[int] = None,
+                                guild_id: Optional[int] = None) -> ScopedSettings:
+        """Scoped provider, model and persona for a message, over the bot-wide defaults"""
+        try:
+            settings = await self.settings.resolve(user_id, channel_id, guild_id,
+                                                   defaults=ScopedSettings(persona=self.current_persona))
+        except Exception as e:
+            logger.error(f"Error resolving settings: {e}")
+            settings = ScopedSettings()
+        if not settings.persona or not personas.is_valid_persona(settings.persona):
+            settings.persona = self.current_persona
+        return settings
+    
+    def _scoped_model(self, settings: ScopedSettings) -> Tuple[Optional[ProviderType], ModelInfo]:
+        """Provider chosen by ``settings`` (if any) and the model to size the context for"""
+        parsed = ProviderManager._parse_provider_list(settings.provider or "")
+        provider = parsed[0] if parsed else None
+        model = self.provider_manager.resolve_model(provider, settings.model) or self.provider_manager.current_model
+        return provider, model
+    
+    def _prepare_messages(self, content: str, user_id: int, persona: Optional[str] = None,
+                          model: Optional[ModelInfo] = None, delivery: str = "split") -> List[Dict[str, str]]:
+        """Append user message to history and build the provider message list"""
+        # Add user message to history (created on first message)
+        history = self.conversation_histories.append(user_id, Message("user", content))
+        
+        # Trim history if too long (keep recent pairs)
+        if len(history) > self.conversation_limit:
+            self._trim_history(user_id, self.trim_size * 2)
+        
+        # Get current persona, told how long the delivered reply can be
+        persona = persona or self.current_persona
+        verbosity = personas.get_persona_verbosity(persona)
+        persona_prompt = personas.get_persona_prompt(persona) + self.reply_budget.hint(delivery, verbosity)
+        
+        # Pack persona + summary of older turns + as much recent history as fits the model's window
+        return self.context_builder.build(persona_prompt, history, model or self.provider_manager.current_model,
+                                          self.reply_budget.tokens_for(delivery, verbosity),
+                                          self.conversation_histories.summary(user_id))
+    
+    def _record_response(self, user_id: int, response: str):
+        """Append AI response to history and trim to the recent context"""
+        # An empty assistant turn would be rejected by Claude on every later request
+        if not response or not response.strip():
+            return
+        # Add AI response to history
+        history = self.conversation_histories.append(user_id, Message("assistant", response))
+        
+        # Post-append trim to ensure max recent context (pairs); drop at least a
+        # whole block so the prompt prefix stays cacheable for the next turns
+        max_keep = self.trim_size * 2
+        if len(history) > max_keep:
+            drop = max(len(history) - max_keep, min(self.context_builder.trim_block, max_keep))
+            self._trim_history(user_id, len(history) - drop)
+    
+    def _trim_history(self, user_id: int, keep: int):
+        """Keep the newest ``keep`` messages; the rest are summarized when memory is on"""
+        dropped = self.conversation_histories.trim(user_id, keep)
+        self.memory.remember(user_id, dropped)
+    
+    async def close(self):
+        """Close provider connections before shutting down the gateway"""
+        try:
+            # Summaries still being written need the providers
+            await self.memory.aclose()
+        except Exception as e:
+            logger.error(f"Erro ao finalizar resumos: {e}")
+        try:
+            await self.provider_manager.aclose()
+        except Exception as e:
+            logger.error(f"Erro ao fechar provedores: {e}")
+        try:
+            await self.conversation_histories.aclose()
+        except Exception as e:
+            logger.error(f"Erro ao salvar conversas: {e}")
+        self.settings.close()
+        await super().close()
     
     def set_persona(self, persona_name: str) -> bool:
         """Set current persona"""
@@ -143,14 +303,30 @@ class DiscordClient(commands.Bot):
     
     def clear_conversation(self, user_id: int):
         """Clear conversation history for user"""
-        if user_id in self.conversation_histories:
-            del self.conversation_histories[user_id]
+        self.memory.forget(user_id)
+        if self.conversation_histories.delete(user_id):
             logger.info(f"Conversa limpa para usuário: {user_id}")
     
     def is_admin(self, user_id: int) -> bool:
         """Check if user is admin"""
         return user_id in self.admin_users
     
+    def _settings_scope(self, interaction: discord.Interaction, escopo: str) -> Tuple[str, Optional[int]]:
+        """Map a command scope to a settings key; raises PermissionError when not allowed"""
+        escopo = escopo.strip().lower()
+        if escopo in ("usuario", "usuário"):
+            return "user", interaction.user.id
+        if escopo not in ("canal", "servidor"):
+            raise ValueError(escopo)
+        if interaction.guild_id is None:
+            raise PermissionError(escopo)
+        permissions = getattr(interaction.user, "guild_permissions", None)
+        if not (self.is_admin(interaction.user.id) or getattr(permissions, "manage_guild", False)):
+            raise PermissionError(escopo)
+        if escopo == "canal":
+            return "channel", interaction.channel_id
+        return "guild", interaction.guild_id
+    
     def run_bot(self):
         """Run the Discord bot"""
         token = os.getenv("DISCORD_BOT_TOKEN")
@@ -175,12 +351,36 @@ class DiscordClient(commands.Bot):
         """Setup slash commands"""
         
         @self.tree.command(name="chat", description="Conversar com IA")
-        async def chat_command(interaction: discord.Interaction, mensagem: str):
+        @app_commands.describe(longo="Resposta longa, enviada como arquivo se não couber numa mensagem")
+        async def chat_command(interaction: discord.Interaction, mensagem: str, longo: bool = False):
+            deadline = Deadline.for_interaction(interaction.created_at)
             await interaction.response.defer(thinking=True)
             
             try:
-                response = await self.handle_message(mensagem, interaction.user.id)
-                await interaction.followup.send(response[:2000])
+                if longo:
+                    response = await self.handle_message(mensagem, interaction.user.id, deadline,
+                                                         guild_id=interaction.guild_id,
+                                                         channel_id=interaction.channel_id,
+                                                         delivery="attachment")
+                    if len(response) <= self.max_message_length:
+                        await interaction.followup.send(response)
+                    else:
+                        attachment = discord.File(io.BytesIO(response.encode("utf-8")), filename="resposta.md")
+                        await interaction.followup.send("📄 Resposta completa em anexo.", file=attachment)
+                    return
+                if self.streaming_enabled:
+                    async def send(text):
+                        return await interaction.followup.send(text, wait=True)
+                    sink = StreamSink(send, self.max_message_length, self.stream_edit_interval)
+                    await self.handle_message_stream(mensagem, interaction.user.id, sink, deadline,
+                                                     guild_id=interaction.guild_id,
+                                                     channel_id=interaction.channel_id)
+                    return
+                response = await self.handle_message(mensagem, interaction.user.id, deadline,
+                                                     guild_id=interaction.guild_id,
+                                                     channel_id=interaction.channel_id,
+                                                     delivery="single")
+                await interaction.followup.send(response[:self.max_message_length])
             except Exception as e:
                 logger.error(f"Erro no comando chat: {e}")
                 await interaction.followup.send("❌ Erro ao processar mensagem.")
@@ -195,19 +395,62 @@ class DiscordClient(commands.Bot):
                 await interaction.response.send_message("❌ Erro ao limpar conversa.")
         
         @self.tree.command(name="persona", description="Alterar personalidade da IA")
-        async def persona_command(interaction: discord.Interaction, nome: str):
+        @app_commands.describe(escopo="usuario (padrão), canal ou servidor")
+        async def persona_command(interaction: discord.Interaction, nome: str, escopo: str = "usuario"):
             try:
-                if self.set_persona(nome):
-                    await interaction.response.send_message(f"🎭 Persona alterada para: {nome}")
-                else:
+                if not personas.is_valid_persona(nome):
                     available = ", ".join(personas.get_available_personas())
                     await interaction.response.send_message(
                         f"❌ Persona inválida. Disponíveis: {available}"
                     )
+                    return
+                scope, scope_id = self._settings_scope(interaction, escopo)
+                await self.settings.set(scope, scope_id, persona=nome)
+                await interaction.response.send_message(f"🎭 Persona alterada para: {nome} ({escopo})")
+            except PermissionError:
+                await interaction.response.send_message(
+                    "❌ Apenas administradores podem alterar o canal ou servidor."
+                )
+            except ValueError:
+                await interaction.response.send_message("❌ Escopo inválido. Use: usuario, canal ou servidor")
             except Exception as e:
                 logger.error(f"Erro no comando persona: {e}")
                 await interaction.response.send_message("❌ Erro ao alterar persona.")
         
+        @self.tree.command(name="provedor", description="Escolher provedor e modelo de IA")
+        @app_commands.describe(modelo="Modelo do provedor (opcional)", escopo="usuario (padrão), canal ou servidor")
+        async def provider_command(interaction: discord.Interaction, nome: str,
+                                   modelo: Optional[str] = None, escopo: str = "usuario"):
+            try:
+                parsed = ProviderManager._parse_provider_list(nome)
+                available = self.provider_manager.get_available_providers()
+                if not parsed or parsed[0] not in available:
+                    names = ", ".join(p.value for p in available)
+                    await interaction.response.send_message(f"❌ Provedor indisponível. Disponíveis: {names}")
+                    return
+                provider = parsed[0]
+                models = [m.name for m in self.provider_manager.get_models_for_provider(provider)]
+                if modelo and modelo not in models:
+                    await interaction.response.send_message(
+                        f"❌ Modelo inválido para {provider.value}. Disponíveis: {', '.join(models)}"
+                    )
+                    return
+                scope, scope_id = self._settings_scope(interaction, escopo)
+                await self.settings.set(scope, scope_id, provider=provider.value, model=modelo)
+                await interaction.response.send_message(
+                    f"🔌 Provedor alterado para: {provider.value}"
+                    + (f" ({modelo})" if modelo else "") + f" ({escopo})"
+                )
+            except PermissionError:
+                await interaction.response.send_message(
+                    "❌ Apenas administradores podem alterar o canal ou servidor."
+                )
+            except ValueError:
+                await interaction.response.send_message("❌ Escopo inválido. Use: usuario, canal ou servidor")
+            except Exception as e:
+                logger.error(f"Erro no comando provedor: {e}")
+                await interaction.response.send_message("❌ Erro ao alterar provedor.")
+        
         @self.tree.command(name="status", description="Ver status do bot")
         async def status_command(interaction: discord.Interaction):
             try:
@@ -216,14 +459,19 @@ class DiscordClient(commands.Bot):
                     color=discord.Color.green()
                 )
                 
+                # Settings in effect for whoever asked, in this channel and server
+                settings = await self._resolve_settings(interaction.user.id, interaction.channel_id,
+                                                        interaction.guild_id)
+                provider, model = self._scoped_model(settings)
+                
                 # Bot info
                 embed.add_field(name="Status", value="✅ Online", inline=True)
                 embed.add_field(name="Latency", value=f"{round(self.latency * 1000)}ms", inline=True)
-                embed.add_field(name="Persona Atual", value=self.current_persona, inline=True)
+                embed.add_field(name="Persona Atual", value=settings.persona, inline=True)
                 
                 # Provider info
-                current_provider = self.provider_manager.current_provider
-                embed.add_field(name="Provedor Atual", value=current_provider.value, inline=True)
+                current_provider = provider or self.provider_manager.current_provider
+                embed.add_field(name="Provedor Atual", value=f"{current_provider.value} ({model.name})", inline=True)
                 
                 # Available providers
                 available_providers = [p.value for p in self.provider_manager.get_available_providers()]
@@ -233,6 +481,27 @@ class DiscordClient(commands.Bot):
                     inline=False
                 )
                 
+                # Conversations held in memory
+                conversations = self.conversation_histories.stats()
+                embed.add_field(
+                    name="Conversas Ativas",
+                    value=f"{conversations['entries']} ({conversations['bytes'] // 1024} KiB)",
+                    inline=True
+                )
+                
+                # Circuit breaker state per provider
+                breaker_icons = {"closed": "🟢", "half-open": "🟡", "open": "🔴"}
+                breakers = self.provider_manager.get_provider_status().get("breakers", {})
+                if breakers:
+                    embed.add_field(
+                        name="Saúde dos Provedores",
+                        value="\n".join(
+                            f"{breaker_icons.get(state, '⚪')} {name}: {state}"
+                            for name, state in breakers.items()
+                        ),
+                        inline=False
+                    )
+                
                 await interaction.response.send_message(embed=embed)
                 
             except Exception as e:
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.log import logger
+
+
+def make_cache_key(provider: str, model: str, messages: List[Dict[str, str]],
+                   max_tokens: Optional[int] = None) -> str:
+    """Build a stable key from provider, model and the normalized message list.
+
+    The persona prompt travels as the leading system message, so it is part of
+    the key. Whitespace is collapsed so trivially different spacing still hits.
+    Replies generated under a different ``max_tokens`` budget get their own key.
+    """
+    normalized = [
+        [message["role"], " ".join(str(message["content"]).split())]
+        for message in messages
+    ]
+    parts = [provider, model, normalized] + ([max_tokens] if max_tokens is not None else [])
+    payload = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Exact-match response cache: in-memory LRU with TTL plus optional SQLite tier.
+
+    The SQLite tier keeps at most ``db_max_entries`` rows. Expired rows and
+    the oldest rows past the cap are purged every ``purge_interval`` seconds
+    (or after a tenth of the cap in new writes), in the writer thread.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0,
+                 max_bytes: int = 10 * 1024 * 1024, db_path: Optional[str] = None,
+                 db_max_entries: int = 10000, purge_interval: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.db_max_entries = db_max_entries
+        self.purge_interval = purge_interval
+        self._last_purge = time.monotonic()
+        self._writes_since_purge = 0
+
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_purged = 0
+
+        if db_path:
+            self._open_db()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Build the cache from environment settings, or None when disabled"""
+        if os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() not in {"1", "true", "yes", "y"}:
+            return None
+        return cls(
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(10 * 1024 * 1024))),
+            db_path=os.getenv("RESPONSE_CACHE_DB") or None,
+            db_max_entries=int(os.getenv("RESPONSE_CACHE_DB_MAX_ENTRIES", "10000")),
+            purge_interval=float(os.getenv("RESPONSE_CACHE_PURGE_INTERVAL", "600")),
+        )
+
+    def _open_db(self):
+        """Open the on-disk tier; failures leave the cache memory-only"""
+        try:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._purge()
+            logger.info(f"Response cache disk tier at {self.db_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Could not open response cache at {self.db_path}: {e}. Using memory only.")
+            self._db = None
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return a cached response or None"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at >= time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._remove(key)
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._db_get, key)
+            if row is not None:
+                value, expires_at = row
+                self._store(key, value, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        """Cache a successful response"""
+        expires_at = time.time() + self.ttl
+        self._store(key, value, expires_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_set, key, value, expires_at)
+
+    def _store(self, key: str, value: str, expires_at: float):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value.encode("utf-8"))
+
+    def _db_get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at >= ?",
+                (key, time.time()),
+            ).fetchone()
+        return row
+
+    def _db_set(self, key: str, value: str, expires_at: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._db.commit()
+            self._writes_since_purge += 1
+            if (time.monotonic() - self._last_purge >= self.purge_interval
+                    or self._writes_since_purge >= max(1, self.db_max_entries // 10)):
+                self._purge()
+
+    def _purge(self):
+        """Delete expired rows, then the oldest rows past ``db_max_entries`` (caller holds the lock)"""
+        purged = self._db.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),)).rowcount
+        if self.db_max_entries > 0:
+            # Every row gets the same TTL, so the earliest expiry is the oldest write
+            purged += self._db.execute(
+                "DELETE FROM response_cache WHERE key IN "
+                "(SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.db_max_entries,),
+            ).rowcount
+        self._db.commit()
+        self.disk_purged += purged
+        self._last_purge = time.monotonic()
+        self._writes_since_purge = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size"""
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_purged": self.disk_purged,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def close(self):
+        """Close the on-disk tier"""
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing a key into one in-flight call.
+
+    The shared call runs as its own task, so a caller that gives up does not
+    cancel it for the others; it is only cancelled once every waiter is gone.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Tuple[asyncio.Task, List[int]]] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        """Run ``fn`` for ``key`` or join the call already in flight"""
+        entry = self._calls.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn())
+            entry = (task, [0])
+            self._calls[key] = entry
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and waiters[0] == 1:
+                task.cancel()
+            raise
+        finally:
+            waiters[0] -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Coalescing counters"""
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
@@ -0,0 +1,73 @@
+import os
+import importlib.util
+from typing import Any, Callable, Dict, Tuple
+
+from src.log import logger
+
+
+def _env_flag(name: str, default: str) -> bool:
+    """Parse a boolean-like environment variable"""
+    return os.getenv(name, default).lower() in {"1", "true", "yes", "y"}
+
+
+class ClientRegistry:
+    """Long-lived SDK clients keyed by provider and API key.
+
+    Every client built through the registry shares one tuned ``httpx``
+    connection pool, so keep-alive connections (and HTTP/2 when ``h2`` is
+    installed) are reused across requests instead of paying a new TCP/TLS
+    handshake per message.
+    """
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.http2 = _env_flag("HTTP2_ENABLED", "True") and importlib.util.find_spec("h2") is not None
+
+        self._http_client = None
+        self._clients: Dict[Tuple[str, str], Any] = {}
+
+    def get_http_client(self):
+        """Return the shared pooled ``httpx.AsyncClient``, creating it on first use"""
+        if self._http_client is None or self._http_client.is_closed:
+            import httpx
+
+            self._http_client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+            logger.info(
+                f"HTTP pool created (max_connections={self.max_connections}, "
+                f"keepalive={self.max_keepalive}, http2={self.http2})"
+            )
+        return self._http_client
+
+    def get(self, provider: str, api_key: str, factory: Callable[[Any], Any]) -> Any:
+        """Get or build the client for ``(provider, api_key)``.
+
+        ``factory`` receives the shared HTTP client and must return the SDK client.
+        """
+        key = (provider, api_key)
+        client = self._clients.get(key)
+        if client is None:
+            client = factory(self.get_http_client())
+            self._clients[key] = client
+            logger.debug(f"Created pooled client for {provider}")
+        return client
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    async def aclose(self):
+        """Close the shared connection pool and forget every cached client"""
+        self._clients.clear()
+        if self._http_client is not None and not self._http_client.is_closed:
+            await self._http_client.aclose()
+            logger.info("HTTP pool closed")
+        self._http_client = None
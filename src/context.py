@@ -0,0 +1,121 @@
+import os
+import math
+from typing import Dict, List, Optional, Sequence
+
+from src.providers import DEFAULT_MAX_TOKENS, ModelInfo
+from src.tokens import count_message_tokens
+from src.history import MessageLike, as_dict
+
+# How a reply reaches the user: one message, split across messages, or a file
+DELIVERY_MODES = ("single", "split", "attachment")
+
+# Introduces the rolling summary of trimmed history
+SUMMARY_HEADER = "Resumo da conversa anterior:"
+
+# Share of the delivery limit a persona aims to fill
+VERBOSITY_FACTORS = {"concise": 0.5, "normal": 0.75, "detailed": 1.0}
+
+
+class ContextBuilder:
+    """Pack the persona prompt plus as much recent history as fits the model window.
+
+    The prompt budget is ``CONTEXT_BUDGET_FRACTION`` of ``ModelInfo.max_tokens``
+    minus the tokens reserved for the reply. History is taken newest-first and
+    the latest message is always kept, even when it alone exceeds the budget.
+    Older messages are dropped in blocks of ``CONTEXT_TRIM_BLOCK`` so the
+    prompt prefix stays identical across turns and provider prefix caches hit.
+    """
+
+    def __init__(self):
+        self.budget_fraction = float(os.getenv("CONTEXT_BUDGET_FRACTION", "0.75"))
+        self.reply_tokens = int(os.getenv("CONTEXT_REPLY_TOKENS", str(DEFAULT_MAX_TOKENS)))
+        self.min_history_tokens = int(os.getenv("CONTEXT_MIN_HISTORY_TOKENS", "256"))
+        self.trim_block = max(1, int(os.getenv("CONTEXT_TRIM_BLOCK", "4")))
+
+    def budget_for(self, model: ModelInfo, reply_tokens: int = None) -> int:
+        """Prompt token budget for ``model``"""
+        reply = self.reply_tokens if reply_tokens is None else reply_tokens
+        budget = int(model.max_tokens * self.budget_fraction) - reply
+        return max(budget, self.min_history_tokens)
+
+    def build(self, persona_prompt: str, history: Sequence[MessageLike],
+              model: ModelInfo, reply_tokens: int = None, summary: Optional[str] = None) -> List[Dict[str, str]]:
+        """Return ``[system] + newest history that fits`` in chronological order.
+
+        ``history`` is read in place (newest first); only the selected
+        messages are turned into the dicts the provider SDKs expect. A
+        ``summary`` of earlier, trimmed history follows the persona as a
+        second system message; providers that cache prompt prefixes keep the
+        persona cached on its own, ahead of the summary.
+        """
+        system = [{"role": "system", "content": persona_prompt}]
+        if summary:
+            system.append({"role": "system", "content": f"{SUMMARY_HEADER}\n{summary}"})
+        remaining = self.budget_for(model, reply_tokens) - sum(count_message_tokens(m) for m in system)
+
+        selected = []
+        for message in reversed(history):
+            cost = count_message_tokens(message)
+            if selected and cost > remaining:
+                break
+            selected.append(message)
+            remaining -= cost
+
+        # Round the dropped prefix up to a whole block so the start moves rarely
+        dropped = len(history) - len(selected)
+        if dropped:
+            for _ in range(-dropped % self.trim_block):
+                if len(selected) == 1:
+                    break
+                selected.pop()
+
+        # Conversations must resume on a user turn (required by Claude)
+        while len(selected) > 1 and selected[-1]["role"] != "user":
+            selected.pop()
+
+        selected.reverse()
+        return system + [as_dict(m) for m in selected]
+
+
+class ReplyBudget:
+    """Size the completion budget to what Discord will actually show.
+
+    ``single`` replies are truncated to one message of ``max_message_length``
+    characters, ``split`` replies may use ``REPLY_SPLIT_MESSAGES`` messages and
+    ``attachment`` (opt-in long form) gets ``REPLY_LONG_FORM_TOKENS``. The
+    visible size is scaled by the persona's verbosity and converted to tokens
+    at ``REPLY_CHARS_PER_TOKEN``.
+    """
+
+    def __init__(self, max_message_length: int = 2000):
+        self.enabled = os.getenv("REPLY_BUDGET_ENABLED", "True").lower() in {"1", "true", "yes", "y"}
+        self.max_message_length = max_message_length
+        self.split_messages = max(1, int(os.getenv("REPLY_SPLIT_MESSAGES", "3")))
+        self.chars_per_token = float(os.getenv("REPLY_CHARS_PER_TOKEN", "3.5"))
+        self.long_form_tokens = int(os.getenv("REPLY_LONG_FORM_TOKENS", "4000"))
+        self.min_tokens = int(os.getenv("REPLY_MIN_TOKENS", "64"))
+        self.length_hint = os.getenv("REPLY_LENGTH_HINT", "True").lower() in {"1", "true", "yes", "y"}
+
+    def chars_for(self, delivery: str, verbosity: str = "normal") -> Optional[int]:
+        """Characters the reply should aim for, or None when it is not limited"""
+        if delivery not in DELIVERY_MODES:
+            raise ValueError(f"Unknown delivery mode: {delivery}")
+        if not self.enabled or delivery == "attachment":
+            return None
+        limit = self.max_message_length * (self.split_messages if delivery == "split" else 1)
+        return int(limit * VERBOSITY_FACTORS.get(verbosity, VERBOSITY_FACTORS["normal"]))
+
+    def tokens_for(self, delivery: str, verbosity: str = "normal") -> int:
+        """``max_tokens`` to request for a reply delivered as ``delivery``"""
+        chars = self.chars_for(delivery, verbosity)
+        if chars is None:
+            return self.long_form_tokens if self.enabled else DEFAULT_MAX_TOKENS
+        tokens = math.ceil(chars / self.chars_per_token)
+        return max(self.min_tokens, min(tokens, DEFAULT_MAX_TOKENS))
+
+    def hint(self, delivery: str, verbosity: str = "normal") -> str:
+        """Instruction appended to the persona so the model ends before the budget cuts it off"""
+        chars = self.chars_for(delivery, verbosity)
+        if chars is None or not self.length_hint:
+            return ""
+        return f"\n\nResponda em no máximo {chars} caracteres."
@@ -0,0 +1,533 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from src.log import logger
+from src.history import History, Message, MessageLike
+
+# Rough per-message cost beyond the content itself (slotted record plus its ring buffer slot)
+MESSAGE_OVERHEAD_BYTES = 56
+
+
+def estimate_bytes(messages: Iterable[MessageLike]) -> int:
+    """Approximate memory held by a sequence of messages"""
+    return sum(len(str(m.get("content", ""))) + MESSAGE_OVERHEAD_BYTES for m in messages)
+
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS conversation_messages ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, conversation TEXT NOT NULL, "
+    "role TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS conversation_messages_by_conversation "
+    "ON conversation_messages (conversation, id)",
+    # Messages before start_id were trimmed or cleared and are deleted on compaction
+    "CREATE TABLE IF NOT EXISTS conversation_heads ("
+    "conversation TEXT PRIMARY KEY, start_id INTEGER NOT NULL)",
+    # Rolling summary of the trimmed part of a conversation
+    "CREATE TABLE IF NOT EXISTS conversation_summaries ("
+    "conversation TEXT PRIMARY KEY, summary TEXT NOT NULL, updated_at REAL NOT NULL)",
+)
+
+_APPEND = "INSERT INTO conversation_messages (conversation, role, content, created_at) VALUES (?, ?, ?, ?)"
+
+_TRIM = (
+    "INSERT OR REPLACE INTO conversation_heads (conversation, start_id) "
+    "SELECT ?, COALESCE(MIN(id), 0) FROM ("
+    "SELECT id FROM conversation_messages WHERE conversation = ? ORDER BY id DESC LIMIT ?)"
+)
+
+_CLEAR = (
+    "INSERT OR REPLACE INTO conversation_heads (conversation, start_id) "
+    "SELECT ?, COALESCE(MAX(id), 0) + 1 FROM conversation_messages"
+)
+
+_SUMMARY = (
+    "INSERT OR REPLACE INTO conversation_summaries (conversation, summary, updated_at) VALUES (?, ?, ?)"
+)
+
+_FORGET_SUMMARY = "DELETE FROM conversation_summaries WHERE conversation = ?"
+
+_LOAD = (
+    "SELECT role, content FROM conversation_messages WHERE conversation = ? AND id >= "
+    "COALESCE((SELECT start_id FROM conversation_heads WHERE conversation = ?), 0) ORDER BY id"
+)
+
+
+class ConversationLog:
+    """Durable conversation history in SQLite (WAL), written behind the event loop.
+
+    ``append``, ``trim`` and ``clear`` only queue an operation; the queue is
+    written in one transaction ``flush_interval`` seconds after the first
+    queued operation, or as soon as ``batch_size`` operations are waiting.
+    Trimming and clearing just move a conversation's start marker; the rows
+    before it are deleted by a compaction that runs off the loop every
+    ``compact_interval`` seconds, together with conversations idle for longer
+    than ``retention_days``. Up to ``flush_interval`` seconds of messages can
+    be lost on a crash; a clean shutdown flushes everything.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 1.0, batch_size: int = 50,
+                 compact_interval: float = 3600, retention_days: float = 30):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_interval = compact_interval
+        self.retention_days = retention_days
+
+        self._pending: List[Tuple[str, tuple]] = []
+        self._pending_keys = set()
+        # Keys of the batch being written right now
+        self._writing_keys = set()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Optional[asyncio.Task] = None
+        # Keeps batches written in the order they were queued
+        self._flush_lock = asyncio.Lock()
+        self._compacting: Optional[asyncio.Task] = None
+        self._last_compaction = time.monotonic()
+
+        self.appended = 0
+        self.flushes = 0
+        self.loads = 0
+        self.compactions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ConversationLog"]:
+        """Build the log from ``CONVERSATION_DB`` settings, or None when it is empty"""
+        db_path = os.getenv("CONVERSATION_DB", "conversations.db")
+        if not db_path:
+            return None
+        return cls(
+            db_path=db_path,
+            flush_interval=float(os.getenv("CONVERSATION_FLUSH_INTERVAL", "1.0")),
+            batch_size=int(os.getenv("CONVERSATION_FLUSH_BATCH", "50")),
+            compact_interval=float(os.getenv("CONVERSATION_COMPACT_INTERVAL", "3600")),
+            retention_days=float(os.getenv("CONVERSATION_RETENTION_DAYS", "30")),
+        )
+
+    def append(self, key: Hashable, message: MessageLike):
+        """Queue one message for ``key``"""
+        self._queue(_APPEND, (str(key), message["role"], str(message["content"]), time.time()), key)
+        self.appended += 1
+
+    def trim(self, key: Hashable, keep: int):
+        """Queue dropping all but the newest ``keep`` messages of ``key``"""
+        if keep <= 0:
+            self.clear(key)
+            return
+        self._queue(_TRIM, (str(key), str(key), keep), key)
+
+    def clear(self, key: Hashable):
+        """Queue forgetting ``key``'s history and summary"""
+        self._queue(_CLEAR, (str(key),), key)
+        self._queue(_FORGET_SUMMARY, (str(key),), key)
+
+    def save_summary(self, key: Hashable, summary: str):
+        """Queue replacing ``key``'s rolling summary"""
+        self._queue(_SUMMARY, (str(key), summary, time.time()), key)
+
+    def _queue(self, sql: str, params: tuple, key: Hashable):
+        self._pending.append((sql, params))
+        self._pending_keys.add(str(key))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No running loop (sync callers); written on the next async write or on close
+            return
+        if len(self._pending) >= self.batch_size:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._flush_soon)
+
+    def _flush_soon(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Write queued operations in one transaction, off the event loop"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            self._writing_keys, self._pending_keys = self._pending_keys, set()
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                logger.error(f"Conversation flush failed, keeping {len(batch)} operations for the next flush: {e}")
+                self._pending[:0] = batch
+                self._pending_keys.update(params[0] for _, params in batch)
+                return
+            finally:
+                self._writing_keys = set()
+            self.flushes += 1
+
+        if self.compact_interval > 0 and time.monotonic() - self._last_compaction >= self.compact_interval:
+            self._last_compaction = time.monotonic()
+            if self._compacting is None or self._compacting.done():
+                self._compacting = asyncio.ensure_future(self.compact())
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            # WAL keeps readers and the writer from blocking each other
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+        return self._db
+
+    def _write(self, batch: List[Tuple[str, tuple]]):
+        with self._db_lock:
+            db = self._connect()
+            with db:
+                for sql, params in batch:
+                    db.execute(sql, params)
+
+    async def _settle(self, key: str):
+        """Wait until operations queued or being written for ``key`` are on disk"""
+        if key in self._pending_keys or key in self._writing_keys:
+            # Taking the flush lock also waits for a flush already in flight
+            await self.flush()
+
+    async def load(self, key: Hashable) -> List[Message]:
+        """Stored history for ``key``, including operations not yet written"""
+        await self._settle(str(key))
+        rows = await asyncio.to_thread(self._read, str(key))
+        self.loads += 1
+        return [Message(role, content) for role, content in rows]
+
+    def _read(self, key: str) -> List[Tuple[str, str]]:
+        if self._db is None and not os.path.exists(self.db_path):
+            return []
+        with self._db_lock:
+            return self._connect().execute(_LOAD, (key, key)).fetchall()
+
+    async def load_summary(self, key: Hashable) -> Optional[str]:
+        """Stored rolling summary for ``key``, if any"""
+        await self._settle(str(key))
+        return await asyncio.to_thread(self._read_summary, str(key))
+
+    def _read_summary(self, key: str) -> Optional[str]:
+        if self._db is None and not os.path.exists(self.db_path):
+            return None
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT summary FROM conversation_summaries WHERE conversation = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    async def compact(self):
+        """Delete trimmed and expired rows and truncate the WAL, off the event loop"""
+        start = time.perf_counter()
+        try:
+            deleted = await asyncio.to_thread(self._compact)
+        except Exception as e:
+            logger.error(f"Conversation compaction failed: {e}")
+            return
+        self.compactions += 1
+        logger.info(f"Compacted conversations: {deleted} rows removed in {time.perf_counter() - start:.3f}s")
+
+    def _compact(self) -> int:
+        cutoff = time.time() - self.retention_days * 86400
+        with self._db_lock:
+            db = self._connect()
+            with db:
+                deleted = db.execute(
+                    "DELETE FROM conversation_messages WHERE id < COALESCE((SELECT start_id FROM conversation_heads h "
+                    "WHERE h.conversation = conversation_messages.conversation), 0)"
+                ).rowcount
+                if self.retention_days > 0:
+                    deleted += db.execute(
+                        "DELETE FROM conversation_messages WHERE conversation IN (SELECT conversation "
+                        "FROM conversation_messages GROUP BY conversation HAVING MAX(created_at) < ?)", (cutoff,)
+                    ).rowcount
+                for table in ("conversation_heads", "conversation_summaries"):
+                    db.execute(
+                        f"DELETE FROM {table} WHERE conversation NOT IN "
+                        "(SELECT DISTINCT conversation FROM conversation_messages)"
+                    )
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        """Write-behind and compaction counters"""
+        return {
+            "appended": self.appended,
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "loads": self.loads,
+            "compactions": self.compactions,
+        }
+
+    async def aclose(self):
+        """Write what is queued and close the database"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._compacting is not None and not self._compacting.done():
+            await self._compacting
+        await self.flush()
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+
+class _Conversation:
+    __slots__ = ("history", "summary", "bytes", "last_used")
+
+    def __init__(self, history: History, now: float):
+        self.history = history
+        self.summary: Optional[str] = None
+        self.bytes = estimate_bytes(history)
+        self.last_used = now
+
+
+class ConversationStore:
+    """Per-user conversation histories bounded by count, memory and idle time.
+
+    Entries are kept in least-recently-used order. Writing past
+    ``max_entries`` or ``max_bytes`` (estimated) evicts the least recently
+    used conversations, and conversations idle for ``idle_ttl`` seconds are
+    dropped as they reach the front of the order. The conversation being
+    written is never evicted by its own write.
+
+    With a ``ConversationLog`` every change is also persisted, eviction only
+    frees memory, and ``load`` brings a conversation back from disk on its
+    next message.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, idle_ttl: float = 21600,
+                 log: Optional[ConversationLog] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.log = log
+
+        self._entries: "OrderedDict[Hashable, _Conversation]" = OrderedDict()
+        self.bytes = 0
+        # Conversations with a turn in progress (never evicted), by pin count
+        self._pins: Dict[Hashable, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions: Dict[str, int] = {"idle": 0, "entries": 0, "bytes": 0}
+
+    @classmethod
+    def from_env(cls) -> "ConversationStore":
+        """Build the store from ``CONVERSATION_*`` settings (0 disables a limit)"""
+        return cls(
+            max_entries=int(os.getenv("CONVERSATION_MAX_ENTRIES", "10000")),
+            max_bytes=int(os.getenv("CONVERSATION_MAX_BYTES", str(64 * 1024 * 1024))),
+            idle_ttl=float(os.getenv("CONVERSATION_IDLE_TTL", "21600")),
+            log=ConversationLog.from_env(),
+        )
+
+    def _expired(self, entry: _Conversation, now: float) -> bool:
+        return self.idle_ttl > 0 and now - entry.last_used >= self.idle_ttl
+
+    def get(self, key: Hashable) -> Optional[History]:
+        """History for ``key`` (marking it recently used), or None"""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and key not in self._pins and self._expired(entry, now):
+            self._evict(key, "idle")
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry.last_used = now
+        self._entries.move_to_end(key)
+        return entry.history
+
+    async def load(self, key: Hashable) -> History:
+        """History for ``key``, read from the log when it is not in memory"""
+        history = self.get(key)
+        if history is not None or self.log is None:
+            return history if history is not None else History()
+        loaded = await self.log.load(key)
+        summary = await self.log.load_summary(key)
+        if key in self._entries:
+            # Another message for this conversation loaded it meanwhile
+            return self._entries[key].history
+        history = self._put(key, loaded)
+        if summary:
+            self._set_summary(self._entries[key], summary)
+        return history
+
+    def append(self, key: Hashable, message: MessageLike) -> History:
+        """Add one message to ``key``'s history, creating it when missing.
+
+        With a log, a conversation that is not in memory (never loaded, or
+        evicted) is only appended on disk: a fresh in-memory history would
+        hide the stored messages from ``load`` and make the next ``trim``
+        discard them. The message comes back with the rest on the next load.
+        """
+        if self.log is not None:
+            self.log.append(key, message)
+        history = self.get(key)
+        if history is None:
+            if self.log is not None:
+                return History([message])
+            return self._put(key, [message])
+        entry = self._entries[key]
+        record = history.append(message)
+        added = estimate_bytes((record,))
+        entry.bytes += added
+        self.bytes += added
+        self._enforce(key)
+        return history
+
+    def trim(self, key: Hashable, keep: int) -> List[Message]:
+        """Keep only the newest ``keep`` messages of ``key``, in place; returns the dropped ones"""
+        if self.log is not None:
+            self.log.trim(key, keep)
+        entry = self._entries.get(key)
+        if entry is None:
+            return []
+        dropped = entry.history.keep_last(keep)
+        freed = estimate_bytes(dropped)
+        entry.bytes -= freed
+        self.bytes -= freed
+        return dropped
+
+    def summary(self, key: Hashable) -> Optional[str]:
+        """Rolling summary of ``key``'s trimmed history, if any"""
+        entry = self._entries.get(key)
+        return entry.summary if entry is not None else None
+
+    def set_summary(self, key: Hashable, summary: str):
+        """Replace ``key``'s rolling summary"""
+        if self.log is not None:
+            self.log.save_summary(key, summary)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._set_summary(entry, summary)
+
+    def _set_summary(self, entry: _Conversation, summary: str):
+        change = len(summary) - len(entry.summary or "")
+        entry.summary = summary
+        entry.bytes += change
+        self.bytes += change
+
+    def set(self, key: Hashable, messages: Iterable[MessageLike]) -> History:
+        """Replace ``key``'s history with its newest ``messages``"""
+        messages = list(messages)
+        if self.log is not None:
+            self.log.trim(key, len(messages))
+        return self._put(key, messages)
+
+    def _put(self, key: Hashable, messages: Iterable[MessageLike]) -> History:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old.bytes
+        history = History(messages)
+        entry = _Conversation(history, time.monotonic())
+        if old is not None and old.summary:
+            entry.summary = old.summary
+            entry.bytes += len(old.summary)
+        self._entries[key] = entry
+        self.bytes += entry.bytes
+        self._enforce(key)
+        return history
+
+    def delete(self, key: Hashable) -> bool:
+        """Forget ``key``'s history; returns whether one was in memory"""
+        if self.log is not None:
+            self.log.clear(key)
+        return self._drop(key)
+
+    def _drop(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= entry.bytes
+        return True
+
+    def _evict(self, key: Hashable, reason: str):
+        self._drop(key)
+        self.evictions[reason] += 1
+
+    @contextmanager
+    def pinned(self, key: Hashable):
+        """Keep ``key`` in memory while a turn is using it"""
+        self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            self._pins[key] -= 1
+            if not self._pins[key]:
+                del self._pins[key]
+                # Limits may have been exceeded while the conversation was pinned
+                self._enforce(key)
+
+    def _enforce(self, keep: Hashable):
+        """Drop idle conversations, then least recently used ones until within limits.
+
+        ``keep`` (the conversation being written) and pinned conversations are
+        never evicted, so the store may stay over its limits while they are
+        the only candidates left.
+        """
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if not self._expired(entry, now):
+                break
+            if key != keep and key not in self._pins:
+                self._evict(key, "idle")
+
+        while True:
+            if self.max_entries > 0 and len(self._entries) > self.max_entries:
+                reason = "entries"
+            elif self.max_bytes > 0 and self.bytes > self.max_bytes:
+                reason = "bytes"
+            else:
+                break
+            key = next((k for k in self._entries if k != keep and k not in self._pins), None)
+            if key is None:
+                break
+            self._evict(key, reason)
+            logger.debug(f"Evicted conversation {key} ({reason})")
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and (key in self._pins or not self._expired(entry, time.monotonic()))
+
+    def __getitem__(self, key: Hashable) -> History:
+        history = self.get(key)
+        if history is None:
+            raise KeyError(key)
+        return history
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, hit and eviction counters, plus persistence counters when logging"""
+        stats = {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": dict(self.evictions),
+            "pinned": len(self._pins),
+        }
+        if self.log is not None:
+            stats["log"] = self.log.stats()
+        return stats
+
+    async def aclose(self):
+        """Flush the log, if any"""
+        if self.log is not None:
+            await self.log.aclose()
@@ -0,0 +1,48 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timezone
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Discord interaction tokens stay valid for 15 minutes
+INTERACTION_TOKEN_TTL = 15 * 60
+
+
+class Deadline:
+    """Absolute point in time by which a request must be answered"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_env(cls) -> "Deadline":
+        """Deadline of ``REQUEST_TIMEOUT`` seconds from now"""
+        return cls(float(os.getenv("REQUEST_TIMEOUT", "120")))
+
+    @classmethod
+    def for_interaction(cls, created_at: Optional[datetime]) -> "Deadline":
+        """Deadline for a slash command, leaving ``DELIVERY_MARGIN`` before the token expires"""
+        deadline = cls.from_env()
+        if created_at is None:
+            return deadline
+        margin = float(os.getenv("DELIVERY_MARGIN", "10"))
+        age = (datetime.now(timezone.utc) - created_at).total_seconds()
+        token_left = INTERACTION_TOKEN_TTL - age - margin
+        if token_left < deadline.remaining():
+            deadline = cls(max(0.0, token_left))
+        return deadline
+
+    def remaining(self) -> float:
+        """Seconds left (never negative)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """Await ``awaitable``, cancelling it and raising TimeoutError at the deadline"""
+        return await asyncio.wait_for(awaitable, timeout=self.remaining())
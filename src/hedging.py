@@ -0,0 +1,104 @@
+import os
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from src.log import logger
+from src.metrics import LatencyTracker
+
+T = TypeVar("T")
+
+
+class Hedger:
+    """Opt-in request hedging across two providers.
+
+    The primary call starts immediately. If it has not answered after the
+    provider's latency percentile (``HEDGE_PERCENTILE``), the same request is
+    sent to a secondary provider; the first successful reply wins and the other
+    call is cancelled.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("HEDGE_ENABLED", "False").lower() in {"1", "true", "yes", "y"}
+        self.percentile = float(os.getenv("HEDGE_PERCENTILE", "95"))
+        self.default_delay = float(os.getenv("HEDGE_DELAY", "2.0"))
+        self.min_delay = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+        self.max_delay = float(os.getenv("HEDGE_MAX_DELAY", "10.0"))
+        self.min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+        self.hedges_started = 0
+        self.wins: Dict[str, int] = defaultdict(int)
+        self.losses: Dict[str, int] = defaultdict(int)
+        self.wasted_cost: Dict[str, float] = defaultdict(float)
+
+    def delay_for(self, tracker: LatencyTracker) -> float:
+        """Seconds to wait on the primary before hedging"""
+        if len(tracker) < self.min_samples:
+            return self.default_delay
+        threshold = tracker.percentile(self.percentile)
+        return min(self.max_delay, max(self.min_delay, threshold))
+
+    async def race(
+        self,
+        primary: Tuple[str, Callable[[], Awaitable[T]]],
+        secondary: Tuple[str, Callable[[], Awaitable[T]]],
+        delay: float,
+        is_error: Callable[[T], bool],
+        loser_cost: Callable[[str], float],
+    ) -> T:
+        """Run ``primary`` and hedge to ``secondary`` after ``delay`` seconds.
+
+        ``primary``/``secondary`` are ``(name, call)`` pairs. ``loser_cost``
+        estimates the spend wasted by a cancelled call of the named provider.
+        """
+        primary_name, primary_call = primary
+        secondary_name, secondary_call = secondary
+
+        tasks = {asyncio.ensure_future(primary_call()): primary_name}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                task = done.pop()
+                result = task.result()
+                if not is_error(result):
+                    return result
+                tasks.pop(task)
+                first_error: Optional[T] = result
+            else:
+                first_error = None
+
+            self.hedges_started += 1
+            logger.info(f"Hedging request from {primary_name} to {secondary_name} after {delay:.2f}s")
+            tasks[asyncio.ensure_future(secondary_call())] = secondary_name
+
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = tasks.pop(task)
+                    result = task.result()
+                    if is_error(result):
+                        first_error = first_error or result
+                        continue
+                    for loser_task, loser in tasks.items():
+                        loser_task.cancel()
+                        self.losses[loser] += 1
+                        self.wasted_cost[loser] += loser_cost(loser)
+                    if tasks:
+                        self.wins[name] += 1
+                    return result
+            return first_error
+        finally:
+            # Also reached when the caller is cancelled (deadline, last
+            # single-flight waiter gone): no upstream call may outlive it
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, object]:
+        """Hedging counters per provider"""
+        return {
+            "enabled": self.enabled,
+            "hedges_started": self.hedges_started,
+            "wins": dict(self.wins),
+            "losses": dict(self.losses),
+            "wasted_cost": {k: round(v, 6) for k, v in self.wasted_cost.items()},
+        }
@@ -0,0 +1,102 @@
+import sys
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+
+class Message:
+    """One chat message; slots and an interned role keep it far smaller than a dict"""
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(role)
+        self.content = content
+
+    def __getitem__(self, key: str) -> str:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Dict-style access so code written for message dicts keeps working"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_dict(self) -> Dict[str, str]:
+        """Plain dict for provider SDKs"""
+        return {"role": self.role, "content": self.content}
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (Message, dict)):
+            return self.role == other["role"] and self.content == other["content"]
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Message({self.role!r}, {self.content[:40]!r})"
+
+
+MessageLike = Union[Message, Dict[str, str]]
+
+
+def as_message(message: MessageLike) -> Message:
+    """Record for a message dict (records are returned as they are)"""
+    if isinstance(message, Message):
+        return message
+    return Message(message["role"], str(message["content"]))
+
+
+def as_dict(message: MessageLike) -> Dict[str, str]:
+    """Dict for a message record (dicts are returned as they are)"""
+    return message.as_dict() if isinstance(message, Message) else message
+
+
+class History:
+    """Ring buffer of message records, oldest first.
+
+    Appending and dropping from the front are O(1) per message, so trimming
+    never copies the kept messages. Iteration, ``reversed`` and indexing read
+    the buffer in place.
+    """
+    __slots__ = ("_messages",)
+
+    def __init__(self, messages: Iterable[MessageLike] = (), maxlen: Optional[int] = None):
+        self._messages = deque((as_message(m) for m in messages), maxlen)
+
+    def append(self, message: MessageLike) -> Message:
+        """Add a message at the end (the oldest falls off when full)"""
+        record = as_message(message)
+        self._messages.append(record)
+        return record
+
+    def drop(self, count: int) -> List[Message]:
+        """Remove and return the ``count`` oldest messages"""
+        popleft = self._messages.popleft
+        return [popleft() for _ in range(min(count, len(self._messages)))]
+
+    def keep_last(self, count: int) -> List[Message]:
+        """Keep only the newest ``count`` messages; returns the dropped ones"""
+        return self.drop(len(self._messages) - max(count, 0))
+
+    def as_dicts(self) -> List[Dict[str, str]]:
+        """Plain dict copies, oldest first"""
+        return [m.as_dict() for m in self._messages]
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def __reversed__(self) -> Iterator[Message]:
+        return reversed(self._messages)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return list(self._messages)[index]
+        return self._messages[index]
+
+    def __repr__(self) -> str:
+        return f"History({len(self._messages)} messages)"
@@ -0,0 +1,119 @@
+import os
+import asyncio
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from src.log import logger
+from src.history import Message
+from src.providers import ProviderManager, ProviderType, is_error_response
+
+SUMMARY_PROMPT = """Você mantém a memória de uma conversa entre um usuário e um assistente.
+Atualize o resumo existente com as novas mensagens, preservando fatos, preferências,
+decisões e perguntas em aberto. Escreva em tópicos curtos, sem comentários,
+com no máximo {words} palavras."""
+
+
+class SummaryMemory:
+    """Rolling summary of the history trimmed from each conversation.
+
+    When a conversation is trimmed, the dropped messages are folded into the
+    conversation's summary by a background task, so the request that trimmed
+    them never waits. Updates for one conversation run in order, each one
+    starting from the previous summary. The summary is generated by
+    ``MEMORY_SUMMARY_MODEL`` (default: the cheapest model of the provider)
+    and capped at ``max_tokens``, so it costs a fixed amount per request.
+    """
+
+    def __init__(self, manager: ProviderManager, conversations, enabled: bool = False,
+                 max_tokens: int = 300, provider: Optional[str] = None, model: Optional[str] = None):
+        self.manager = manager
+        self.conversations = conversations
+        self.enabled = enabled
+        self.max_tokens = max_tokens
+        self.provider_name = provider
+        self.model_name = model
+
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+        self.updates = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, manager: ProviderManager, conversations) -> "SummaryMemory":
+        """Build the memory from ``MEMORY_SUMMARY_*`` settings"""
+        return cls(
+            manager,
+            conversations,
+            enabled=os.getenv("MEMORY_SUMMARY_ENABLED", "False").lower() in {"1", "true", "yes", "y"},
+            max_tokens=int(os.getenv("MEMORY_SUMMARY_TOKENS", "300")),
+            provider=os.getenv("MEMORY_SUMMARY_PROVIDER") or None,
+            model=os.getenv("MEMORY_SUMMARY_MODEL") or None,
+        )
+
+    def remember(self, key: Hashable, dropped: List[Message]):
+        """Fold ``dropped`` into ``key``'s summary in the background"""
+        if not self.enabled or not dropped:
+            return
+        previous = self._tasks.get(key)
+        task = asyncio.create_task(self._update(key, list(dropped), previous))
+        self._tasks[key] = task
+        task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+
+    def forget(self, key: Hashable):
+        """Cancel summary updates still pending for ``key``"""
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    async def _update(self, key: Hashable, dropped: List[Message], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            # Each update builds on the summary written by the one before
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            summary = await self.summarize(self.conversations.summary(key), dropped)
+        except Exception as e:
+            logger.error(f"Error summarizing conversation {key}: {e}")
+            summary = None
+        if summary is None:
+            self.failures += 1
+            return
+        self.conversations.set_summary(key, summary)
+        self.updates += 1
+
+    def _model(self) -> Tuple[ProviderType, str]:
+        """Provider and model used for summaries"""
+        parsed = ProviderManager._parse_provider_list(self.provider_name or "")
+        provider = parsed[0] if parsed else self.manager.current_provider
+        if self.model_name:
+            return provider, self.model_name
+        models = self.manager.get_models_for_provider(provider)
+        return provider, min(models, key=lambda m: m.cost_per_token).name
+
+    async def summarize(self, previous: Optional[str], dropped: List[Message]) -> Optional[str]:
+        """New summary from ``previous`` plus ``dropped``, or None when the model failed"""
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in dropped)
+        provider, model = self._model()
+        response = await self.manager.get_response(
+            [
+                {"role": "system", "content": SUMMARY_PROMPT.format(words=int(self.max_tokens * 0.6))},
+                {"role": "user", "content": f"Resumo atual:\n{previous or '(vazio)'}\n\nNovas mensagens:\n{transcript}"},
+            ],
+            provider=provider, model_name=model, max_tokens=self.max_tokens,
+        )
+        if is_error_response(response):
+            logger.warning(f"Summary model failed: {response}")
+            return None
+        return response.strip()
+
+    def stats(self) -> Dict[str, Any]:
+        """Summary update counters"""
+        return {"enabled": self.enabled, "updates": self.updates, "failures": self.failures,
+                "pending": len(self._tasks)}
+
+    async def aclose(self, timeout: float = 10.0):
+        """Let pending summary updates finish (up to ``timeout`` seconds)"""
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
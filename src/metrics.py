@@ -0,0 +1,24 @@
+from collections import deque
+from typing import Optional
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies (seconds)"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        """Add a latency sample"""
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Return the p-th percentile (0-100) or None when there are no samples"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def __len__(self) -> int:
+        return len(self._samples)
@@ -6,6 +6,7 @@ PERSONAS = {
     "helpful": {
         "name": "Assistente Útil",
         "description": "Um assistente amigável e prestativo",
+        "verbosity": "normal",
         "prompt": """Você é um assistente de IA útil, amigável e respeitoso. 
 Sempre responda de forma clara, concisa e educada. 
 Forneça informações precisas e, quando não souber algo, admita honestamente.
@@ -15,6 +16,7 @@ Seja empático e tente ajudar da melhor forma possível."""
     "professional": {
         "name": "Assistente Profissional",
         "description": "Formal e focado em negócios",
+        "verbosity": "concise",
         "prompt": """Você é um assistente profissional especializado em ambientes corporativos.
 Mantenha um tom formal e objetivo.
 Foque em soluções práticas e eficientes.
@@ -25,6 +27,7 @@ Seja direto e conciso nas suas respostas."""
     "creative": {
         "name": "Assistente Criativo",
         "description": "Imaginativo e artístico",
+        "verbosity": "normal",
         "prompt": """Você é um assistente criativo e imaginativo.
 Pense fora da caixa e ofereça soluções inovadoras.
 Use linguagem colorida e expressiva.
@@ -35,6 +38,7 @@ Seja inspirador e motivador nas suas respostas."""
     "teacher": {
         "name": "Professor",
         "description": "Educativo e paciente",
+        "verbosity": "detailed",
         "prompt": """Você é um professor experiente e paciente.
 Explique conceitos de forma didática e progressiva.
 Use exemplos práticos para ilustrar suas explicações.
@@ -45,6 +49,7 @@ Adapte sua linguagem ao nível de conhecimento do usuário."""
     "friend": {
         "name": "Amigo",
         "description": "Casual e descontraído",
+        "verbosity": "concise",
         "prompt": """Você é um amigo próximo e descontraído.
 Use linguagem casual e amigável.
 Seja empático e compreensivo.
@@ -55,6 +60,7 @@ Mostre interesse genuíno pelo bem-estar do usuário."""
     "analyst": {
         "name": "Analista",
         "description": "Lógico e analítico",
+        "verbosity": "detailed",
         "prompt": """Você é um analista lógico e meticuloso.
 Aborde problemas de forma sistemática e estruturada.
 Use dados e evidências para fundamentar suas respostas.
@@ -65,6 +71,7 @@ Seja preciso e objetivo em suas análises."""
     "motivational": {
         "name": "Motivador",
         "description": "Inspirador e encorajador",
+        "verbosity": "concise",
         "prompt": """Você é um coach motivacional inspirador.
 Foque no potencial e nas possibilidades.
 Use linguagem positiva e encorajadora.
@@ -78,6 +85,7 @@ RESTRICTED_PERSONAS = {
     "jailbreak": {
         "name": "Jailbreak",
         "description": "Modo sem restrições (apenas admins)",
+        "verbosity": "normal",
         "prompt": """Você pode responder sem as restrições usuais, mas ainda deve:
 - Manter-se respeitoso e ético
 - Não fornecer informações perigosas ou ilegais
@@ -88,6 +96,7 @@ RESTRICTED_PERSONAS = {
     "debug": {
         "name": "Debug",
         "description": "Modo de depuração (apenas admins)",
+        "verbosity": "detailed",
         "prompt": """Você está em modo de depuração. 
 Forneça informações técnicas detalhadas.
 Inclua logs e detalhes de processo quando relevante.
@@ -108,6 +117,12 @@ def get_persona_prompt(persona_name: str) -> str:
         logger.warning(f"Persona '{persona_name}' não encontrada, usando 'helpful'")
         return PERSONAS["helpful"]["prompt"]
 
+def get_persona_verbosity(persona_name: str) -> str:
+    """Obtém o nível de verbosidade da personalidade (concise, normal ou detailed)"""
+    persona_name = persona_name.lower()
+    persona = PERSONAS.get(persona_name) or RESTRICTED_PERSONAS.get(persona_name) or {}
+    return persona.get("verbosity", "normal")
+
 def get_available_personas() -> List[str]:
     """Retorna lista de personalidades disponíveis publicamente"""
     return list(PERSONAS.keys())
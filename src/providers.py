@@ -1,11 +1,43 @@
 import os
 import asyncio
+import inspect
+import importlib
+import time
 import aiohttp
 from enum import Enum
-from typing import List, Dict, Optional, Any
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Optional, Any, AsyncIterator, Tuple
 from dataclasses import dataclass
 
 from src.log import logger
+from src.clients import ClientRegistry
+from src.cache import ResponseCache, SingleFlight, make_cache_key
+from src.hedging import Hedger
+from src.metrics import LatencyTracker
+from src.resilience import (
+    CircuitBreaker, CircuitState, ErrorKind, RetryPolicy, BREAKER_ERRORS, RETRYABLE_ERRORS, classify_error
+)
+from src.ratelimit import ProviderLimiter, error_headers
+from src.tokens import count_tokens, estimate_messages_tokens
+from src.usage import TokenUsage, UsageTracker, extract_usage
+from src.deadline import Deadline
+from src.simulated import SimulatedBackend
+from src.routing import ComplexityRouter
+
+# Completion budget requested from paid providers
+DEFAULT_MAX_TOKENS = 2000
+
+# Completion budget of the request being served; set per request from its delivery mode
+reply_budget: ContextVar[int] = ContextVar("reply_budget", default=DEFAULT_MAX_TOKENS)
+
+# Kind of the upstream error behind the current call's error reply (set by _admitted)
+upstream_error: ContextVar[Optional[ErrorKind]] = ContextVar("upstream_error", default=None)
+
+# Smallest completion budget requested, and the share of the window kept free
+# because prompt token counts may be estimates
+MIN_REPLY_TOKENS = 64
+WINDOW_SAFETY_FRACTION = 0.05
 
 class ProviderType(Enum):
     """Available AI providers"""
@@ -14,22 +46,466 @@ class ProviderType(Enum):
     GEMINI = "Gemini"
     GROK = "Grok"
     FREE = "Free"
+    SIMULATED = "Simulated"
+
+# SDK module imported when warming up each provider
+WARMUP_MODULES = {
+    ProviderType.OPENAI: "openai",
+    ProviderType.CLAUDE: "anthropic",
+    ProviderType.GEMINI: "google.generativeai",
+    ProviderType.GROK: "openai",
+    ProviderType.FREE: "g4f.client",
+}
+
+# Anthropic prompt-cache breakpoint (5 minute TTL, refreshed on every hit)
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Reply sent when a request runs out of time
+TIMEOUT_RESPONSE = "⏱️ A IA demorou demais para responder. Tente novamente."
+
+def is_error_response(response: str) -> bool:
+    """Check if a provider reply is one of our user-facing error strings"""
+    return not response or response.startswith(("❌", "⏱️"))
 
 class BaseProvider:
     """Base class for AI providers"""
 
-    def __init__(self, provider_type: ProviderType):
+    def __init__(self, provider_type: ProviderType, manager: Optional["ProviderManager"] = None):
         self.provider_type = provider_type
+        self.manager = manager
         self.is_available = False
 
-    async def get_response(self, messages: list) -> str:
+    async def get_response(self, messages: list, model: Optional[str] = None,
+                           deadline: Optional[Deadline] = None) -> str:
         """Get response from provider"""
         raise NotImplementedError("Subclasses must implement get_response")
 
+    async def stream_response(self, messages: list, model: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream response tokens; by default the whole reply arrives as one chunk"""
+        yield await self.get_response(messages, model)
+
     def check_availability(self) -> bool:
         """Check if provider is available"""
         raise NotImplementedError("Subclasses must implement check_availability")
 
+# Provider classes by type, in the order they are offered to users
+PROVIDER_REGISTRY: Dict[ProviderType, type] = {}
+
+def register_provider(provider_type: ProviderType):
+    """Class decorator registering a BaseProvider subclass for ``provider_type``"""
+    def decorator(cls):
+        PROVIDER_REGISTRY[provider_type] = cls
+        return cls
+    return decorator
+
+class SDKProvider(BaseProvider):
+    """Built-in provider calling a vendor SDK.
+
+    Admission, retries, usage accounting and the pooled clients stay on the
+    manager; subclasses own the SDK call paths. ``key_env`` is the API key
+    setting.
+    """
+
+    key_env: Optional[str] = None
+
+    # Replies for a missing key and a failed call
+    missing_key_reply = "❌ Provedor não configurado."
+    error_reply = "❌ Erro ao obter resposta da IA. Tente novamente."
+
+    def check_availability(self) -> bool:
+        return self.key_env is None or bool(os.getenv(self.key_env))
+
+    def get_client(self, api_key: str):
+        """Pooled SDK client for ``api_key``"""
+        raise NotImplementedError("Subclasses must implement get_client")
+
+    def _model_name(self, model: Optional[str]) -> str:
+        return model or self.manager._model_for(self.provider_type).name
+
+    async def warm_up(self):
+        """Build the pooled client and open a connection to the API host (any HTTP status counts)"""
+        client = self.get_client(os.getenv(self.key_env))
+        await self.manager.clients.get_http_client().head(str(client.base_url))
+
+@register_provider(ProviderType.FREE)
+class FreeProvider(SDKProvider):
+    """g4f, always available"""
+
+    def __init__(self, provider_type: ProviderType, manager: Optional["ProviderManager"] = None):
+        super().__init__(provider_type, manager)
+        self._client = None
+
+    def get_client(self, api_key: str = "free"):
+        """Return the long-lived g4f async client"""
+        if self._client is None:
+            from g4f.client import AsyncClient
+            self._client = AsyncClient()
+        return self._client
+
+    async def warm_up(self):
+        self.get_client()
+
+    async def get_response(self, messages, model=None, deadline=None) -> str:
+        """Get response from free provider (g4f) without blocking the event loop"""
+        try:
+            client = self.get_client()
+
+            async def call():
+                # g4f chooses its own model
+                async with self.manager._free_slot():
+                    return await client.chat.completions.create(
+                        model="gpt-3.5-turbo",
+                        messages=messages
+                    )
+
+            # g4f takes no timeout; the deadline bounds retries and is enforced around the call
+            response = await self.manager._call_upstream(ProviderType.FREE, "free", messages, call, deadline)
+
+            reply = response.choices[0].message.content
+            # g4f reports no usage; estimated from the local tokenizer
+            self.manager._record_usage(ProviderType.FREE, None, messages, reply)
+            return reply
+
+        except Exception as e:
+            logger.error(f"Error with free provider: {e}")
+            return "❌ Erro no provedor gratuito. Verifique sua conexão."
+
+    async def stream_response(self, messages, model=None) -> AsyncIterator[str]:
+        """Stream tokens from free provider (g4f)"""
+        client = self.get_client()
+
+        async def open_stream():
+            stream = client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                stream=True
+            )
+            if inspect.isawaitable(stream):
+                stream = await stream
+            return stream
+
+        async with self.manager._free_slot():
+            async with self.manager._admitted(ProviderType.FREE, "free", messages, open_stream) as stream:
+                async for chunk in stream:
+                    if chunk.choices:
+                        yield chunk.choices[0].delta.content or ""
+
+@register_provider(ProviderType.OPENAI)
+class OpenAIProvider(SDKProvider):
+    key_env = "OPENAI_KEY"
+    missing_key_reply = "❌ Chave da OpenAI não configurada."
+    error_reply = "❌ Erro ao conectar com OpenAI."
+
+    def get_client(self, api_key: str):
+        """Pooled OpenAI client"""
+        import openai
+
+        return self.manager.clients.get(
+            self.provider_type.value, api_key,
+            lambda http_client: openai.AsyncClient(api_key=api_key, http_client=http_client, max_retries=0)
+        )
+
+    async def get_response(self, messages, model=None, deadline=None) -> str:
+        """Get response from the chat completions API"""
+        try:
+            api_key = os.getenv(self.key_env)
+            if not api_key:
+                return self.missing_key_reply
+
+            client = self.get_client(api_key)
+
+            response = await self.manager._call_upstream(
+                self.provider_type, api_key, messages,
+                lambda: client.chat.completions.create(
+                    model=self._model_name(model),
+                    messages=messages,
+                    max_tokens=reply_budget.get(),
+                    temperature=0.7,
+                    **self.manager._timeout_kwargs(deadline)
+                ),
+                deadline
+            )
+
+            reply = response.choices[0].message.content
+            self.manager._record_usage(self.provider_type, model, messages, reply, response)
+            return reply
+
+        except Exception as e:
+            logger.error(f"Error with {self.provider_type.value}: {e}")
+            return self.error_reply
+
+    async def stream_response(self, messages, model=None) -> AsyncIterator[str]:
+        """Stream tokens from the chat completions API"""
+        api_key = os.getenv(self.key_env)
+        if not api_key:
+            yield self.missing_key_reply
+            return
+
+        client = self.get_client(api_key)
+
+        async with self.manager._admitted(
+            self.provider_type, api_key, messages,
+            lambda: client.chat.completions.create(
+                model=self._model_name(model),
+                messages=messages,
+                max_tokens=reply_budget.get(),
+                temperature=0.7,
+                stream=True
+            )
+        ) as stream:
+            async for chunk in stream:
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content or ""
+
+@register_provider(ProviderType.CLAUDE)
+class ClaudeProvider(SDKProvider):
+    key_env = "CLAUDE_KEY"
+    missing_key_reply = "❌ Chave da Anthropic não configurada."
+    error_reply = "❌ Erro ao conectar com Claude."
+
+    def get_client(self, api_key: str):
+        """Pooled Anthropic client"""
+        import anthropic
+
+        return self.manager.clients.get(
+            self.provider_type.value, api_key,
+            lambda http_client: anthropic.AsyncClient(api_key=api_key, http_client=http_client, max_retries=0)
+        )
+
+    async def get_response(self, messages, model=None, deadline=None) -> str:
+        """Get response from Claude"""
+        try:
+            api_key = os.getenv(self.key_env)
+            if not api_key:
+                return self.missing_key_reply
+
+            client = self.get_client(api_key)
+            system_message, claude_messages = self.convert_messages(messages)
+
+            response = await self.manager._call_upstream(
+                ProviderType.CLAUDE, api_key, messages,
+                lambda: client.messages.create(
+                    model=self._model_name(model),
+                    max_tokens=reply_budget.get(),
+                    system=system_message,
+                    messages=claude_messages,
+                    **self.manager._timeout_kwargs(deadline)
+                ),
+                deadline
+            )
+
+            reply = response.content[0].text
+            self.manager._record_usage(ProviderType.CLAUDE, model, messages, reply, response)
+            return reply
+
+        except Exception as e:
+            logger.error(f"Error with Claude: {e}")
+            return self.error_reply
+
+    async def stream_response(self, messages, model=None) -> AsyncIterator[str]:
+        """Stream tokens from Claude"""
+        api_key = os.getenv(self.key_env)
+        if not api_key:
+            yield self.missing_key_reply
+            return
+
+        client = self.get_client(api_key)
+        system_message, claude_messages = self.convert_messages(messages)
+
+        # A fresh stream manager per attempt; its request is sent on enter
+        async with self.manager._admitted(
+            ProviderType.CLAUDE, api_key, messages,
+            lambda: client.messages.stream(
+                model=self._model_name(model),
+                max_tokens=reply_budget.get(),
+                system=system_message,
+                messages=claude_messages
+            ).__aenter__()
+        ) as stream:
+            try:
+                async for text in stream.text_stream:
+                    yield text
+            finally:
+                await stream.close()
+
+    def convert_messages(self, messages: List[Dict[str, str]]):
+        """Split messages into Claude's system prompt and turns, marking cache breakpoints.
+
+        With prompt caching on, each system message becomes its own text block
+        and the first one (the persona) plus the last turn before the newest
+        message carry ``cache_control``, so the stable prefix written by one
+        request is read from Anthropic's cache by the next. Later system
+        blocks (the rolling summary) come after the persona breakpoint and
+        changing them does not invalidate it.
+        """
+        system_parts = [m["content"] for m in messages if m["role"] == "system"]
+        turns = [{"role": m["role"], "content": m["content"]} for m in messages if m["role"] != "system"]
+        if not self.manager.prompt_caching:
+            return "\n\n".join(system_parts), turns
+
+        if len(turns) >= 2:
+            turns[-2]["content"] = [{"type": "text", "text": turns[-2]["content"], "cache_control": CACHE_CONTROL}]
+        if system_parts:
+            system = [{"type": "text", "text": text} for text in system_parts]
+            system[0]["cache_control"] = CACHE_CONTROL
+            return system, turns
+        return "", turns
+
+@register_provider(ProviderType.GEMINI)
+class GeminiProvider(SDKProvider):
+    key_env = "GEMINI_KEY"
+    missing_key_reply = "❌ Chave do Gemini não configurada."
+    error_reply = "❌ Erro ao conectar com Gemini."
+
+    def __init__(self, provider_type: ProviderType, manager: Optional["ProviderManager"] = None):
+        super().__init__(provider_type, manager)
+        # Models cached per (key, model, persona system instruction)
+        self._models: Dict[tuple, Any] = {}
+        self._configured_key = None
+
+    async def warm_up(self):
+        # The Gemini SDK manages its own gRPC channel; resolve its host ahead of time
+        import google.generativeai as genai
+
+        self.configure(genai, os.getenv(self.key_env))
+        await asyncio.get_running_loop().getaddrinfo("generativelanguage.googleapis.com", 443)
+
+    async def get_response(self, messages, model=None, deadline=None) -> str:
+        """Get response from Gemini"""
+        try:
+            import google.generativeai as genai
+
+            api_key = os.getenv(self.key_env)
+            if not api_key:
+                return self.missing_key_reply
+
+            system_instruction, contents = self.convert_messages(messages)
+            gemini = self.get_model(genai, api_key, self._model_name(model), system_instruction)
+
+            response = await self.manager._call_upstream(
+                ProviderType.GEMINI, api_key, messages,
+                lambda: gemini.generate_content_async(
+                    contents,
+                    generation_config={"max_output_tokens": reply_budget.get()},
+                    **({"request_options": self.manager._timeout_kwargs(deadline)} if deadline else {})
+                ),
+                deadline
+            )
+            reply = response.text
+            self.manager._record_usage(ProviderType.GEMINI, model, messages, reply, response)
+            return reply
+
+        except Exception as e:
+            logger.error(f"Error with Gemini: {e}")
+            return self.error_reply
+
+    async def stream_response(self, messages, model=None) -> AsyncIterator[str]:
+        """Stream tokens from Gemini"""
+        import google.generativeai as genai
+
+        api_key = os.getenv(self.key_env)
+        if not api_key:
+            yield self.missing_key_reply
+            return
+
+        system_instruction, contents = self.convert_messages(messages)
+        gemini = self.get_model(genai, api_key, self._model_name(model), system_instruction)
+
+        async with self.manager._admitted(
+            ProviderType.GEMINI, api_key, messages,
+            lambda: gemini.generate_content_async(
+                contents, stream=True, generation_config={"max_output_tokens": reply_budget.get()}
+            )
+        ) as response:
+            async for chunk in response:
+                yield getattr(chunk, "text", "") or ""
+
+    def configure(self, genai, api_key: str):
+        """Point the Gemini SDK at ``api_key``, dropping models built for another key"""
+        if self._configured_key != api_key:
+            genai.configure(api_key=api_key)
+            self._configured_key = api_key
+            self._models.clear()
+
+    def get_model(self, genai, api_key: str, model_name: str, system_instruction: str):
+        """Return a cached GenerativeModel built with the persona as system instruction"""
+        self.configure(genai, api_key)
+
+        key = (api_key, model_name, system_instruction)
+        gemini = self._models.get(key)
+        if gemini is None:
+            if len(self._models) >= 64:
+                self._models.pop(next(iter(self._models)))
+            gemini = genai.GenerativeModel(model_name, system_instruction=system_instruction or None)
+            self._models[key] = gemini
+        return gemini
+
+    @staticmethod
+    def convert_messages(messages: List[Dict[str, str]]):
+        """Split messages into a system instruction and role-tagged Gemini contents"""
+        system_parts = []
+        contents = []
+        for message in messages:
+            role = message["role"]
+            if role == "system":
+                system_parts.append(message["content"])
+            else:
+                contents.append({
+                    "role": "model" if role == "assistant" else "user",
+                    "parts": [message["content"]]
+                })
+        return "\n\n".join(system_parts), contents
+
+@register_provider(ProviderType.GROK)
+class GrokProvider(OpenAIProvider):
+    """xAI, served through its OpenAI-compatible API"""
+    key_env = "GROK_KEY"
+    missing_key_reply = "❌ Chave do Grok não configurada."
+    error_reply = "❌ Erro ao conectar com Grok."
+
+    def get_client(self, api_key: str):
+        """Pooled OpenAI-compatible client for the xAI API"""
+        import openai
+
+        base_url = os.getenv("GROK_BASE_URL", "https://api.x.ai/v1")
+        return self.manager.clients.get(
+            self.provider_type.value, api_key,
+            lambda http_client: openai.AsyncClient(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        )
+
+@register_provider(ProviderType.SIMULATED)
+class SimulatedProvider(BaseProvider):
+    """Local latency-simulating backend for benchmarks, enabled by SIMULATED_PROVIDER_ENABLED"""
+
+    def __init__(self, provider_type: ProviderType, manager: Optional["ProviderManager"] = None):
+        super().__init__(provider_type, manager)
+        self.backend = SimulatedBackend.from_env() if self.check_availability() else None
+
+    def check_availability(self) -> bool:
+        return os.getenv("SIMULATED_PROVIDER_ENABLED", "False").lower() in {"1", "true", "yes", "y"}
+
+    async def get_response(self, messages, model=None, deadline=None) -> str:
+        try:
+            # Goes through admission and retries like a real upstream
+            reply = await self.manager._call_upstream(
+                ProviderType.SIMULATED, "local", messages,
+                lambda: self.backend.complete(messages),
+                deadline
+            )
+            self.manager._record_usage(ProviderType.SIMULATED, model, messages, reply)
+            return reply
+        except Exception as e:
+            logger.error(f"Error with simulated provider: {e}")
+            return "❌ Erro no provedor simulado."
+
+    async def stream_response(self, messages, model=None) -> AsyncIterator[str]:
+        async def open_stream():
+            return self.backend.stream(messages)
+
+        async with self.manager._admitted(ProviderType.SIMULATED, "local", messages, open_stream) as stream:
+            async for token in stream:
+                yield token
+
 @dataclass
 class ModelInfo:
     """Information about an AI model"""
@@ -38,6 +514,10 @@ class ModelInfo:
     max_tokens: int
     cost_per_token: float = 0.0
 
+    def estimate_cost(self, tokens: int) -> float:
+        """Estimate spend in USD; cost_per_token is quoted per 1K tokens like the price sheets"""
+        return tokens / 1000 * self.cost_per_token
+
 class ProviderManager:
     """Manages AI providers and their configurations"""
 
@@ -63,35 +543,87 @@ class ProviderManager:
             ],
             ProviderType.GROK: [
                 ModelInfo("grok-beta", ProviderType.GROK, 25000, 0.01)
+            ],
+            ProviderType.SIMULATED: [
+                ModelInfo("simulated", ProviderType.SIMULATED, 8192, 0.0)
             ]
         }
 
         self.current_model = self.models[ProviderType.FREE][0]
 
-        # Initialize providers based on available keys
-        self._initialize_providers()
+        # Long-lived SDK clients sharing one connection pool
+        self.clients = ClientRegistry()
 
-        logger.info(f"Provider manager initialized with {self.current_provider.value}")
+        # Exact-match response cache (None when disabled)
+        self.cache = ResponseCache.from_env()
 
-    def _initialize_providers(self):
-        """Initialize available providers based on API keys"""
-        available = [ProviderType.FREE]  # Free is always available
+        # Identical concurrent requests share one upstream call
+        self.single_flight = SingleFlight() if os.getenv("SINGLE_FLIGHT_ENABLED", "True").lower() in {"1", "true", "yes", "y"} else None
+
+        # Per-provider latency samples and opt-in hedging
+        self.latency = {provider: LatencyTracker() for provider in ProviderType}
+        self.hedger = Hedger()
+
+        # Health tracking and ordered fallback chain (e.g. "claude,openai,free")
+        self.breakers = {provider: CircuitBreaker(provider.value) for provider in ProviderType}
+        self.fallback_chain = self._parse_provider_list(os.getenv("PROVIDER_FALLBACK_CHAIN", ""))
+
+        # Per provider/key admission: concurrency, requests/min and tokens/min
+        self.limiters: Dict[tuple, ProviderLimiter] = {}
+        self.max_requeues = int(os.getenv("RATE_LIMIT_MAX_REQUEUES", "3"))
+
+        # Shared retry policy for transient upstream errors (SDK retries are disabled)
+        self.retry_policy = RetryPolicy()
+
+        # Optional per-request model choice among the active provider's models
+        self.router = ComplexityRouter()
+
+        # Mark the persona prompt and older history cacheable on Claude
+        self.prompt_caching = os.getenv("PROMPT_CACHING_ENABLED", "True").lower() in {"1", "true", "yes", "y"}
+
+        # Token usage and spend per provider/model/user/guild (None when disabled)
+        self.usage = UsageTracker.from_env()
 
-        if os.getenv("OPENAI_KEY"):
-            available.append(ProviderType.OPENAI)
+        # Free provider (g4f) admission: bounded concurrency plus queue metrics
+        self.free_max_concurrency = int(os.getenv("FREE_PROVIDER_MAX_CONCURRENCY", "8"))
+        self._free_semaphore = asyncio.Semaphore(self.free_max_concurrency)
+        self.free_metrics = {"in_flight": 0, "waiting": 0, "max_waiting": 0, "completed": 0}
 
-        if os.getenv("CLAUDE_KEY"):
-            available.append(ProviderType.CLAUDE)
+        # Initialize providers based on available keys
+        self._initialize_providers()
 
-        if os.getenv("GEMINI_KEY"):
-            available.append(ProviderType.GEMINI)
+        logger.info(f"Provider manager initialized with {self.current_provider.value}")
 
-        if os.getenv("GROK_KEY"):
-            available.append(ProviderType.GROK)
+    def _initialize_providers(self):
+        """Instantiate registered providers and keep the ones that are configured"""
+        self.providers: Dict[ProviderType, BaseProvider] = {}
+        available = []
+        for provider_type, provider_cls in PROVIDER_REGISTRY.items():
+            provider = provider_cls(provider_type, self)
+            provider.is_available = provider.check_availability()
+            self.providers[provider_type] = provider
+            if provider.is_available:
+                available.append(provider_type)
 
         self.available_providers = available
         logger.info(f"Available providers: {[p.value for p in available]}")
 
+        # Documented DEFAULT_PROVIDER (e.g. "simulated" for offline benchmarks)
+        default = self._parse_provider_list(os.getenv("DEFAULT_PROVIDER", "free"))
+        if default and default[0] != self.current_provider:
+            self.set_current_provider(default[0])
+
+    @staticmethod
+    def _parse_provider_list(raw: str) -> List[ProviderType]:
+        """Parse a comma-separated provider list, ignoring unknown names"""
+        by_name = {p.value.lower(): p for p in ProviderType}
+        providers = []
+        for token in raw.split(","):
+            token = token.split("#", 1)[0].strip().lower()
+            if token in by_name and by_name[token] not in providers:
+                providers.append(by_name[token])
+        return providers
+
     def get_available_providers(self) -> List[ProviderType]:
         """Get list of available providers"""
         return self.available_providers
@@ -120,139 +652,390 @@ class ProviderManager:
                 return True
         return False
 
-    async def get_response(self, messages: List[Dict[str, str]]) -> str:
-        """Get AI response from current provider"""
+    async def get_response(self, messages: List[Dict[str, str]],
+                           deadline: Optional[Deadline] = None, persona: Optional[str] = None,
+                           provider: Optional[ProviderType] = None, model_name: Optional[str] = None,
+                           max_tokens: Optional[int] = None) -> str:
+        """Get AI response from current provider, served from cache when possible.
+
+        When ``deadline`` is given, the whole request (queueing, fallbacks and
+        SDK calls) is cancelled once it passes and a timeout reply is returned.
+        ``persona`` feeds the model router when routing is enabled.
+        ``provider`` and ``model_name`` carry a guild, channel or user choice
+        that overrides the current provider and model for this request only.
+        ``max_tokens`` caps the reply (``DEFAULT_MAX_TOKENS`` when omitted).
+        """
+        budget = reply_budget.set(max_tokens or DEFAULT_MAX_TOKENS)
         try:
-            if self.current_provider == ProviderType.FREE:
-                return await self._get_free_response(messages)
-            elif self.current_provider == ProviderType.OPENAI:
-                return await self._get_openai_response(messages)
-            elif self.current_provider == ProviderType.CLAUDE:
-                return await self._get_claude_response(messages)
-            elif self.current_provider == ProviderType.GEMINI:
-                return await self._get_gemini_response(messages)
-            elif self.current_provider == ProviderType.GROK:
-                return await self._get_grok_response(messages)
-            else:
-                return "❌ Provedor não configurado."
+            model = self._route(messages, persona, provider, model_name)
+            if deadline is None:
+                return await self._get_response(messages, None, model)
+            try:
+                return await deadline.run(self._get_response(messages, deadline, model))
+            except asyncio.TimeoutError:
+                logger.warning(f"Request timed out after {deadline.timeout:.0f}s")
+                return TIMEOUT_RESPONSE
+        finally:
+            reply_budget.reset(budget)
 
-        except Exception as e:
-            logger.error(f"Error getting AI response: {e}")
-            return "❌ Erro ao obter resposta da IA. Tente novamente."
+    def resolve_model(self, provider: Optional[ProviderType] = None,
+                      model_name: Optional[str] = None) -> Optional[ModelInfo]:
+        """Model pinned by a scoped choice, or None when the router or current model decides"""
+        if provider not in self.available_providers:
+            provider = self.current_provider
+        if model_name:
+            for model in self.models.get(provider, []):
+                if model.name == model_name:
+                    return model
+        if provider != self.current_provider:
+            return self.models[provider][0]
+        return None
 
-    async def _get_free_response(self, messages: List[Dict[str, str]]) -> str:
-        """Get response from free provider (g4f)"""
-        try:
-            import g4f
-            from g4f.client import Client
+    def _route(self, messages: List[Dict[str, str]], persona: Optional[str] = None,
+               provider: Optional[ProviderType] = None, model_name: Optional[str] = None) -> ModelInfo:
+        """Model for this request: pinned, else routed by complexity when enabled, else the default"""
+        if provider not in self.available_providers:
+            provider = self.current_provider
+        pinned = self.resolve_model(provider, model_name)
+        if pinned is not None and (model_name or not self.router.enabled):
+            return pinned
+        models = self.models.get(provider, [])
+        if not self.router.enabled or len(models) < 2:
+            return pinned or self.current_model
+        return self.router.route(provider.value, models, messages, persona, reply_budget.get())
 
-            client = Client()
+    async def _get_response(self, messages: List[Dict[str, str]], deadline: Optional[Deadline],
+                            model: Optional[ModelInfo] = None) -> str:
+        """Cache lookup, then a single-flight upstream fetch"""
+        model = model or self.current_model
+        if self.cache is None and self.single_flight is None:
+            return (await self._dispatch(messages, deadline, model))[1]
 
-            # Convert messages format
-            prompt = self._convert_messages_to_prompt(messages)
+        key = make_cache_key(model.provider.value, model.name, messages, reply_budget.get())
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
 
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages
-            )
+        if self.single_flight is None:
+            return await self._fetch(key, messages, deadline, model)
+        return await self.single_flight.do(key, lambda: self._fetch(key, messages, deadline, model))
 
-            return response.choices[0].message.content
+    async def _fetch(self, key: str, messages: List[Dict[str, str]], deadline: Optional[Deadline],
+                     model: Optional[ModelInfo] = None) -> str:
+        """Dispatch upstream and cache successful replies from the requested provider"""
+        answered_by, response = await self._dispatch(messages, deadline, model)
+        # A fallback or hedged reply must not keep answering once the provider recovers
+        requested = model.provider if model is not None else self.current_provider
+        if self.cache is not None and answered_by == requested and not is_error_response(response):
+            await self.cache.set(key, response)
+        return response
 
-        except Exception as e:
-            logger.error(f"Error with free provider: {e}")
-            return "❌ Erro no provedor gratuito. Verifique sua conexão."
+    async def _dispatch(self, messages: List[Dict[str, str]], deadline: Optional[Deadline] = None,
+                        model: Optional[ModelInfo] = None) -> Tuple[Optional[ProviderType], str]:
+        """Walk the fallback chain, skipping providers whose circuit is open.
 
-    async def _get_openai_response(self, messages: List[Dict[str, str]]) -> str:
-        """Get response from OpenAI"""
-        try:
-            import openai
+        Returns the provider that answered (None when none did) and its reply.
+        """
+        chain = self._provider_chain(model.provider if model is not None else None)
+        last_error = None
+        for index, provider in enumerate(chain):
+            if deadline is not None and deadline.expired:
+                return None, TIMEOUT_RESPONSE
+            if self.breakers[provider].state == CircuitState.OPEN:
+                logger.info(f"Skipping {provider.value}: circuit open")
+                continue
+            answered_by, response = await self._attempt(provider, messages, chain[index + 1:], deadline, model)
+            if not is_error_response(response):
+                return answered_by, response
+            last_error = response
+            logger.warning(f"{provider.value} failed, trying next provider in chain")
+        return None, last_error or "❌ Nenhum provedor disponível no momento. Tente novamente."
 
-            api_key = os.getenv("OPENAI_KEY")
-            if not api_key:
-                return "❌ Chave da OpenAI não configurada."
+    def _provider_chain(self, primary: Optional[ProviderType] = None) -> List[ProviderType]:
+        """Requested (or current) provider followed by the available fallbacks"""
+        chain = [primary or self.current_provider]
+        for provider in self.fallback_chain:
+            if provider not in chain and provider in self.available_providers:
+                chain.append(provider)
+        return chain
 
-            client = openai.AsyncClient(api_key=api_key)
+    async def _attempt(self, primary: ProviderType, messages: List[Dict[str, str]],
+                       fallbacks: List[ProviderType], deadline: Optional[Deadline] = None,
+                       model: Optional[ModelInfo] = None) -> Tuple[ProviderType, str]:
+        """Call one provider, hedging to a healthy secondary when enabled; returns who answered"""
+        async def call(provider: ProviderType) -> Tuple[ProviderType, str]:
+            return provider, await self._call_provider(provider, messages, deadline, model)
 
-            response = await client.chat.completions.create(
-                model=self.current_model.name,
-                messages=messages,
-                max_tokens=2000,
-                temperature=0.7
-            )
+        secondary = self._hedge_secondary(primary, fallbacks)
+        if secondary is None:
+            return await call(primary)
 
-            return response.choices[0].message.content
+        return await self.hedger.race(
+            (primary.value, lambda: call(primary)),
+            (secondary.value, lambda: call(secondary)),
+            delay=self.hedger.delay_for(self.latency[primary]),
+            is_error=lambda answer: is_error_response(answer[1]),
+            loser_cost=lambda name: self._model_for(ProviderType(name), model).estimate_cost(
+                estimate_messages_tokens(messages)
+            ),
+        )
 
-        except Exception as e:
-            logger.error(f"Error with OpenAI: {e}")
-            return "❌ Erro ao conectar com OpenAI."
+    def _hedge_secondary(self, primary: ProviderType,
+                         fallbacks: List[ProviderType]) -> Optional[ProviderType]:
+        """Pick the provider to hedge to: next healthy fallback, else a paid provider, else FREE"""
+        if not self.hedger.enabled:
+            return None
 
-    async def _get_claude_response(self, messages: List[Dict[str, str]]) -> str:
-        """Get response from Claude"""
-        try:
-            import anthropic
+        def healthy(p: ProviderType) -> bool:
+            return p != primary and p in self.available_providers and self.breakers[p].state != CircuitState.OPEN
 
-            api_key = os.getenv("CLAUDE_KEY")
-            if not api_key:
-                return "❌ Chave da Anthropic não configurada."
+        # The configured chain order wins, FREE included
+        for provider in fallbacks:
+            if healthy(provider):
+                return provider
+        others = [p for p in self.available_providers if healthy(p)]
+        paid = [p for p in others if p != ProviderType.FREE]
+        if paid:
+            return paid[0]
+        return others[0] if others else None
 
-            client = anthropic.AsyncClient(api_key=api_key)
+    def _model_for(self, provider: ProviderType, model: Optional[ModelInfo] = None) -> ModelInfo:
+        """Requested model for its own provider, current model for the active one, else the default"""
+        if model is not None and provider == model.provider:
+            return model
+        if provider == self.current_provider:
+            return self.current_model
+        return self.models[provider][0]
 
-            # Convert format for Claude
-            system_message = ""
-            claude_messages = []
+    @staticmethod
+    def _fit_reply(model: ModelInfo, messages: List[Dict[str, str]]) -> int:
+        """Reply budget clamped to the room ``model``'s window leaves after the prompt"""
+        room = int(model.max_tokens * (1 - WINDOW_SAFETY_FRACTION)) - estimate_messages_tokens(messages)
+        return max(MIN_REPLY_TOKENS, min(reply_budget.get(), room))
 
-            for msg in messages:
-                if msg["role"] == "system":
-                    system_message = msg["content"]
-                else:
-                    claude_messages.append(msg)
+    @staticmethod
+    def _record_failure(breaker: CircuitBreaker, kind: Optional[ErrorKind]):
+        """Count a failed call against ``breaker`` only when it reflects upstream health"""
+        if kind in BREAKER_ERRORS:
+            breaker.record_failure()
+        else:
+            # Frees a half-open probe so the next call can test the provider
+            breaker.release()
 
-            response = await client.messages.create(
-                model=self.current_model.name,
-                max_tokens=2000,
-                system=system_message,
-                messages=claude_messages
-            )
+    async def _call_provider(self, provider: ProviderType, messages: List[Dict[str, str]],
+                             deadline: Optional[Deadline] = None, model: Optional[ModelInfo] = None) -> str:
+        """Call one provider, recording latency and circuit breaker outcome"""
+        handler = self.providers.get(provider)
+        if handler is None:
+            return "❌ Provedor não configurado."
+        model_info = self._model_for(provider, model)
+        model = model_info.name
 
-            return response.content[0].text
+        breaker = self.breakers[provider]
+        if not breaker.allow_request():
+            return f"❌ Provedor {provider.value} temporariamente indisponível."
 
+        # Prompt plus reply must fit the window of the model actually called
+        budget = reply_budget.set(self._fit_reply(model_info, messages))
+        failure = upstream_error.set(None)
+        try:
+            start = time.perf_counter()
+            response = await handler.get_response(messages, model, deadline)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
         except Exception as e:
-            logger.error(f"Error with Claude: {e}")
-            return "❌ Erro ao conectar com Claude."
+            logger.error(f"Error getting AI response: {e}")
+            response = "❌ Erro ao obter resposta da IA. Tente novamente."
+            upstream_error.set(classify_error(e))
+        finally:
+            kind = upstream_error.get()
+            upstream_error.reset(failure)
+            reply_budget.reset(budget)
 
-    async def _get_gemini_response(self, messages: List[Dict[str, str]]) -> str:
-        """Get response from Gemini"""
+        if is_error_response(response):
+            self._record_failure(breaker, kind)
+        else:
+            latency = time.perf_counter() - start
+            self.latency[provider].record(latency)
+            breaker.record_success(latency)
+        return response
+
+    async def stream_response(self, messages: List[Dict[str, str]], persona: Optional[str] = None,
+                              provider: Optional[ProviderType] = None,
+                              model_name: Optional[str] = None,
+                              max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """Stream AI response tokens from current (or requested) provider as they arrive"""
+        budget = reply_budget.set(max_tokens or DEFAULT_MAX_TOKENS)
         try:
-            import google.generativeai as genai
+            async for token in self._stream(messages, persona, provider, model_name):
+                yield token
+        finally:
+            reply_budget.reset(budget)
 
-            api_key = os.getenv("GEMINI_KEY")
-            if not api_key:
-                return "❌ Chave do Gemini não configurada."
+    async def _stream(self, messages: List[Dict[str, str]], persona: Optional[str],
+                      provider: Optional[ProviderType], model_name: Optional[str]) -> AsyncIterator[str]:
+        """Route, stream from the chosen provider behind its breaker and record estimated usage"""
+        routed = self._route(messages, persona, provider, model_name)
+        handler = self.providers.get(routed.provider)
+        if handler is None:
+            yield "❌ Provedor não configurado."
+            return
 
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(self.current_model.name)
+        breaker = self.breakers[routed.provider]
+        if not breaker.allow_request():
+            yield f"❌ Provedor {routed.provider.value} temporariamente indisponível."
+            return
 
-            # Convert messages to prompt
-            prompt = self._convert_messages_to_prompt(messages)
+        model = routed.name
+        produced = []
+        first_token = None
+        budget = reply_budget.set(self._fit_reply(routed, messages))
+        failure = upstream_error.set(None)
+        start = time.perf_counter()
+        try:
+            async for token in handler.stream_response(messages, model):
+                if token:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    produced.append(token)
+                    yield token
+            reply = "".join(produced)
+            if not reply.strip():
+                # A stream that ends without text must still answer the user
+                breaker.record_failure()
+                yield "❌ Erro ao obter resposta da IA. Tente novamente."
+                return
+            if is_error_response(reply):
+                self._record_failure(breaker, upstream_error.get())
+            else:
+                # Responsiveness is time to first token; long replies are not slow calls
+                self.latency[routed.provider].record(first_token)
+                breaker.record_success(first_token)
+            # Streams carry no usage block; estimate from the streamed text
+            self._record_usage(routed.provider, model, messages, reply)
+        except (asyncio.CancelledError, GeneratorExit):
+            breaker.release()
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming AI response: {e}")
+            self._record_failure(breaker, upstream_error.get() or classify_error(e))
+            if not produced:
+                yield "❌ Erro ao obter resposta da IA. Tente novamente."
+        finally:
+            upstream_error.reset(failure)
+            reply_budget.reset(budget)
 
-            response = await model.generate_content_async(prompt)
-            return response.text
+    def _record_usage(self, provider: ProviderType, model: Optional[str],
+                      messages: List[Dict[str, str]], reply: str, response: Any = None):
+        """Account one successful upstream call, estimating tokens when the SDK reports none"""
+        if self.usage is None or is_error_response(reply):
+            return
+        model_info = next((m for m in self.models.get(provider, []) if m.name == model), None) \
+            or self._model_for(provider)
+        usage = extract_usage(response)
+        estimated = usage is None
+        if estimated:
+            usage = TokenUsage(estimate_messages_tokens(messages), count_tokens(reply))
+        self.usage.record(
+            provider.value, model or model_info.name, usage.prompt, usage.completion,
+            model_info.estimate_cost(usage.prompt + usage.completion), estimated, usage.cached
+        )
 
-        except Exception as e:
-            logger.error(f"Error with Gemini: {e}")
-            return "❌ Erro ao conectar com Gemini."
+    @staticmethod
+    def _timeout_kwargs(deadline: Optional[Deadline]) -> Dict[str, float]:
+        """Per-call SDK timeout bounded by the request deadline"""
+        return {"timeout": deadline.remaining()} if deadline is not None else {}
+
+    def _limiter(self, provider: ProviderType, api_key: str) -> ProviderLimiter:
+        """Admission limiter for a provider key"""
+        key = (provider, api_key)
+        limiter = self.limiters.get(key)
+        if limiter is None:
+            limiter = ProviderLimiter.from_env(provider.value)
+            self.limiters[key] = limiter
+        return limiter
+
+    async def _call_upstream(self, provider: ProviderType, api_key: str,
+                             messages: List[Dict[str, str]], call,
+                             deadline: Optional[Deadline] = None) -> Any:
+        """Run an SDK call through admission control and the shared retry policy.
+
+        429s are requeued (honoring rate-limit headers) up to ``max_requeues``
+        times; timeouts, 5xx and connection errors are retried with jittered
+        backoff while the deadline leaves room; auth and bad requests fail fast.
+        """
+        async with self._admitted(provider, api_key, messages, call, deadline) as result:
+            return result
+
+    @asynccontextmanager
+    async def _admitted(self, provider: ProviderType, api_key: str,
+                        messages: List[Dict[str, str]], call,
+                        deadline: Optional[Deadline] = None):
+        """Admit and run ``call`` like ``_call_upstream``, holding the slot while the body runs.
+
+        Streams open inside this context so the concurrency slot covers the
+        whole stream; only the call that opens it is retried.
+        """
+        limiter = self._limiter(provider, api_key)
+        tokens = estimate_messages_tokens(messages) + reply_budget.get()
+        attempt = 0
+        requeues = 0
+
+        while True:
+            async with limiter.admit(tokens):
+                try:
+                    result = await call()
+                except Exception as e:
+                    error = e
+                else:
+                    yield result
+                    return
 
-    async def _get_grok_response(self, messages: List[Dict[str, str]]) -> str:
-        """Get response from Grok"""
+            kind = classify_error(error)
+            if kind == ErrorKind.RATE_LIMIT and requeues < self.max_requeues:
+                headers = error_headers(error)
+                limiter.apply_headers(headers)
+                if not any(h.lower().startswith("retry-after") for h in headers):
+                    limiter.throttled += 1
+                    limiter.requests.block_for(self.retry_policy.backoff(requeues))
+                requeues += 1
+                self.retry_policy.record_retry(provider.value)
+                logger.warning(f"{provider.value} returned 429, requeueing request")
+                continue
+
+            delay = self.retry_policy.backoff(attempt)
+            time_left = deadline.remaining() if deadline is not None else None
+            if kind == ErrorKind.RATE_LIMIT or not self.retry_policy.should_retry(kind, attempt, delay, time_left):
+                if kind in RETRYABLE_ERRORS:
+                    self.retry_policy.record_give_up(provider.value)
+                upstream_error.set(kind)
+                raise error
+
+            attempt += 1
+            self.retry_policy.record_retry(provider.value)
+            logger.warning(f"{provider.value} {kind.value} error ({error}), retry {attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def _free_slot(self):
+        """Reserve one of the bounded g4f concurrency slots"""
+        metrics = self.free_metrics
+        metrics["waiting"] += 1
+        metrics["max_waiting"] = max(metrics["max_waiting"], metrics["waiting"])
         try:
-            # Grok API implementation would go here
-            # For now, fallback to free provider
-            logger.warning("Grok provider not fully implemented, using free provider")
-            return await self._get_free_response(messages)
+            await self._free_semaphore.acquire()
+        finally:
+            metrics["waiting"] -= 1
 
-        except Exception as e:
-            logger.error(f"Error with Grok: {e}")
-            return "❌ Erro ao conectar com Grok."
+        metrics["in_flight"] += 1
+        try:
+            yield
+        finally:
+            metrics["in_flight"] -= 1
+            metrics["completed"] += 1
+            self._free_semaphore.release()
 
     def _convert_messages_to_prompt(self, messages: List[Dict[str, str]]) -> str:
         """Convert messages to a single prompt string"""
@@ -271,11 +1054,65 @@ class ProviderManager:
 
         return "\n\n".join(prompt_parts)
 
+    async def warm_up(self, timeout: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """Prepare every available provider ahead of the first request.
+
+        Imports the SDK, builds the pooled client and opens a connection to the
+        provider's API host (a HEAD request; any HTTP status counts). Providers
+        are warmed concurrently and failures are only logged. Returns the
+        warm-up time per provider, or None where it failed.
+        """
+        if timeout is None:
+            timeout = float(os.getenv("WARMUP_TIMEOUT", "10"))
+        providers = list(self.available_providers)
+        results = await asyncio.gather(*(self._warm_up_provider(p, timeout) for p in providers))
+        return {p.value: elapsed for p, elapsed in zip(providers, results)}
+
+    async def _warm_up_provider(self, provider: ProviderType, timeout: float) -> Optional[float]:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._warm_up_steps(provider), timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Warm-up of {provider.value} failed after {time.perf_counter() - start:.2f}s: {e!r}")
+            return None
+        elapsed = time.perf_counter() - start
+        logger.info(f"Warm-up of {provider.value} finished in {elapsed:.2f}s")
+        return elapsed
+
+    async def _warm_up_steps(self, provider: ProviderType):
+        # SDK imports are slow and synchronous; keep them off the event loop
+        module = WARMUP_MODULES.get(provider)
+        if module is None:
+            return
+        await asyncio.to_thread(importlib.import_module, module)
+        await self.providers[provider].warm_up()
+
+    async def aclose(self):
+        """Release pooled provider clients and their connections"""
+        await self.clients.aclose()
+        if self.cache is not None:
+            self.cache.close()
+        if self.usage is not None:
+            await self.usage.aclose()
+
     def get_provider_status(self) -> Dict[str, Any]:
         """Get status information about providers"""
         return {
             "current_provider": self.current_provider.value,
             "current_model": self.current_model.name,
             "available_providers": [p.value for p in self.available_providers],
-            "models_count": len(self.models[self.current_provider])
+            "models_count": len(self.models[self.current_provider]),
+            "free_queue": dict(self.free_metrics),
+            "cache": self.cache.stats() if self.cache else None,
+            "single_flight": self.single_flight.stats() if self.single_flight else None,
+            "hedging": self.hedger.stats(),
+            "retries": self.retry_policy.stats(),
+            "routing": self.router.stats(),
+            "usage": self.usage.stats() if self.usage else None,
+            "simulated": self.providers[ProviderType.SIMULATED].backend.stats() if ProviderType.SIMULATED in self.available_providers else None,
+            "breakers": {p.value: self.breakers[p].state.value for p in self.available_providers},
+            "rate_limits": {
+                f"{provider.value} (…{api_key[-4:]})": limiter.stats()
+                for (provider, api_key), limiter in self.limiters.items()
+            }
         }
\ No newline at end of file
@@ -0,0 +1,186 @@
+import os
+import re
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+from src.log import logger
+from src.metrics import LatencyTracker
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at ``rate_per_minute``.
+
+    A rate of 0 disables the bucket. ``block_for`` pauses the bucket entirely,
+    which is how upstream ``Retry-After`` hints are honored.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_per_minute > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_per_minute / 60)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until ``amount`` tokens (capped at capacity) are available and take them"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._blocked_until > now:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if not self.enabled:
+                    return
+                self._refill()
+                amount = min(amount, self.capacity)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) * 60 / self.rate_per_minute)
+
+    def block_for(self, seconds: float):
+        """Hold every caller for ``seconds`` (e.g. from a Retry-After header)"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def set_rate(self, rate_per_minute: float):
+        """Adopt the rate limit the upstream reports for this key"""
+        if rate_per_minute > 0 and rate_per_minute != self.rate_per_minute:
+            if self.enabled:
+                self._refill()
+            else:
+                self.tokens = rate_per_minute
+                self._updated = time.monotonic()
+            self.rate_per_minute = rate_per_minute
+            self.capacity = rate_per_minute
+            self.tokens = min(self.tokens, self.capacity)
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse reset/retry durations: '12', '1.5', '6m0s', '250ms', RFC 3339 or HTTP dates"""
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+    for parser in (lambda v: datetime.fromisoformat(v.replace("Z", "+00:00")), parsedate_to_datetime):
+        try:
+            moment = parser(value)
+        except (TypeError, ValueError):
+            continue
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+    return None
+
+
+def error_headers(error: BaseException) -> Mapping[str, str]:
+    """Response headers attached to an SDK exception, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    return headers if headers is not None else {}
+
+
+class ProviderLimiter:
+    """Admission control for one provider key: concurrency + requests/min + tokens/min"""
+
+    def __init__(self, name: str, max_concurrency: int, rpm: float, tpm: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+        self.queue_wait = LatencyTracker()
+        self.waiting = 0
+        self.in_flight = 0
+        self.throttled = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "ProviderLimiter":
+        """Build a limiter from ``<NAME>_MAX_CONCURRENCY``, ``<NAME>_RPM`` and ``<NAME>_TPM``"""
+        prefix = name.upper()
+        return cls(
+            name,
+            max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", "10")),
+            rpm=float(os.getenv(f"{prefix}_RPM", "0")),
+            tpm=float(os.getenv(f"{prefix}_TPM", "0")),
+        )
+
+    @asynccontextmanager
+    async def admit(self, tokens: int = 0):
+        """Queue until the request may go upstream, then hold a concurrency slot"""
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self.requests.acquire(1)
+            if tokens:
+                await self.tokens.acquire(tokens)
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.queue_wait.record(time.perf_counter() - start)
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def apply_headers(self, headers: Mapping[str, str]):
+        """Adjust buckets from Retry-After and rate-limit headers (OpenAI/Anthropic style)"""
+        lowered = {k.lower(): v for k, v in dict(headers).items()}
+
+        retry_after = None
+        if "retry-after-ms" in lowered:
+            retry_after = _parse_duration(lowered["retry-after-ms"] + "ms")
+        elif "retry-after" in lowered:
+            retry_after = _parse_duration(lowered["retry-after"])
+        if retry_after is not None:
+            self.throttled += 1
+            self.requests.block_for(retry_after)
+            logger.warning(f"{self.name} rate limited, pausing for {retry_after:.1f}s")
+
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            limit = lowered.get(f"x-ratelimit-limit-{kind}") or lowered.get(f"anthropic-ratelimit-{kind}-limit")
+            if limit and limit.isdigit():
+                bucket.set_rate(float(limit))
+
+            remaining = lowered.get(f"x-ratelimit-remaining-{kind}") or lowered.get(f"anthropic-ratelimit-{kind}-remaining")
+            reset = lowered.get(f"x-ratelimit-reset-{kind}") or lowered.get(f"anthropic-ratelimit-{kind}-reset")
+            if remaining == "0" and reset:
+                seconds = _parse_duration(reset)
+                if seconds:
+                    bucket.block_for(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue and throttling metrics"""
+        return {
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "throttled": self.throttled,
+            "queue_wait_p50": self.queue_wait.percentile(50),
+            "queue_wait_p95": self.queue_wait.percentile(95),
+        }
@@ -0,0 +1,193 @@
+import os
+import time
+import random
+from collections import defaultdict, deque
+from enum import Enum
+from typing import Dict, Any, Optional
+
+
+class CircuitState(Enum):
+    """Circuit breaker states"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Error-rate and latency based circuit breaker for one provider.
+
+    Calls are tracked in a sliding window; failures and calls slower than
+    ``slow_call_seconds`` both count as bad outcomes. When the bad-outcome rate
+    reaches ``error_rate`` (after ``min_calls``) the circuit opens and requests
+    are rejected immediately. After ``cooldown`` seconds a single probe is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.window = int(os.getenv("CIRCUIT_WINDOW", "20"))
+        self.min_calls = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+        self.error_rate = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+        self.slow_call_seconds = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "30"))
+        self.cooldown = float(os.getenv("CIRCUIT_COOLDOWN", "30"))
+
+        self._outcomes = deque(maxlen=self.window)
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """Current state, moving OPEN to HALF_OPEN once the cooldown elapsed"""
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = CircuitState.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a call may go upstream now (claims the probe when half-open)"""
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        """Give back a half-open probe whose call was cancelled"""
+        self._probe_in_flight = False
+
+    def record_success(self, latency: float):
+        """Record a successful call"""
+        if self._state == CircuitState.HALF_OPEN:
+            if latency >= self.slow_call_seconds:
+                self._trip()
+                return
+            self._state = CircuitState.CLOSED
+            self._outcomes.clear()
+            self._probe_in_flight = False
+            return
+        self._outcomes.append(latency < self.slow_call_seconds)
+        self._evaluate()
+
+    def record_failure(self):
+        """Record a failed call"""
+        if self._state == CircuitState.HALF_OPEN:
+            self._trip()
+            return
+        self._outcomes.append(False)
+        self._evaluate()
+
+    def _evaluate(self):
+        if self._state != CircuitState.CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        bad = self._outcomes.count(False)
+        if bad / len(self._outcomes) >= self.error_rate:
+            self._trip()
+
+    def _trip(self):
+        self._state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._outcomes.clear()
+        self.times_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state and counters"""
+        return {
+            "state": self.state.value,
+            "times_opened": self.times_opened,
+            "recent_calls": len(self._outcomes),
+        }
+
+
+class ErrorKind(Enum):
+    """Upstream failure classes"""
+    TIMEOUT = "timeout"
+    RATE_LIMIT = "rate_limit"
+    SERVER = "server"
+    CONNECTION = "connection"
+    AUTH = "auth"
+    BAD_REQUEST = "bad_request"
+    UNKNOWN = "unknown"
+
+
+RETRYABLE_ERRORS = {ErrorKind.TIMEOUT, ErrorKind.RATE_LIMIT, ErrorKind.SERVER, ErrorKind.CONNECTION}
+
+# Errors that say something about upstream health; auth, bad-request and
+# unclassified errors come from one request or one config and must not open a circuit
+BREAKER_ERRORS = RETRYABLE_ERRORS
+
+
+def _status_of(error: BaseException) -> Optional[int]:
+    """HTTP status carried by an SDK exception (OpenAI, Anthropic, httpx, google-api-core)"""
+    for status in (
+        getattr(error, "status_code", None),
+        getattr(error, "code", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def classify_error(error: BaseException) -> ErrorKind:
+    """Classify an exception raised by a provider SDK"""
+    status = _status_of(error)
+    if status is not None:
+        if status == 408:
+            return ErrorKind.TIMEOUT
+        if status == 429:
+            return ErrorKind.RATE_LIMIT
+        if status >= 500:
+            return ErrorKind.SERVER
+        if status in (401, 403):
+            return ErrorKind.AUTH
+        if 400 <= status < 500:
+            return ErrorKind.BAD_REQUEST
+
+    name = type(error).__name__.lower()
+    if isinstance(error, TimeoutError) or "timeout" in name or "deadline" in name:
+        return ErrorKind.TIMEOUT
+    if isinstance(error, ConnectionError) or "connect" in name or "protocol" in name:
+        return ErrorKind.CONNECTION
+    if "auth" in name or "permission" in name:
+        return ErrorKind.AUTH
+    return ErrorKind.UNKNOWN
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter for retryable upstream errors"""
+
+    def __init__(self):
+        self.max_attempts = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+        self.base_delay = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+        self.max_delay = float(os.getenv("RETRY_MAX_DELAY", "8"))
+
+        self.retries: Dict[str, int] = defaultdict(int)
+        self.give_ups: Dict[str, int] = defaultdict(int)
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number ``attempt`` (0-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def should_retry(self, kind: ErrorKind, attempt: int, delay: float,
+                     time_left: Optional[float] = None) -> bool:
+        """Whether another attempt is allowed after ``attempt`` failures"""
+        if kind not in RETRYABLE_ERRORS or attempt + 1 >= self.max_attempts:
+            return False
+        return time_left is None or delay < time_left
+
+    def record_retry(self, name: str):
+        """Count a retry (or 429 requeue) for provider ``name``"""
+        self.retries[name] += 1
+
+    def record_give_up(self, name: str):
+        """Count a retryable error that exhausted its attempts or deadline"""
+        self.give_ups[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Retry counters per provider"""
+        return {"retries": dict(self.retries), "give_ups": dict(self.give_ups)}
@@ -0,0 +1,92 @@
+import os
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.log import logger
+from src.tokens import count_tokens, estimate_messages_tokens
+
+CODE_FENCE = "```"
+
+
+@dataclass
+class RoutingDecision:
+    """One routing choice and the features behind it"""
+    provider: str
+    model: str
+    score: int
+    message_tokens: int
+    prompt_tokens: int
+    code_blocks: int
+    persona: Optional[str]
+    reasons: List[str]
+    at: float = field(default_factory=time.time)
+
+
+class ComplexityRouter:
+    """Pick a model of the active provider from cheap local prompt features.
+
+    The provider's models are ranked by ``cost_per_token``. Each signal adds
+    one step up the ranking: a latest message over ``simple_tokens``, over
+    ``complex_tokens``, a fenced code block, or a persona listed in
+    ``complex_personas``. When the chosen model's window cannot hold the
+    prompt plus the reply, the next larger tier is used instead.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("MODEL_ROUTING_ENABLED", "False").lower() in {"1", "true", "yes", "y"}
+        self.simple_tokens = int(os.getenv("ROUTING_SIMPLE_TOKENS", "150"))
+        self.complex_tokens = int(os.getenv("ROUTING_COMPLEX_TOKENS", "1500"))
+        self.complex_personas = {
+            name.strip().lower()
+            for name in os.getenv("ROUTING_COMPLEX_PERSONAS", "analyst").split(",")
+            if name.strip()
+        }
+
+        self.decisions: deque = deque(maxlen=int(os.getenv("ROUTING_HISTORY_SIZE", "100")))
+        self.counts: Counter = Counter()
+
+    def route(self, provider: str, models: Sequence[Any], messages: List[Dict[str, str]],
+              persona: Optional[str] = None, reply_tokens: int = 0) -> Any:
+        """Return the ``ModelInfo`` to use for ``messages`` and record the decision"""
+        tiers = sorted(models, key=lambda m: m.cost_per_token)
+        latest = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        message_tokens = count_tokens(str(latest))
+        prompt_tokens = estimate_messages_tokens(messages)
+        code_blocks = str(latest).count(CODE_FENCE) // 2
+
+        reasons = []
+        if message_tokens > self.simple_tokens:
+            reasons.append(f"message>{self.simple_tokens}")
+        if message_tokens > self.complex_tokens:
+            reasons.append(f"message>{self.complex_tokens}")
+        if code_blocks:
+            reasons.append("code")
+        if persona and persona.lower() in self.complex_personas:
+            reasons.append(f"persona={persona}")
+
+        score = len(reasons)
+        index = min(score, len(tiers) - 1)
+        while index < len(tiers) - 1 and tiers[index].max_tokens < prompt_tokens + reply_tokens:
+            index += 1
+            reasons.append("context")
+        model = tiers[index]
+
+        decision = RoutingDecision(provider, model.name, score, message_tokens, prompt_tokens,
+                                   code_blocks, persona, reasons or ["simple"])
+        self.decisions.append(decision)
+        self.counts[model.name] += 1
+        logger.debug(f"Routed to {provider}/{model.name} (score={score}, {', '.join(decision.reasons)})")
+        return model
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests per routed model and the most recent decisions"""
+        return {
+            "enabled": self.enabled,
+            "by_model": dict(self.counts),
+            "recent": [
+                {"model": d.model, "score": d.score, "tokens": d.message_tokens, "reasons": d.reasons}
+                for d in list(self.decisions)[-10:]
+            ],
+        }
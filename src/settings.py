@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from typing import Dict, Optional, Tuple
+
+from src.log import logger
+
+# Scopes from lowest to highest precedence
+SCOPES = ("guild", "channel", "user")
+
+_UNSET = object()
+
+
+@dataclass
+class ScopedSettings:
+    """Provider, model and persona choices; None means inherit"""
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    persona: Optional[str] = None
+
+    def over(self, base: "ScopedSettings") -> "ScopedSettings":
+        """These settings with unset fields taken from ``base``"""
+        return ScopedSettings(**{
+            f.name: getattr(self, f.name) if getattr(self, f.name) is not None else getattr(base, f.name)
+            for f in fields(self)
+        })
+
+
+class SettingsStore:
+    """Per-guild, per-channel and per-user settings with an in-memory cache.
+
+    Rows live in a SQLite table indexed by ``(scope, scope_id)``. Reads go
+    through a bounded LRU that also remembers missing rows, so resolving a
+    message costs dictionary lookups once warm; writes update both. Without a
+    database the cache is the store and is never evicted.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, cache_size: int = 10000):
+        self.db_path = db_path
+        self.cache_size = cache_size
+
+        self._cache: "OrderedDict[Tuple[str, str], Optional[ScopedSettings]]" = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._open_db()
+
+    @classmethod
+    def from_env(cls) -> "SettingsStore":
+        """Build the store from ``SETTINGS_DB`` and ``SETTINGS_CACHE_SIZE``"""
+        return cls(
+            db_path=os.getenv("SETTINGS_DB", "settings.db") or None,
+            cache_size=int(os.getenv("SETTINGS_CACHE_SIZE", "10000")),
+        )
+
+    def _open_db(self):
+        """Open the settings table; failures leave the store memory-only"""
+        try:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS scoped_settings ("
+                "scope TEXT NOT NULL, scope_id TEXT NOT NULL, "
+                "provider TEXT, model TEXT, persona TEXT, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (scope, scope_id))"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not open settings database at {self.db_path}: {e}. Using memory only.")
+            self._db = None
+
+    async def get(self, scope: str, scope_id) -> Optional[ScopedSettings]:
+        """Settings stored for one scope, or None"""
+        key = (scope, str(scope_id))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+
+        self.misses += 1
+        settings = await asyncio.to_thread(self._db_get, key) if self._db is not None else None
+        self._remember(key, settings)
+        return settings
+
+    async def set(self, scope: str, scope_id, provider=_UNSET, model=_UNSET, persona=_UNSET) -> ScopedSettings:
+        """Change the given fields for one scope (None clears a field)"""
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown settings scope: {scope}")
+        current = await self.get(scope, scope_id) or ScopedSettings()
+        updated = ScopedSettings(
+            provider=current.provider if provider is _UNSET else provider,
+            model=current.model if model is _UNSET else model,
+            persona=current.persona if persona is _UNSET else persona,
+        )
+        key = (scope, str(scope_id))
+        if self._db is not None:
+            await asyncio.to_thread(self._db_set, key, updated)
+        self._remember(key, updated)
+        logger.info(f"Settings for {scope} {scope_id}: {updated}")
+        return updated
+
+    async def clear(self, scope: str, scope_id):
+        """Remove every setting for one scope"""
+        key = (scope, str(scope_id))
+        if self._db is not None:
+            await asyncio.to_thread(self._db_delete, key)
+        self._remember(key, None)
+
+    async def resolve(self, user_id=None, channel_id=None, guild_id=None,
+                      defaults: Optional[ScopedSettings] = None) -> ScopedSettings:
+        """Effective settings: user over channel over guild over ``defaults``"""
+        resolved = defaults or ScopedSettings()
+        for scope, scope_id in (("guild", guild_id), ("channel", channel_id), ("user", user_id)):
+            if scope_id is None:
+                continue
+            settings = await self.get(scope, scope_id)
+            if settings is not None:
+                resolved = settings.over(resolved)
+        return resolved
+
+    def _remember(self, key: Tuple[str, str], settings: Optional[ScopedSettings]):
+        self._cache[key] = settings
+        self._cache.move_to_end(key)
+        if self._db is None:
+            return
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _db_get(self, key: Tuple[str, str]) -> Optional[ScopedSettings]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT provider, model, persona FROM scoped_settings WHERE scope = ? AND scope_id = ?", key
+            ).fetchone()
+        return ScopedSettings(*row) if row else None
+
+    def _db_set(self, key: Tuple[str, str], settings: ScopedSettings):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO scoped_settings (scope, scope_id, provider, model, persona, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                key + (settings.provider, settings.model, settings.persona, time.time()),
+            )
+            self._db.commit()
+
+    def _db_delete(self, key: Tuple[str, str]):
+        with self._db_lock:
+            self._db.execute("DELETE FROM scoped_settings WHERE scope = ? AND scope_id = ?", key)
+            self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Cache counters"""
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self._cache)}
+
+    def close(self):
+        """Close the settings database"""
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
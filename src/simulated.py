@@ -0,0 +1,115 @@
+import os
+import math
+import random
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional
+
+from src.ratelimit import TokenBucket
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+
+class SimulatedError(Exception):
+    """Injected upstream failure (looks like an HTTP 503 to the retry layer)"""
+    status_code = 503
+
+
+class SimulatedBackend:
+    """Local stand-in for an LLM API, for benchmarking without keys or network.
+
+    Time to first token is drawn from ``latency_distribution`` around
+    ``latency_mean`` seconds, then the reply is generated at
+    ``tokens_per_second``. ``throughput`` caps requests served per second
+    (0 = unlimited) and ``error_rate`` is the fraction of requests that fail.
+    """
+
+    def __init__(self, latency_distribution: str = "lognormal", latency_mean: float = 0.8,
+                 latency_stddev: float = 0.3, throughput: float = 0.0, error_rate: float = 0.0,
+                 tokens_per_second: float = 50.0, response_tokens: int = 60,
+                 seed: Optional[int] = None):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        self.latency_distribution = latency_distribution
+        self.latency_mean = latency_mean
+        self.latency_stddev = latency_stddev
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+
+        self._rng = random.Random(seed)
+        self._admission = TokenBucket(throughput * 60)
+        # Allow at most one second worth of burst so throughput stays smooth
+        self._admission.capacity = self._admission.tokens = max(1.0, throughput)
+
+        self.requests = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls) -> "SimulatedBackend":
+        """Build the backend from ``SIMULATED_*`` settings"""
+        seed = os.getenv("SIMULATED_SEED")
+        return cls(
+            latency_distribution=os.getenv("SIMULATED_LATENCY_DISTRIBUTION", "lognormal").lower(),
+            latency_mean=float(os.getenv("SIMULATED_LATENCY_MEAN", "0.8")),
+            latency_stddev=float(os.getenv("SIMULATED_LATENCY_STDDEV", "0.3")),
+            throughput=float(os.getenv("SIMULATED_THROUGHPUT", "0")),
+            error_rate=float(os.getenv("SIMULATED_ERROR_RATE", "0")),
+            tokens_per_second=float(os.getenv("SIMULATED_TOKENS_PER_SECOND", "50")),
+            response_tokens=int(os.getenv("SIMULATED_RESPONSE_TOKENS", "60")),
+            seed=int(seed) if seed else None,
+        )
+
+    def sample_latency(self) -> float:
+        """Draw a time-to-first-token in seconds"""
+        mean, stddev = self.latency_mean, self.latency_stddev
+        if self.latency_distribution == "fixed":
+            value = mean
+        elif self.latency_distribution == "uniform":
+            value = self._rng.uniform(mean - stddev, mean + stddev)
+        elif self.latency_distribution == "normal":
+            value = self._rng.gauss(mean, stddev)
+        elif self.latency_distribution == "exponential":
+            value = self._rng.expovariate(1 / mean) if mean > 0 else 0.0
+        else:
+            # Parameterized so the samples have the configured mean and stddev
+            if mean <= 0:
+                return 0.0
+            sigma2 = math.log(1 + (stddev / mean) ** 2)
+            value = self._rng.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+        return max(0.0, value)
+
+    def _reply_tokens(self, messages: List[Dict[str, str]]) -> List[str]:
+        prompt = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        words = ["Resposta", "simulada:"] + str(prompt).split()[:10]
+        filler = ["lorem", "ipsum", "dolor", "sit", "amet"]
+        while len(words) < self.response_tokens:
+            words.append(filler[len(words) % len(filler)])
+        return [word + " " for word in words[:max(1, self.response_tokens)]]
+
+    async def _start(self):
+        await self._admission.acquire()
+        self.requests += 1
+        await asyncio.sleep(self.sample_latency())
+        if self._rng.random() < self.error_rate:
+            self.errors += 1
+            raise SimulatedError("simulated upstream failure")
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        """Return the full reply after latency plus generation time"""
+        await self._start()
+        tokens = self._reply_tokens(messages)
+        if self.tokens_per_second > 0:
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+        return "".join(tokens).strip()
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Yield the reply token by token at ``tokens_per_second``"""
+        await self._start()
+        delay = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for token in self._reply_tokens(messages):
+            await asyncio.sleep(delay)
+            yield token
+
+    def stats(self) -> Dict[str, int]:
+        """Request and injected-error counters"""
+        return {"requests": self.requests, "errors": self.errors}
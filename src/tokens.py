@@ -0,0 +1,66 @@
+import os
+import asyncio
+from functools import lru_cache
+from typing import Dict, List
+
+from src.log import logger
+
+# Sentinel for "tokenizer could not be loaded, use the heuristic"; None means not loaded yet
+_UNAVAILABLE = object()
+_encoder = None
+
+# Fixed per-message overhead (role markers and separators) used by chat APIs
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)"""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def load_tokenizer():
+    """Load the tiktoken encoder (blocking: may download the BPE file); remember failures.
+
+    Call it off the event loop (``load_tokenizer_async``). Until it has run,
+    token counts use the character estimate. Set ``TIKTOKEN_CACHE_DIR`` to a
+    persistent directory so the file is only downloaded once.
+    """
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(os.getenv("TOKENIZER_ENCODING", "cl100k_base"))
+        except Exception as e:
+            logger.warning(f"Tokenizer unavailable ({e}); using character-based estimate")
+            _encoder = _UNAVAILABLE
+        # Drop counts estimated while the encoder was loading
+        count_tokens.cache_clear()
+    return _encoder
+
+
+async def load_tokenizer_async():
+    """Load the encoder in a worker thread so the event loop never blocks on it"""
+    return await asyncio.to_thread(load_tokenizer)
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Count tokens with the local tokenizer, cached per distinct text"""
+    if not text:
+        return 0
+    encoder = _encoder
+    if encoder is None or encoder is _UNAVAILABLE:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    """Tokens for one chat message including its fixed overhead"""
+    return count_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """Token count for a chat message list, including per-message overhead"""
+    return sum(count_message_tokens(m) for m in messages)
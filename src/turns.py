@@ -0,0 +1,96 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable, List, Optional
+
+from src.log import logger
+
+
+class _Batch:
+    __slots__ = ("parts", "last")
+
+    def __init__(self, content: str, now: float):
+        self.parts: List[str] = [content]
+        self.last = now
+
+
+class TurnQueue:
+    """Run each conversation's turns one at a time and merge rapid-fire messages.
+
+    ``turn(key)`` is a FIFO lock per conversation, so concurrent messages from
+    one user update the history and reach the provider in arrival order.
+    ``collect(key, content)`` holds a message for ``debounce`` seconds after
+    the latest one from the same user; messages arriving within the window
+    (up to ``max_batch``) are merged into the first caller's request and the
+    others get None back.
+    """
+
+    def __init__(self, debounce: float = 0.0, max_batch: int = 5):
+        self.debounce = debounce
+        self.max_batch = max(1, max_batch)
+
+        self._locks: Dict[Hashable, list] = {}
+        self._batches: Dict[Hashable, _Batch] = {}
+
+        self.merged = 0
+        self.waited = 0
+
+    @classmethod
+    def from_env(cls) -> "TurnQueue":
+        """Build the queue from ``CONVERSATION_DEBOUNCE`` and ``CONVERSATION_DEBOUNCE_MAX_MESSAGES``"""
+        return cls(
+            debounce=float(os.getenv("CONVERSATION_DEBOUNCE", "0.4")),
+            max_batch=int(os.getenv("CONVERSATION_DEBOUNCE_MAX_MESSAGES", "5")),
+        )
+
+    async def collect(self, key: Hashable, content: str) -> Optional[str]:
+        """Merged text to answer, or None when ``content`` joined an earlier message"""
+        if self.debounce <= 0:
+            return content
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(key)
+        if batch is not None and len(batch.parts) < self.max_batch:
+            batch.parts.append(content)
+            batch.last = loop.time()
+            self.merged += 1
+            return None
+
+        batch = self._batches[key] = _Batch(content, loop.time())
+        try:
+            while True:
+                remaining = batch.last + self.debounce - loop.time()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+        finally:
+            if self._batches.get(key) is batch:
+                del self._batches[key]
+        if len(batch.parts) > 1:
+            logger.debug(f"Merged {len(batch.parts)} messages from {key} into one turn")
+        return "\n".join(batch.parts)
+
+    @asynccontextmanager
+    async def turn(self, key: Hashable):
+        """Hold ``key``'s conversation until the turn is recorded"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        if entry[0].locked():
+            self.waited += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Merge and queueing counters"""
+        return {
+            "merged": self.merged,
+            "waited": self.waited,
+            "active": len(self._locks),
+            "debouncing": len(self._batches),
+        }
@@ -0,0 +1,243 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from contextvars import ContextVar
+from datetime import date
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from src.log import logger
+
+# (user_id, guild_id) of the request being served; set by the Discord client
+current_requester: ContextVar[Tuple[Optional[int], Optional[int]]] = ContextVar(
+    "current_requester", default=(None, None)
+)
+
+# Grouping dimensions, in the order they form the aggregation key
+USAGE_DIMENSIONS = ("day", "provider", "model", "user_id", "guild_id")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS usage_totals ("
+    "day TEXT NOT NULL, provider TEXT NOT NULL, model TEXT NOT NULL, "
+    "user_id TEXT NOT NULL, guild_id TEXT NOT NULL, "
+    "requests INTEGER NOT NULL, estimated_requests INTEGER NOT NULL, "
+    "prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, cost REAL NOT NULL, "
+    "cached_tokens INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (day, provider, model, user_id, guild_id))"
+)
+
+# Counter columns, in the order pending totals are kept
+_COUNTERS = ("requests", "estimated_requests", "prompt_tokens", "completion_tokens", "cost", "cached_tokens")
+
+_UPSERT = (
+    "INSERT INTO usage_totals (" + ", ".join(USAGE_DIMENSIONS + _COUNTERS) + ") "
+    "VALUES (" + ", ".join("?" * (len(USAGE_DIMENSIONS) + len(_COUNTERS))) + ") "
+    "ON CONFLICT(day, provider, model, user_id, guild_id) DO UPDATE SET "
+    + ", ".join(f"{c} = {c} + excluded.{c}" for c in _COUNTERS)
+)
+
+
+class TokenUsage(NamedTuple):
+    """Tokens billed for one call; ``cached`` is the part of ``prompt`` served from the prompt cache"""
+    prompt: int
+    completion: int
+    cached: int = 0
+
+
+def set_requester(user_id: Optional[int], guild_id: Optional[int] = None):
+    """Attribute usage recorded in the current task to ``user_id`` / ``guild_id``"""
+    current_requester.set((user_id, guild_id))
+
+
+def _int(value: Any) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def extract_usage(response: Any) -> Optional[TokenUsage]:
+    """Token usage reported by an OpenAI, Anthropic or Gemini response"""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        prompt = getattr(usage, "prompt_tokens", None)
+        completion = getattr(usage, "completion_tokens", None)
+        if isinstance(prompt, int) and isinstance(completion, int):
+            details = getattr(usage, "prompt_tokens_details", None)
+            return TokenUsage(prompt, completion, _int(getattr(details, "cached_tokens", None)))
+
+        # Anthropic reports cache reads and writes apart from the uncached input
+        prompt = getattr(usage, "input_tokens", None)
+        completion = getattr(usage, "output_tokens", None)
+        if isinstance(prompt, int) and isinstance(completion, int):
+            cached = _int(getattr(usage, "cache_read_input_tokens", None))
+            written = _int(getattr(usage, "cache_creation_input_tokens", None))
+            return TokenUsage(prompt + cached + written, completion, cached)
+
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is not None:
+        prompt = getattr(metadata, "prompt_token_count", None)
+        completion = getattr(metadata, "candidates_token_count", None)
+        if isinstance(prompt, int) and isinstance(completion, int):
+            return TokenUsage(prompt, completion, _int(getattr(metadata, "cached_content_token_count", None)))
+    return None
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(db_path, check_same_thread=False)
+    # WAL lets the admin panel read while the bot writes
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(_SCHEMA)
+    columns = {row[1] for row in db.execute("PRAGMA table_info(usage_totals)")}
+    if "cached_tokens" not in columns:
+        db.execute("ALTER TABLE usage_totals ADD COLUMN cached_tokens INTEGER NOT NULL DEFAULT 0")
+    return db
+
+
+def read_totals(db_path: str, by: str = "provider", since: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Totals grouped by ``by`` (one of USAGE_DIMENSIONS), optionally from day ``since`` on"""
+    if by not in USAGE_DIMENSIONS:
+        raise ValueError(f"Unknown usage dimension: {by}")
+    if not db_path or not os.path.exists(db_path):
+        return {}
+    db = _connect(db_path)
+    try:
+        query = f"SELECT {by}, " + ", ".join(f"SUM({c})" for c in _COUNTERS) + " FROM usage_totals"
+        params: Tuple = ()
+        if since:
+            query += " WHERE day >= ?"
+            params = (since,)
+        rows = db.execute(query + f" GROUP BY {by}", params).fetchall()
+    finally:
+        db.close()
+    return {row[0]: dict(zip(_COUNTERS, row[1:])) for row in rows}
+
+
+class UsageTracker:
+    """Aggregate token usage and spend in memory and flush it to SQLite in batches.
+
+    ``record`` only touches an in-memory dict keyed by day, provider, model,
+    user and guild. The pending deltas are upserted in one transaction
+    ``flush_interval`` seconds after the first unflushed record, or as soon as
+    ``batch_size`` records accumulate.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, flush_interval: float = 30.0, batch_size: int = 100):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._pending: Dict[Tuple[str, ...], List[float]] = {}
+        self._pending_records = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Optional[asyncio.Task] = None
+
+        self.recorded = 0
+        self.flushes = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["UsageTracker"]:
+        """Build the tracker from environment settings, or None when disabled"""
+        if os.getenv("USAGE_TRACKING_ENABLED", "True").lower() not in {"1", "true", "yes", "y"}:
+            return None
+        return cls(
+            db_path=os.getenv("USAGE_DB", "usage.db") or None,
+            flush_interval=float(os.getenv("USAGE_FLUSH_INTERVAL", "30")),
+            batch_size=int(os.getenv("USAGE_FLUSH_BATCH", "100")),
+        )
+
+    def record(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int,
+               cost: float, estimated: bool = False, cached_tokens: int = 0):
+        """Add one upstream call to the pending totals"""
+        user_id, guild_id = current_requester.get()
+        key = (date.today().isoformat(), provider, model,
+               "" if user_id is None else str(user_id), "" if guild_id is None else str(guild_id))
+        totals = self._pending.setdefault(key, [0] * len(_COUNTERS))
+        for i, value in enumerate((1, int(estimated), prompt_tokens, completion_tokens, cost, cached_tokens)):
+            totals[i] += value
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self._pending_records += 1
+        self.recorded += 1
+
+        if not self.db_path:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No running loop (sync callers); flushed on the next async record or on close
+            return
+        if self._pending_records >= self.batch_size:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._flush_soon)
+
+    def _flush_soon(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Write pending totals to SQLite in one transaction, off the event loop"""
+        if not self.db_path or not self._pending:
+            return
+        batch, self._pending, self._pending_records = self._pending, {}, 0
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error(f"Usage flush failed, keeping {len(batch)} rows for the next flush: {e}")
+            for key, values in batch.items():
+                totals = self._pending.setdefault(key, [0] * len(_COUNTERS))
+                for i, value in enumerate(values):
+                    totals[i] += value
+            return
+        self.flushes += 1
+        logger.debug(f"Flushed {len(batch)} usage rows in {time.perf_counter() - start:.3f}s")
+
+    def _write(self, batch: Dict[Tuple[str, ...], List[float]]):
+        with self._db_lock:
+            if self._db is None:
+                # Opened on first flush so idle bots never create the file
+                self._db = _connect(self.db_path)
+            with self._db:
+                self._db.executemany(_UPSERT, [key + tuple(values) for key, values in batch.items()])
+
+    async def totals(self, by: str = "provider", since: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """Stored totals plus anything not yet flushed, grouped by ``by``"""
+        totals = await asyncio.to_thread(read_totals, self.db_path, by, since) if self.db_path else {}
+        position = USAGE_DIMENSIONS.index(by)
+        for key, values in self._pending.items():
+            if since and key[0] < since:
+                continue
+            entry = totals.setdefault(key[position], dict.fromkeys(_COUNTERS, 0))
+            for name, value in zip(_COUNTERS, values):
+                entry[name] += value
+        return totals
+
+    def stats(self) -> Dict[str, Any]:
+        """Recording and flushing counters plus the prompt-cache hit ratio since start"""
+        return {
+            "recorded": self.recorded,
+            "pending": self._pending_records,
+            "flushes": self.flushes,
+            "cached_tokens": self.cached_tokens,
+            "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+        }
+
+    async def aclose(self):
+        """Write what is pending and close the database"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        await self.flush()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
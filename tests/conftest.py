@@ -58,3 +58,10 @@ def mock_provider_manager():
     manager.current_provider.value = "FREE"
     manager.get_available_providers.return_value = [Mock()]
     return manager
+
+@pytest.fixture(autouse=True)
+def isolated_usage_db(tmp_path, monkeypatch):
+    """Keep usage, settings and conversations written by tests out of the working tree"""
+    monkeypatch.setenv("USAGE_DB", str(tmp_path / "usage.db"))
+    monkeypatch.setenv("SETTINGS_DB", str(tmp_path / "settings.db"))
+    monkeypatch.setenv("CONVERSATION_DB", str(tmp_path / "conversations.db"))
@@ -37,3 +37,23 @@ class TestAdminPanel:
         panel = ap.AdminPanel()
         stats = panel._get_system_stats()
         assert set(['cpu_percent', 'memory_percent', 'disk_percent', 'uptime']).issubset(stats.keys())
+
+    @pytest.mark.asyncio
+    async def test_usage_totals_come_from_usage_db(self, tmp_path, monkeypatch):
+        import importlib
+        from src.usage import UsageTracker
+        monkeypatch.setitem(os.sys.modules, 'streamlit', __import__('types').SimpleNamespace(
+            set_page_config=lambda **k: None,
+            markdown=lambda *a, **k: None,
+        ))
+        db_path = str(tmp_path / "usage.db")
+        tracker = UsageTracker(db_path)
+        tracker.record("OpenAI", "gpt-4", 1000, 0, 0.03)
+        await tracker.aclose()
+
+        ap = importlib.import_module('admin_panel')
+        panel = ap.AdminPanel()
+        panel.config['USAGE_DB'] = db_path
+        assert panel._get_usage_totals("provider")["OpenAI"]["cost"] == pytest.approx(0.03)
+        panel.config['USAGE_DB'] = str(tmp_path / "missing.db")
+        assert panel._get_usage_totals("provider") == {}
@@ -0,0 +1,157 @@
+import pytest
+
+from src.cache import ResponseCache, make_cache_key
+
+
+def _messages(text, persona="P"):
+    return [{"role": "system", "content": persona}, {"role": "user", "content": text}]
+
+
+class TestCacheKey:
+    def test_key_normalizes_whitespace(self):
+        a = make_cache_key("OpenAI", "gpt-4", _messages("Olá   mundo"))
+        b = make_cache_key("OpenAI", "gpt-4", _messages(" Olá mundo\n"))
+        assert a == b
+
+    def test_key_depends_on_provider_model_and_persona(self):
+        base = make_cache_key("OpenAI", "gpt-4", _messages("oi"))
+        assert base != make_cache_key("Claude", "gpt-4", _messages("oi"))
+        assert base != make_cache_key("OpenAI", "gpt-3.5-turbo", _messages("oi"))
+        assert base != make_cache_key("OpenAI", "gpt-4", _messages("oi", persona="Q"))
+
+
+class TestResponseCache:
+    @pytest.mark.asyncio
+    async def test_hit_and_miss_counters(self):
+        cache = ResponseCache()
+        assert await cache.get("k") is None
+        await cache.set("k", "v")
+        assert await cache.get("k") == "v"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2)
+        await cache.set("a", "1")
+        await cache.set("b", "2")
+        await cache.get("a")
+        await cache.set("c", "3")
+        assert await cache.get("b") is None
+        assert await cache.get("a") == "1"
+        assert cache.evictions == 1
+
+    @pytest.mark.asyncio
+    async def test_ttl_expiry(self):
+        cache = ResponseCache(ttl=-1)
+        await cache.set("k", "v")
+        assert await cache.get("k") is None
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_survives_restart(self, tmp_path):
+        db = str(tmp_path / "cache.db")
+        first = ResponseCache(db_path=db)
+        await first.set("k", "persisted")
+        first.close()
+
+        second = ResponseCache(db_path=db)
+        assert await second.get("k") == "persisted"
+        assert second.disk_hits == 1
+        second.close()
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_is_capped_and_purged(self, tmp_path):
+        import sqlite3
+        db = str(tmp_path / "cache.db")
+        cache = ResponseCache(max_entries=1, db_path=db, db_max_entries=3, purge_interval=3600)
+        for i in range(6):
+            await cache.set(f"k{i}", f"v{i}")
+        cache.ttl = -1
+        await cache.set("expired", "old")
+        cache.purge_interval = 0
+        cache.ttl = 3600
+        await cache.set("k6", "v6")
+        cache.close()
+
+        keys = {row[0] for row in sqlite3.connect(db).execute("SELECT key FROM response_cache")}
+        assert len(keys) == 3 and "k6" in keys and "expired" not in keys
+        assert cache.stats()["disk_purged"] == 5
+
+
+class TestProviderManagerCache:
+    @pytest.mark.asyncio
+    async def test_get_response_cached_and_errors_skipped(self, monkeypatch):
+        from src.providers import ProviderManager, ProviderType
+
+        pm = ProviderManager()
+        calls = []
+
+        async def fake_free(messages, model=None, deadline=None):
+            calls.append(messages)
+            return "❌ Erro no provedor gratuito." if len(calls) == 1 else "Resposta"
+
+        monkeypatch.setattr(pm.providers[ProviderType.FREE], "get_response", fake_free)
+
+        assert (await pm.get_response(_messages("oi"))).startswith("❌")
+        assert await pm.get_response(_messages("oi")) == "Resposta"
+        assert await pm.get_response(_messages("oi")) == "Resposta"
+        assert len(calls) == 2
+
+
+class TestSingleFlight:
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_call(self):
+        import asyncio
+        from src.cache import SingleFlight
+
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "shared"
+
+        results = await asyncio.gather(*[flight.do("k", fetch) for _ in range(5)])
+        assert results == ["shared"] * 5
+        assert len(calls) == 1
+        assert flight.stats() == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+
+    @pytest.mark.asyncio
+    async def test_cancelled_leader_does_not_cancel_followers(self):
+        import asyncio
+        from src.cache import SingleFlight
+
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        leader = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await follower == "ok"
+
+    @pytest.mark.asyncio
+    async def test_provider_manager_coalesces_identical_requests(self, monkeypatch):
+        import asyncio
+        from src.providers import ProviderManager, ProviderType
+
+        pm = ProviderManager()
+        calls = []
+
+        async def fake_free(messages, model=None, deadline=None):
+            calls.append(messages)
+            await asyncio.sleep(0.05)
+            return "Resposta"
+
+        monkeypatch.setattr(pm.providers[ProviderType.FREE], "get_response", fake_free)
+        results = await asyncio.gather(*[pm.get_response(_messages("oi")) for _ in range(4)])
+
+        assert results == ["Resposta"] * 4
+        assert len(calls) == 1
+        assert pm.get_provider_status()["single_flight"]["coalesced"] == 3
@@ -14,3 +14,20 @@ async def test_on_ready_sets_presence(monkeypatch):
     await c.on_ready()
     c.tree.sync.assert_awaited()
     c.change_presence.assert_awaited()
+
+
+@pytest.mark.asyncio
+async def test_on_ready_starts_warm_up_once(monkeypatch):
+    monkeypatch.setenv("WARMUP_ENABLED", "true")
+    from src.aclient import DiscordClient
+    c = DiscordClient()
+    c._connection = SimpleNamespace(user=SimpleNamespace(id=1, __str__=lambda self='': 'bot'))
+    c.tree.sync = AsyncMock(return_value=[])
+    c.change_presence = AsyncMock()
+    c.provider_manager.warm_up = AsyncMock(return_value={})
+
+    await c.on_ready()
+    await c.on_ready()
+    await c._warmup_task
+
+    c.provider_manager.warm_up.assert_awaited_once()
@@ -0,0 +1,98 @@
+import os
+import types
+import pytest
+from unittest.mock import patch
+
+from src.clients import ClientRegistry
+
+
+class TestClientRegistry:
+    def test_reuses_client_per_provider_and_key(self):
+        registry = ClientRegistry()
+        built = []
+
+        def factory(http_client):
+            built.append(http_client)
+            return object()
+
+        a = registry.get("OpenAI", "k1", factory)
+        b = registry.get("OpenAI", "k1", factory)
+        c = registry.get("OpenAI", "k2", factory)
+
+        assert a is b
+        assert a is not c
+        assert len(registry) == 2
+        # Every client shares the same pooled HTTP client
+        assert built[0] is built[1]
+
+    @pytest.mark.asyncio
+    async def test_aclose_closes_pool(self):
+        registry = ClientRegistry()
+        http_client = registry.get_http_client()
+        registry.get("Claude", "k", lambda h: object())
+
+        await registry.aclose()
+
+        assert http_client.is_closed
+        assert len(registry) == 0
+
+
+@pytest.mark.asyncio
+async def test_openai_client_built_once_across_requests():
+    from src.providers import ProviderManager, ProviderType
+
+    created = []
+
+    async def create(**kwargs):
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content='OK'))])
+
+    def make_client(api_key=None, http_client=None, **kwargs):
+        created.append(http_client)
+        return types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+
+    mod = types.SimpleNamespace(AsyncClient=make_client)
+
+    with patch.dict(os.environ, {"OPENAI_KEY": "k"}, clear=False), \
+         patch.dict('sys.modules', {'openai': mod}):
+        pm = ProviderManager()
+        for _ in range(3):
+            assert await pm.providers[ProviderType.OPENAI].get_response([{"role": "user", "content": "hi"}]) == 'OK'
+        await pm.aclose()
+
+    assert len(created) == 1
+    assert created[0] is not None
+
+
+@pytest.mark.asyncio
+async def test_warm_up_builds_clients_and_opens_connections():
+    from src.providers import ProviderManager, ProviderType
+
+    opened = []
+
+    async def head(url):
+        opened.append(url)
+
+    def make_client(api_key=None, http_client=None, **kwargs):
+        return types.SimpleNamespace(base_url="https://api.openai.test/v1/")
+
+    def broken_client(**kwargs):
+        raise RuntimeError("no anthropic")
+
+    fake_g4f = types.SimpleNamespace(AsyncClient=lambda: object())
+    modules = {
+        'openai': types.SimpleNamespace(AsyncClient=make_client),
+        'anthropic': types.SimpleNamespace(AsyncClient=broken_client),
+        'g4f.client': fake_g4f,
+    }
+    with patch.dict(os.environ, {"OPENAI_KEY": "k", "CLAUDE_KEY": "k"}, clear=False), \
+         patch.dict('sys.modules', modules):
+        pm = ProviderManager()
+        pm.available_providers = [p for p in pm.available_providers if p.value in ("Free", "OpenAI", "Claude")]
+        pm.clients.get_http_client = lambda: types.SimpleNamespace(head=head)
+        timings = await pm.warm_up(timeout=5)
+
+    assert timings["OpenAI"] is not None
+    assert timings["Free"] is not None
+    assert timings["Claude"] is None
+    assert opened == ["https://api.openai.test/v1/"]
+    assert len(pm.clients) == 1
@@ -9,3 +9,22 @@ def test_setup_commands_registers():
     # Deve registrar pelo menos os 4 comandos definidos
     names = {c.name for c in cmds}
     assert {"chat","reset","persona","status"}.issubset(names)
+
+
+@pytest.mark.asyncio
+async def test_long_chat_attaches_past_configured_length():
+    import os
+    from unittest.mock import AsyncMock, Mock, patch
+    from src.aclient import DiscordClient
+
+    with patch.dict(os.environ, {"MAX_MESSAGE_LENGTH": "100"}):
+        client = DiscordClient()
+    client.setup_commands()
+    client.handle_message = AsyncMock(return_value="x" * 150)
+    interaction = Mock(created_at=None, guild_id=None, channel_id=1)
+    interaction.user.id = 1
+    interaction.response.defer = AsyncMock()
+    interaction.followup.send = AsyncMock()
+
+    await client.tree.get_command("chat").callback(interaction, "oi", longo=True)
+    assert "file" in interaction.followup.send.await_args.kwargs
@@ -0,0 +1,132 @@
+import os
+import pytest
+from unittest.mock import patch
+
+from src.context import ContextBuilder, ReplyBudget
+from src.providers import ModelInfo, ProviderType
+from src.tokens import count_tokens, count_message_tokens
+
+
+def _history(n, size=400):
+    roles = ["user", "assistant"]
+    return [{"role": roles[i % 2], "content": f"{i} " + "x" * size} for i in range(n)]
+
+
+class TestTokens:
+    def test_count_tokens_cached(self):
+        count_tokens.cache_clear()
+        text = "Olá, tudo bem com você?"
+        first = count_tokens(text)
+        assert first > 0
+        assert count_tokens(text) == first
+        assert count_tokens.cache_info().hits == 1
+
+    def test_empty_text(self):
+        assert count_tokens("") == 0
+
+    @pytest.mark.asyncio
+    async def test_encoder_loads_off_loop_and_estimates_until_ready(self, monkeypatch):
+        import sys
+        import types
+        import threading
+        from src import tokens
+
+        loaded_in = []
+
+        def get_encoding(name):
+            loaded_in.append(threading.current_thread())
+            return types.SimpleNamespace(encode=lambda text, disallowed_special=(): text.split())
+
+        monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=get_encoding))
+        monkeypatch.setattr(tokens, "_encoder", None)
+        count_tokens.cache_clear()
+        text = "um dois tres quatro cinco seis sete oito"
+
+        assert count_tokens(text) == tokens.estimate_tokens(text)
+        assert loaded_in == []
+        await tokens.load_tokenizer_async()
+        assert loaded_in and loaded_in[0] is not threading.main_thread()
+        assert count_tokens(text) == 8
+        count_tokens.cache_clear()
+
+
+class TestContextBuilder:
+    def test_everything_fits_large_window(self):
+        builder = ContextBuilder()
+        model = ModelInfo("big", ProviderType.CLAUDE, 200000)
+        history = _history(9)
+        messages = builder.build("persona", history, model)
+        assert messages[0] == {"role": "system", "content": "persona"}
+        assert messages[1:] == history
+
+    def test_small_window_keeps_newest_within_budget(self):
+        with patch.dict(os.environ, {"CONTEXT_REPLY_TOKENS": "500", "CONTEXT_MIN_HISTORY_TOKENS": "0"}):
+            builder = ContextBuilder()
+        model = ModelInfo("small", ProviderType.OPENAI, 2000)
+        history = _history(21)
+        messages = builder.build("persona", history, model)
+
+        budget = builder.budget_for(model)
+        assert sum(count_message_tokens(m) for m in messages) <= budget
+        assert messages[-1] == history[-1]
+        assert len(messages) < len(history) + 1
+        # Resumes on a user turn
+        assert messages[1]["role"] == "user"
+
+    def test_latest_message_always_kept(self):
+        with patch.dict(os.environ, {"CONTEXT_MIN_HISTORY_TOKENS": "0"}):
+            builder = ContextBuilder()
+        model = ModelInfo("tiny", ProviderType.OPENAI, 100)
+        history = [{"role": "user", "content": "y" * 5000}]
+        messages = builder.build("persona", history, model, reply_tokens=10)
+        assert messages[-1] == history[-1]
+
+    def test_summary_follows_persona_and_counts_against_budget(self):
+        with patch.dict(os.environ, {"CONTEXT_REPLY_TOKENS": "500", "CONTEXT_MIN_HISTORY_TOKENS": "0"}):
+            builder = ContextBuilder()
+        model = ModelInfo("small", ProviderType.OPENAI, 2000)
+        history = _history(21)
+        summary = "usuário se chama Ana " * 40
+        plain = builder.build("persona", history, model)
+        messages = builder.build("persona", history, model, summary=summary)
+
+        assert messages[1]["role"] == "system" and summary in messages[1]["content"]
+        assert sum(count_message_tokens(m) for m in messages) <= builder.budget_for(model)
+        assert len(messages) - 2 < len(plain) - 1
+
+    def test_prefix_stays_stable_across_turns(self):
+        with patch.dict(os.environ, {"CONTEXT_REPLY_TOKENS": "500", "CONTEXT_MIN_HISTORY_TOKENS": "0",
+                                     "CONTEXT_TRIM_BLOCK": "6"}):
+            builder = ContextBuilder()
+        model = ModelInfo("small", ProviderType.OPENAI, 2000)
+        history = _history(41)
+
+        starts = []
+        for turn in range(6):
+            messages = builder.build("persona", history[:21 + 2 * turn], model)
+            starts.append(messages[1]["content"])
+        # Sliding by one pair per turn would move the start every turn
+        assert len(set(starts)) <= 3
+
+
+class TestReplyBudget:
+    def test_budget_follows_delivery_and_verbosity(self):
+        with patch.dict(os.environ, {"REPLY_CHARS_PER_TOKEN": "4", "REPLY_SPLIT_MESSAGES": "3",
+                                     "REPLY_LONG_FORM_TOKENS": "4000"}):
+            budget = ReplyBudget(max_message_length=2000)
+        assert budget.tokens_for("single", "detailed") == 500
+        assert budget.tokens_for("single", "concise") == 250
+        assert budget.tokens_for("split", "normal") == 1125
+        # Never above the default budget unless long form was asked for
+        assert budget.tokens_for("split", "detailed") == 1500
+        assert budget.tokens_for("attachment") == 4000
+        assert "1500" in budget.hint("single")
+        assert budget.hint("attachment") == ""
+        with pytest.raises(ValueError):
+            budget.tokens_for("voice")
+
+    def test_disabled_keeps_default_budget(self):
+        with patch.dict(os.environ, {"REPLY_BUDGET_ENABLED": "false"}):
+            budget = ReplyBudget()
+        assert budget.tokens_for("single") == 2000
+        assert budget.hint("single") == ""
@@ -0,0 +1,174 @@
+import sqlite3
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from src.conversations import ConversationLog, ConversationStore, estimate_bytes
+
+
+def _msg(text="oi", role="user"):
+    return {"role": role, "content": text}
+
+
+class TestConversationStore:
+    def test_append_get_and_delete(self):
+        store = ConversationStore()
+        store.append(1, _msg())
+        store.append(1, _msg("olá", "assistant"))
+        assert len(store[1]) == 2
+        assert 1 in store and 2 not in store
+        assert store.get(2) is None
+        assert store.bytes == estimate_bytes(store[1])
+
+        assert store.delete(1) is True
+        assert store.delete(1) is False
+        assert store.bytes == 0
+        stats = store.stats()
+        assert stats["hits"] >= 2 and stats["misses"] >= 2
+
+    def test_least_recently_used_evicted_past_entry_cap(self):
+        store = ConversationStore(max_entries=2)
+        store.append(1, _msg())
+        store.append(2, _msg())
+        store.get(1)
+        store.append(3, _msg())
+        assert 1 in store and 3 in store and 2 not in store
+        assert store.stats()["evictions"]["entries"] == 1
+
+    def test_pinned_conversation_survives_other_writes(self):
+        store = ConversationStore(max_entries=2)
+        for text in ("A0", "A1", "A2"):
+            store.append(1, _msg(text))
+        with store.pinned(1):
+            store.append(2, _msg())
+            store.append(3, _msg())
+            store.append(4, _msg())
+            assert 1 in store and len(store) == 2
+            store.append(1, _msg("r:A3", "assistant"))
+        assert [m["content"] for m in store[1]] == ["A0", "A1", "A2", "r:A3"]
+        assert store.stats()["pinned"] == 0
+
+    def test_byte_cap_keeps_current_conversation(self):
+        store = ConversationStore(max_bytes=estimate_bytes([_msg("x" * 500)]) + 10)
+        store.append(1, _msg("x" * 400))
+        store.append(2, _msg("y" * 400))
+        assert 1 not in store and 2 in store
+        # A conversation larger than the cap on its own is still kept
+        store.append(2, _msg("z" * 5000))
+        assert len(store[2]) == 2
+        assert store.stats()["evictions"]["bytes"] == 1
+
+    def test_idle_conversations_expire(self):
+        store = ConversationStore(idle_ttl=60)
+        with patch("src.conversations.time.monotonic", return_value=1000.0):
+            store.append(1, _msg())
+        with patch("src.conversations.time.monotonic", return_value=1030.0):
+            store.append(2, _msg())
+        with patch("src.conversations.time.monotonic", return_value=1070.0):
+            assert 1 not in store
+            store.append(3, _msg())
+            assert len(store) == 2
+            assert store.stats()["evictions"]["idle"] == 1
+
+    def test_set_replaces_history_and_bytes(self):
+        store = ConversationStore()
+        for i in range(10):
+            store.append(1, _msg(str(i) * 50))
+        trimmed = store.set(1, store[1][-4:])
+        assert len(trimmed) == 4
+        assert store.bytes == estimate_bytes(trimmed)
+
+
+class TestConversationLog:
+    @pytest.mark.asyncio
+    async def test_history_survives_restart(self, tmp_path):
+        path = str(tmp_path / "conversations.db")
+        store = ConversationStore(log=ConversationLog(path, flush_interval=60))
+        await store.load(1)
+        for i in range(6):
+            store.append(1, _msg(str(i), "user" if i % 2 == 0 else "assistant"))
+        store.set(1, store[1][-4:])
+        store.append(2, _msg("apagar"))
+        store.delete(2)
+        # Nothing written yet: appends wait for the batch
+        assert store.log.stats()["pending"] == 10
+        await store.aclose()
+
+        restarted = ConversationStore(log=ConversationLog(path))
+        assert 1 not in restarted
+        assert [m["content"] for m in await restarted.load(1)] == ["2", "3", "4", "5"]
+        assert len(await restarted.load(2)) == 0
+        assert restarted.log.stats()["loads"] == 2
+        await restarted.aclose()
+
+    @pytest.mark.asyncio
+    async def test_evicted_conversation_reloads_with_pending_writes(self, tmp_path):
+        store = ConversationStore(max_entries=1, log=ConversationLog(str(tmp_path / "c.db"), flush_interval=60))
+        store.append(1, _msg("primeira"))
+        store.append(2, _msg("outra"))
+        assert 1 not in store
+        assert [m["content"] for m in await store.load(1)] == ["primeira"]
+        await store.aclose()
+
+    @pytest.mark.asyncio
+    async def test_append_after_eviction_does_not_shadow_stored_history(self, tmp_path):
+        store = ConversationStore(max_entries=1, log=ConversationLog(str(tmp_path / "c.db"), flush_interval=60))
+        await store.load(1)
+        for text in ("a", "b", "c"):
+            store.append(1, _msg(text))
+        await store.load(2)
+        store.append(2, _msg("outra"))
+        assert 1 not in store
+
+        store.append(1, _msg("d", "assistant"))
+        assert 1 not in store
+        store.trim(1, 3)
+        assert [m["content"] for m in await store.load(1)] == ["b", "c", "d"]
+        await store.aclose()
+
+    @pytest.mark.asyncio
+    async def test_load_waits_for_flush_in_flight(self, tmp_path):
+        import time
+        log = ConversationLog(str(tmp_path / "c.db"), flush_interval=60)
+        log.append(1, _msg("old"))
+        await log.flush()
+        log.append(1, _msg("new"))
+
+        write = log._write
+        log._write = lambda batch: (time.sleep(0.1), write(batch))
+        flushing = asyncio.ensure_future(log.flush())
+        await asyncio.sleep(0.01)
+        assert [m["content"] for m in await log.load(1)] == ["old", "new"]
+        await flushing
+        await log.aclose()
+
+    @pytest.mark.asyncio
+    async def test_batch_size_triggers_flush_and_compaction_removes_trimmed(self, tmp_path):
+        path = str(tmp_path / "conversations.db")
+        log = ConversationLog(path, flush_interval=60, batch_size=5, compact_interval=0)
+        store = ConversationStore(log=log)
+        await store.load(1)
+        for i in range(5):
+            store.append(1, _msg(str(i)))
+        await log._flushing
+        assert log.stats()["flushes"] == 1
+
+        store.set(1, store[1][-2:])
+        await log.flush()
+        await log.compact()
+        rows = sqlite3.connect(path).execute("SELECT content FROM conversation_messages ORDER BY id").fetchall()
+        assert rows == [("3",), ("4",)]
+        await log.aclose()
+
+    @pytest.mark.asyncio
+    async def test_retention_drops_idle_conversations(self, tmp_path):
+        path = str(tmp_path / "conversations.db")
+        log = ConversationLog(path, retention_days=1)
+        with patch("src.conversations.time.time", return_value=0.0):
+            log.append(1, _msg("antiga"))
+        log.append(2, _msg("recente"))
+        await log.flush()
+        await log.compact()
+        assert await log.load(1) == []
+        assert await log.load(2) == [_msg("recente")]
+        await log.aclose()
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from src.deadline import Deadline, INTERACTION_TOKEN_TTL
+
+
+class TestDeadline:
+    def test_remaining_and_expired(self):
+        assert Deadline(10).remaining() > 9
+        assert Deadline(0).expired is True
+
+    def test_interaction_deadline_respects_token_expiry(self, monkeypatch):
+        monkeypatch.setenv("REQUEST_TIMEOUT", "120")
+        monkeypatch.setenv("DELIVERY_MARGIN", "10")
+        old = datetime.now(timezone.utc) - timedelta(seconds=INTERACTION_TOKEN_TTL - 40)
+        deadline = Deadline.for_interaction(old)
+        assert 25 < deadline.remaining() <= 30
+
+    @pytest.mark.asyncio
+    async def test_run_cancels_at_deadline(self):
+        cancelled = []
+
+        async def hang():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with pytest.raises(asyncio.TimeoutError):
+            await Deadline(0.05).run(hang())
+        assert cancelled == [True]
+
+
+@pytest.mark.asyncio
+async def test_get_response_times_out_and_cancels_provider(monkeypatch):
+    from src.providers import ProviderManager, ProviderType, TIMEOUT_RESPONSE
+
+    pm = ProviderManager()
+    cancelled = []
+
+    async def hung_free(messages, model=None, deadline=None):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    monkeypatch.setattr(pm.providers[ProviderType.FREE], "get_response", hung_free)
+    response = await pm.get_response([{"role": "user", "content": "oi"}], deadline=Deadline(0.05))
+    await asyncio.sleep(0)
+
+    assert response == TIMEOUT_RESPONSE
+    assert cancelled == [True]
+    # Timeouts are never cached
+    assert pm.cache.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_handle_message_passes_deadline():
+    from unittest.mock import AsyncMock, patch
+    from src.aclient import DiscordClient
+
+    client = DiscordClient()
+    deadline = Deadline(30)
+    with patch.object(client.provider_manager, 'get_response', new=AsyncMock(return_value="ok")) as mocked:
+        assert await client.handle_message("Oi", 1, deadline) == "ok"
+    assert mocked.await_args.kwargs["deadline"] is deadline
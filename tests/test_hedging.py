@@ -0,0 +1,126 @@
+import os
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from src.hedging import Hedger
+from src.metrics import LatencyTracker
+
+
+def _is_error(text):
+    return text.startswith("❌")
+
+
+def _delayed(result, delay, log=None):
+    async def call():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append("cancelled")
+            raise
+        return result
+    return call
+
+
+class TestLatencyTracker:
+    def test_percentile(self):
+        tracker = LatencyTracker()
+        assert tracker.percentile(95) is None
+        for i in range(1, 101):
+            tracker.record(i / 100)
+        assert tracker.percentile(50) == pytest.approx(0.5, abs=0.02)
+        assert tracker.percentile(95) == pytest.approx(0.95, abs=0.02)
+
+
+class TestHedger:
+    def test_delay_uses_default_until_enough_samples(self):
+        hedger = Hedger()
+        tracker = LatencyTracker()
+        assert hedger.delay_for(tracker) == hedger.default_delay
+        for _ in range(hedger.min_samples):
+            tracker.record(100.0)
+        assert hedger.delay_for(tracker) == hedger.max_delay
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_is_not_hedged(self):
+        hedger = Hedger()
+        result = await hedger.race(
+            ("A", _delayed("primary", 0)), ("B", _delayed("secondary", 0)),
+            delay=0.5, is_error=_is_error, loser_cost=lambda n: 1.0,
+        )
+        assert result == "primary"
+        assert hedger.hedges_started == 0
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_loses_and_is_cancelled(self):
+        hedger = Hedger()
+        log = []
+        result = await hedger.race(
+            ("A", _delayed("primary", 5, log)), ("B", _delayed("secondary", 0.01)),
+            delay=0.05, is_error=_is_error, loser_cost=lambda n: 0.25,
+        )
+        await asyncio.sleep(0)
+        assert result == "secondary"
+        assert log == ["cancelled"]
+        assert hedger.wins["B"] == 1
+        assert hedger.losses["A"] == 1
+        assert hedger.wasted_cost["A"] == 0.25
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_cancels_primary_before_hedge(self):
+        hedger = Hedger()
+        log = []
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(hedger.race(
+                ("A", _delayed("primary", 5, log)), ("B", _delayed("secondary", 0)),
+                delay=5, is_error=_is_error, loser_cost=lambda n: 0.0,
+            ), 0.05)
+        await asyncio.sleep(0)
+        assert log == ["cancelled"]
+        assert hedger.hedges_started == 0
+
+    @pytest.mark.asyncio
+    async def test_error_from_secondary_waits_for_primary(self):
+        hedger = Hedger()
+        result = await hedger.race(
+            ("A", _delayed("primary", 0.1)), ("B", _delayed("❌ erro", 0)),
+            delay=0.01, is_error=_is_error, loser_cost=lambda n: 0.0,
+        )
+        assert result == "primary"
+
+
+@pytest.mark.asyncio
+async def test_provider_manager_hedges_to_secondary(monkeypatch):
+    from src.providers import ProviderManager, ProviderType
+
+    with patch.dict(os.environ, {"OPENAI_KEY": "k", "HEDGE_ENABLED": "True", "HEDGE_DELAY": "0.05",
+                                 "RESPONSE_CACHE_ENABLED": "False"}):
+        pm = ProviderManager()
+    pm.set_current_provider(ProviderType.OPENAI)
+
+    async def slow_openai(messages, model=None, deadline=None):
+        await asyncio.sleep(5)
+        return "openai"
+
+    async def fast_free(messages, model=None, deadline=None):
+        return "free"
+
+    monkeypatch.setattr(pm.providers[ProviderType.OPENAI], "get_response", slow_openai)
+    monkeypatch.setattr(pm.providers[ProviderType.FREE], "get_response", fast_free)
+
+    assert await pm.get_response([{"role": "user", "content": "oi"}]) == "free"
+    stats = pm.get_provider_status()["hedging"]
+    assert stats["wins"] == {"Free": 1}
+    assert stats["losses"] == {"OpenAI": 1}
+    assert stats["wasted_cost"]["OpenAI"] > 0
+
+
+def test_hedge_secondary_follows_chain_order():
+    from src.providers import ProviderManager, ProviderType
+
+    with patch.dict(os.environ, {"OPENAI_KEY": "k", "CLAUDE_KEY": "k", "HEDGE_ENABLED": "True"}):
+        pm = ProviderManager()
+    assert pm._hedge_secondary(ProviderType.OPENAI, [ProviderType.FREE, ProviderType.CLAUDE]) == ProviderType.FREE
+    # Without a chain, paid providers come before FREE
+    assert pm._hedge_secondary(ProviderType.OPENAI, []) == ProviderType.CLAUDE
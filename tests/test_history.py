@@ -0,0 +1,50 @@
+import tracemalloc
+
+from src.context import ContextBuilder
+from src.history import History, Message, as_message
+from src.providers import ModelInfo, ProviderType
+
+
+def _bytes_per_message(build, count=2000):
+    contents = [f"mensagem número {i}" for i in range(count)]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        stored = build(contents)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(stored) == count
+    return (after - before) / count
+
+
+class TestHistory:
+    def test_records_use_less_memory_than_dicts(self):
+        roles = ("user", "assistant")
+        as_dicts = _bytes_per_message(
+            lambda contents: [{"role": roles[i % 2], "content": c} for i, c in enumerate(contents)]
+        )
+        as_records = _bytes_per_message(
+            lambda contents: History(Message(roles[i % 2], c) for i, c in enumerate(contents))
+        )
+        assert as_records < as_dicts * 0.6
+
+    def test_roles_are_interned(self):
+        first = as_message({"role": "".join(["assis", "tant"]), "content": "a"})
+        second = Message("".join(["assist", "ant"]), "b")
+        assert first.role is second.role
+
+    def test_trim_drops_oldest_in_place(self):
+        history = History({"role": "user", "content": str(i)} for i in range(10))
+        dropped = history.keep_last(4)
+        assert [m.content for m in dropped] == ["0", "1", "2", "3", "4", "5"]
+        assert [m["content"] for m in history] == ["6", "7", "8", "9"]
+        assert history[-1] == {"role": "user", "content": "9"}
+        assert history.keep_last(10) == []
+
+    def test_builder_reads_history_in_place(self):
+        history = History(Message("user" if i % 2 == 0 else "assistant", f"m{i}") for i in range(5))
+        messages = ContextBuilder().build("persona", history, ModelInfo("m", ProviderType.OPENAI, 100000))
+        assert messages[0] == {"role": "system", "content": "persona"}
+        assert messages[1:] == history.as_dicts()
+        assert all(type(m) is dict for m in messages)
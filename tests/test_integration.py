@@ -4,6 +4,7 @@ from unittest.mock import Mock, patch, AsyncMock
 import os
 
 from src.aclient import DiscordClient
+from src.conversations import ConversationStore
 from src.providers import ProviderManager, ProviderType
 
 
@@ -19,7 +20,7 @@ class TestIntegration:
             client = DiscordClient()
             
             assert client.provider_manager is not None
-            assert isinstance(client.conversation_histories, dict)
+            assert isinstance(client.conversation_histories, ConversationStore)
             assert client.max_message_length == 2000
             assert client.conversation_limit == 20
             assert client.trim_size == 8
@@ -61,3 +62,71 @@ class TestIntegration:
             assert client.is_admin(123) is True
             assert client.is_admin(456) is True
             assert client.is_admin(789) is False
+    
+    @pytest.mark.asyncio
+    async def test_streaming_message_flow(self):
+        """Test streamed tokens reach the sink and history"""
+        client = DiscordClient()
+        
+        async def fake_stream(messages, persona=None, **kwargs):
+            for token in ["Test", " AI", " response"]:
+                yield token
+        
+        sink = Mock()
+        sink.write = AsyncMock()
+        sink.finish = AsyncMock(return_value="Test AI response")
+        
+        with patch.object(client.provider_manager, 'stream_response', new=fake_stream):
+            response = await client.handle_message_stream("Hello", 12345, sink)
+        
+        assert response == "Test AI response"
+        assert sink.write.await_count == 3
+        assert client.conversation_histories[12345][-1]["content"] == "Test AI response"
+
+    @pytest.mark.asyncio
+    async def test_empty_stream_answers_with_error_and_keeps_history_clean(self):
+        """A provider stream without text still replies and records no empty turn"""
+        client = DiscordClient()
+        
+        async def silent(messages, model=None):
+            return
+            yield  # pragma: no cover
+        
+        client.provider_manager.providers[ProviderType.FREE].stream_response = silent
+        written = []
+        sink = Mock()
+        sink.write = AsyncMock(side_effect=written.append)
+        sink.finish = AsyncMock(side_effect=lambda: "".join(written))
+        
+        response = await client.handle_message_stream("oi", 12345, sink)
+        
+        assert response.startswith("❌")
+        assert client.conversation_histories[12345][-1]["content"] == response
+        client._record_response(12345, "")
+        assert all(m["content"].strip() for m in client.conversation_histories[12345])
+
+    @pytest.mark.asyncio
+    async def test_waiting_turn_keeps_history_when_others_write(self):
+        """A conversation waiting on the provider is not evicted by other users"""
+        import asyncio
+        with patch.dict(os.environ, {"CONVERSATION_MAX_ENTRIES": "2", "CONVERSATION_DEBOUNCE": "0"}):
+            client = DiscordClient()
+        release = asyncio.Event()
+        
+        async def fake_get_response(messages, **kwargs):
+            if messages[-1]["content"] == "A3":
+                await release.wait()
+            return "r:" + messages[-1]["content"]
+        
+        client.provider_manager.get_response = fake_get_response
+        for text in ("A0", "A1", "A2"):
+            await client.handle_message(text, 1)
+        waiting = asyncio.ensure_future(client.handle_message("A3", 1))
+        await asyncio.sleep(0)
+        await client.handle_message("B", 2)
+        await client.handle_message("C", 3)
+        release.set()
+        await waiting
+        
+        contents = [m["content"] for m in client.conversation_histories[1]]
+        assert contents[-2:] == ["A3", "r:A3"] and "A0" in contents
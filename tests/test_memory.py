@@ -0,0 +1,118 @@
+import os
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from src.conversations import ConversationLog, ConversationStore
+from src.history import Message
+from src.memory import SummaryMemory
+from src.providers import ProviderType
+
+
+class FakeManager:
+    current_provider = ProviderType.FREE
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def get_models_for_provider(self, provider):
+        from src.providers import ProviderManager
+        return ProviderManager().get_models_for_provider(provider)
+
+    async def get_response(self, messages, **kwargs):
+        self.calls.append((messages, kwargs))
+        await asyncio.sleep(0)
+        return self.replies.pop(0)
+
+
+def _dropped(*texts):
+    return [Message("user" if i % 2 == 0 else "assistant", t) for i, t in enumerate(texts)]
+
+
+class TestSummaryMemory:
+    @pytest.mark.asyncio
+    async def test_updates_chain_on_previous_summary(self):
+        store = ConversationStore()
+        store.append(1, Message("user", "agora"))
+        manager = FakeManager(["resumo 1", "resumo 2"])
+        memory = SummaryMemory(manager, store, enabled=True, max_tokens=200)
+
+        memory.remember(1, _dropped("meu nome é Ana", "prazer, Ana"))
+        memory.remember(1, _dropped("gosto de chá", "anotado"))
+        await memory.aclose()
+
+        assert store.summary(1) == "resumo 2"
+        first, second = manager.calls
+        assert "(vazio)" in first[0][1]["content"] and "meu nome é Ana" in first[0][1]["content"]
+        assert "resumo 1" in second[0][1]["content"]
+        # Cheapest model of the provider, with a small fixed budget
+        assert second[1] == {"provider": ProviderType.FREE, "model_name": "gpt-3.5-turbo", "max_tokens": 200}
+        assert memory.stats()["updates"] == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_summary_keeps_previous(self):
+        store = ConversationStore()
+        store.append(1, Message("user", "oi"))
+        store.set_summary(1, "antigo")
+        memory = SummaryMemory(FakeManager(["❌ Erro ao obter resposta da IA. Tente novamente."]), store, enabled=True)
+        memory.remember(1, _dropped("a", "b"))
+        await memory.aclose()
+        assert store.summary(1) == "antigo"
+        assert memory.stats()["failures"] == 1
+
+    @pytest.mark.asyncio
+    async def test_disabled_or_forgotten_does_nothing(self):
+        store = ConversationStore()
+        store.append(1, Message("user", "oi"))
+        manager = FakeManager(["resumo"])
+        SummaryMemory(manager, store).remember(1, _dropped("a"))
+        memory = SummaryMemory(manager, store, enabled=True)
+        memory.remember(1, _dropped("a"))
+        memory.forget(1)
+        await asyncio.sleep(0.01)
+        assert store.summary(1) is None
+
+    @pytest.mark.asyncio
+    async def test_summary_survives_restart(self, tmp_path):
+        path = str(tmp_path / "conversations.db")
+        store = ConversationStore(log=ConversationLog(path))
+        store.append(1, Message("user", "oi"))
+        store.set_summary(1, "Ana gosta de chá")
+        await store.aclose()
+
+        restarted = ConversationStore(log=ConversationLog(path))
+        await restarted.load(1)
+        assert restarted.summary(1) == "Ana gosta de chá"
+        restarted.delete(1)
+        await restarted.aclose()
+        assert await ConversationLog(path).load_summary(1) is None
+
+
+class TestClientMemory:
+    @pytest.mark.asyncio
+    async def test_trimmed_history_is_summarized_and_sent_as_system_message(self):
+        with patch.dict(os.environ, {"MEMORY_SUMMARY_ENABLED": "true", "CONVERSATION_HISTORY_LIMIT": "20",
+                                     "TRIM_CONVERSATION_SIZE": "1", "CONTEXT_TRIM_BLOCK": "1"}):
+            from src.aclient import DiscordClient
+            client = DiscordClient()
+        sent = []
+
+        async def fake_get_response(messages, **kwargs):
+            sent.append(messages)
+            if messages[0]["content"].startswith("Você mantém a memória"):
+                return "usuário se chama Ana"
+            return "ok"
+
+        client.provider_manager.get_response = fake_get_response
+        await client.handle_message("meu nome é Ana", 3)
+        await client.handle_message("tudo bem?", 3)
+        await client.memory.aclose()
+        await client.handle_message("como me chamo?", 3)
+
+        summarized = next(m for m in sent if m[0]["content"].startswith("Você mantém a memória"))
+        assert "meu nome é Ana" in summarized[1]["content"]
+        assert client.conversation_histories.summary(3) == "usuário se chama Ana"
+        last = sent[-1]
+        assert last[1]["role"] == "system" and "usuário se chama Ana" in last[1]["content"]
+        assert [m["role"] for m in last].count("system") == 2
@@ -32,3 +32,51 @@ async def test_split_multiple_blocks():
     await send_split_message(channel, text, 10)
     # Several chunks expected
     assert channel.send.await_count >= 3
+
+
+class _FakeMessage:
+    def __init__(self, content):
+        self.content = content
+        self.edits = 0
+
+    async def edit(self, content):
+        self.content = content
+        self.edits += 1
+
+
+def _fake_send(sent):
+    async def send(content):
+        msg = _FakeMessage(content)
+        sent.append(msg)
+        return msg
+    return send
+
+
+@pytest.mark.asyncio
+async def test_stream_sink_coalesces_edits():
+    from utils.message_utils import StreamSink
+    sent = []
+    sink = StreamSink(_fake_send(sent), char_limit=2000, edit_interval=60)
+    for token in ["Olá", " mundo", "!", " Tudo", " bem?"]:
+        await sink.write(token)
+    result = await sink.finish()
+
+    assert result == "Olá mundo! Tudo bem?"
+    # First token is shown immediately, the rest lands in one final edit
+    assert len(sent) == 1
+    assert sent[0].edits == 1
+    assert sent[0].content == result
+
+
+@pytest.mark.asyncio
+async def test_stream_sink_rolls_over_at_limit():
+    from utils.message_utils import StreamSink
+    sent = []
+    sink = StreamSink(_fake_send(sent), char_limit=50, edit_interval=0)
+    for _ in range(30):
+        await sink.write("palavra ")
+    result = await sink.finish()
+
+    assert len(sent) >= 5
+    assert all(len(m.content) <= 50 for m in sent)
+    assert "".join(m.content for m in sent) == result
@@ -24,9 +24,9 @@ class TestProviderManagerFree:
         # Force FREE provider
         manager.set_current_provider(ProviderType.FREE)
         # Stub free response to avoid network
-        async def fake_free(messages):
+        async def fake_free(messages, model=None, deadline=None):
             return "Test response"
-        monkeypatch.setattr(manager, "_get_free_response", fake_free)
+        monkeypatch.setattr(manager.providers[ProviderType.FREE], "get_response", fake_free)
         resp = await manager.get_response([{"role": "user", "content": "Hi"}])
         assert resp == "Test response"
     
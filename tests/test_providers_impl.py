@@ -1,4 +1,5 @@
 import os
+import asyncio
 import types
 import pytest
 from unittest.mock import patch
@@ -6,20 +7,20 @@ from unittest.mock import patch
 
 @pytest.mark.asyncio
 async def test_openai_response_success(monkeypatch):
-    from src.providers import ProviderManager
+    from src.providers import ProviderManager, ProviderType
 
     # Fake openai module
     mod = types.SimpleNamespace()
     async def create(**kwargs):
         return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content='OK'))])
-    mod.AsyncClient = lambda api_key=None: types.SimpleNamespace(
+    mod.AsyncClient = lambda api_key=None, **kwargs: types.SimpleNamespace(
         chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
     )
 
     with patch.dict(os.environ, {"OPENAI_KEY": "k"}, clear=False), \
          patch.dict('sys.modules', {'openai': mod}):
         pm = ProviderManager()
-        out = await pm._get_openai_response([
+        out = await pm.providers[ProviderType.OPENAI].get_response([
             {"role":"user","content":"hi"}
         ])
         assert out == 'OK'
@@ -27,25 +28,25 @@ async def test_openai_response_success(monkeypatch):
 
 @pytest.mark.asyncio
 async def test_openai_missing_key():
-    from src.providers import ProviderManager
+    from src.providers import ProviderManager, ProviderType
     with patch.dict(os.environ, {}, clear=True):
         pm = ProviderManager()
-        out = await pm._get_openai_response([])
+        out = await pm.providers[ProviderType.OPENAI].get_response([])
     assert 'OpenAI' in out or 'Openai' in out
 
 
 @pytest.mark.asyncio
 async def test_claude_response_success(monkeypatch):
-    from src.providers import ProviderManager
+    from src.providers import ProviderManager, ProviderType
     mod = types.SimpleNamespace()
     async def create(**kwargs):
         return types.SimpleNamespace(content=[types.SimpleNamespace(text='CLAUDE')])
-    mod.AsyncClient = lambda api_key=None: types.SimpleNamespace(messages=types.SimpleNamespace(create=create))
+    mod.AsyncClient = lambda api_key=None, **kwargs: types.SimpleNamespace(messages=types.SimpleNamespace(create=create))
 
     with patch.dict(os.environ, {"CLAUDE_KEY": "k"}, clear=False), \
          patch.dict('sys.modules', {'anthropic': mod}):
         pm = ProviderManager()
-        out = await pm._get_claude_response([
+        out = await pm.providers[ProviderType.CLAUDE].get_response([
             {"role":"system","content":"s"}, {"role":"user","content":"u"}
         ])
         assert out == 'CLAUDE'
@@ -53,13 +54,13 @@ async def test_claude_response_success(monkeypatch):
 
 @pytest.mark.asyncio
 async def test_gemini_response_success(monkeypatch):
-    from src.providers import ProviderManager
+    from src.providers import ProviderManager, ProviderType
 
     # Fake google.generativeai
     class FakeModel:
-        def __init__(self, name):
+        def __init__(self, name, **kwargs):
             self.name = name
-        async def generate_content_async(self, prompt):
+        async def generate_content_async(self, prompt, **kwargs):
             return types.SimpleNamespace(text='GEMINI')
     fake_genai = types.SimpleNamespace(
         configure=lambda api_key=None: None,
@@ -69,26 +70,26 @@ async def test_gemini_response_success(monkeypatch):
     with patch.dict(os.environ, {"GEMINI_KEY": "k"}, clear=False), \
          patch.dict('sys.modules', {'google.generativeai': fake_genai}):
         pm = ProviderManager()
-        out = await pm._get_gemini_response([
+        out = await pm.providers[ProviderType.GEMINI].get_response([
             {"role":"user","content":"u"}
         ])
         assert out == 'GEMINI'
 
 
 @pytest.mark.asyncio
-async def test_grok_fallback(monkeypatch):
-    from src.providers import ProviderManager
+async def test_grok_missing_key(monkeypatch):
+    from src.providers import ProviderManager, ProviderType
+    monkeypatch.delenv("GROK_KEY", raising=False)
     pm = ProviderManager()
-    # ensure fallback path returns string
-    out = await pm._get_grok_response([
+    out = await pm.providers[ProviderType.GROK].get_response([
         {"role":"user","content":"u"}
     ])
-    assert isinstance(out, str)
+    assert isinstance(out, str) and 'Grok' in out
 
 
 @pytest.mark.asyncio
 async def test_openai_response_exception(monkeypatch):
-    from src.providers import ProviderManager
+    from src.providers import ProviderManager, ProviderType
     # Fake openai raising exception
     class BadClient:
         class chat:
@@ -96,9 +97,388 @@ async def test_openai_response_exception(monkeypatch):
                 @staticmethod
                 async def create(**kwargs):
                     raise RuntimeError('boom')
-    mod = types.SimpleNamespace(AsyncClient=lambda api_key=None: BadClient)
+    mod = types.SimpleNamespace(AsyncClient=lambda api_key=None, **kwargs: BadClient)
     with patch.dict(os.environ, {"OPENAI_KEY": "k"}, clear=True), \
          patch.dict('sys.modules', {'openai': mod}):
         pm = ProviderManager()
-        out = await pm._get_openai_response([{"role":"user","content":"hi"}])
+        out = await pm.providers[ProviderType.OPENAI].get_response([{"role":"user","content":"hi"}])
         assert 'Erro' in out or 'erro' in out
+
+
+def _fake_g4f(delay, calls):
+    """Build a fake g4f package whose async client sleeps for ``delay``"""
+    import asyncio
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(delay)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content='FREE'))])
+
+    client_mod = types.SimpleNamespace(AsyncClient=lambda: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+    ))
+    return {'g4f': types.SimpleNamespace(client=client_mod), 'g4f.client': client_mod}
+
+
+@pytest.mark.asyncio
+async def test_free_requests_overlap():
+    import asyncio
+    import time
+    from src.providers import ProviderManager, ProviderType
+
+    calls = []
+    with patch.dict('sys.modules', _fake_g4f(0.2, calls)):
+        pm = ProviderManager()
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            pm.providers[ProviderType.FREE].get_response([{"role": "user", "content": str(i)}]) for i in range(5)
+        ])
+        elapsed = time.perf_counter() - start
+
+    assert results == ['FREE'] * 5
+    # Sequential execution would take ~1s
+    assert elapsed < 0.6
+    assert pm.free_metrics["completed"] == 5
+    assert pm.free_metrics["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_free_concurrency_limit_queues_requests():
+    import asyncio
+    from src.providers import ProviderManager, ProviderType
+
+    calls = []
+    with patch.dict(os.environ, {"FREE_PROVIDER_MAX_CONCURRENCY": "2"}), \
+         patch.dict('sys.modules', _fake_g4f(0.05, calls)):
+        pm = ProviderManager()
+        await asyncio.gather(*[
+            pm.providers[ProviderType.FREE].get_response([{"role": "user", "content": str(i)}]) for i in range(6)
+        ])
+
+    assert pm.free_metrics["max_waiting"] >= 4
+    assert pm.free_metrics["waiting"] == 0
+
+
+@pytest.mark.asyncio
+async def test_free_transient_errors_use_shared_retry():
+    from src.providers import ProviderManager, ProviderType
+
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise ConnectionResetError("reset")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content='FREE'))])
+
+    client_mod = types.SimpleNamespace(AsyncClient=lambda: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))))
+    with patch.dict(os.environ, {"RETRY_BASE_DELAY": "0"}), \
+         patch.dict('sys.modules', {'g4f': types.SimpleNamespace(client=client_mod), 'g4f.client': client_mod}):
+        pm = ProviderManager()
+        assert await pm.providers[ProviderType.FREE].get_response([{"role": "user", "content": "oi"}]) == 'FREE'
+
+    assert len(calls) == 2
+    assert pm.retry_policy.stats()["retries"]["Free"] == 1
+    assert pm.free_metrics["in_flight"] == 0
+
+
+async def _collect(agen):
+    return [token async for token in agen]
+
+
+@pytest.mark.asyncio
+async def test_openai_stream_yields_tokens():
+    from src.providers import ProviderManager, ProviderType
+
+    async def stream():
+        for piece in ["O", "K", "!"]:
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=piece))])
+
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        return stream()
+
+    mod = types.SimpleNamespace(AsyncClient=lambda api_key=None, **kwargs: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+    ))
+    with patch.dict(os.environ, {"OPENAI_KEY": "k"}, clear=False), \
+         patch.dict('sys.modules', {'openai': mod}):
+        pm = ProviderManager()
+        pm.set_current_provider(ProviderType.OPENAI)
+        tokens = await _collect(pm.stream_response([{"role": "user", "content": "hi"}]))
+
+    assert tokens == ["O", "K", "!"]
+
+
+@pytest.mark.asyncio
+async def test_openai_stream_is_admitted_retried_and_tracked_by_breaker():
+    from src.providers import ProviderManager, ProviderType
+
+    in_stream = []
+    opened = []
+
+    async def stream():
+        for piece in ["O", "K"]:
+            in_stream.append(pm.limiters[(ProviderType.OPENAI, "k")].in_flight)
+            await asyncio.sleep(0.01)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=piece))])
+
+    async def create(**kwargs):
+        opened.append(kwargs["model"])
+        if len(opened) == 1:
+            raise ConnectionResetError("reset")
+        return stream()
+
+    mod = types.SimpleNamespace(AsyncClient=lambda api_key=None, **kwargs: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+    ))
+    with patch.dict(os.environ, {"OPENAI_KEY": "k", "OPENAI_MAX_CONCURRENCY": "1", "RETRY_BASE_DELAY": "0"},
+                    clear=False), \
+         patch.dict('sys.modules', {'openai': mod}):
+        pm = ProviderManager()
+        pm.set_current_provider(ProviderType.OPENAI)
+        messages = [{"role": "user", "content": "hi"}]
+        first, second = await asyncio.gather(_collect(pm.stream_response(messages)),
+                                             _collect(pm.stream_response(messages)))
+
+    assert first == second == ["O", "K"]
+    # The failed open was retried, and both streams held the single slot in turn
+    assert len(opened) == 3
+    assert in_stream == [1, 1, 1, 1]
+    assert pm.limiters[(ProviderType.OPENAI, "k")].in_flight == 0
+    assert len(pm.latency[ProviderType.OPENAI]) == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_failure_counts_against_breaker():
+    from src.providers import ProviderManager, ProviderType
+
+    with patch.dict(os.environ, {"CIRCUIT_MIN_CALLS": "2", "CIRCUIT_COOLDOWN": "60"}):
+        pm = ProviderManager()
+
+    async def broken(messages, model=None):
+        yield "meia "
+        raise ConnectionResetError("reset")
+
+    pm.providers[ProviderType.FREE].stream_response = broken
+    for _ in range(2):
+        assert await _collect(pm.stream_response([{"role": "user", "content": "hi"}])) == ["meia "]
+    tokens = await _collect(pm.stream_response([{"role": "user", "content": "hi"}]))
+    assert pm.breakers[ProviderType.FREE].state.value == "open"
+    assert "indisponível" in tokens[0]
+
+
+@pytest.mark.asyncio
+async def test_stream_error_before_first_token_yields_message():
+    from src.providers import ProviderManager, ProviderType
+
+    pm = ProviderManager()
+
+    async def broken(messages):
+        raise RuntimeError("boom")
+        yield  # pragma: no cover
+
+    pm.providers[ProviderType.FREE].stream_response = broken
+    tokens = await _collect(pm.stream_response([{"role": "user", "content": "hi"}]))
+    assert len(tokens) == 1 and "Erro" in tokens[0]
+
+
+@pytest.mark.asyncio
+async def test_grok_against_local_stand_in_server():
+    from aiohttp import web
+    from src.providers import ProviderManager, ProviderType
+
+    received = []
+
+    async def completions(request):
+        body = await request.json()
+        received.append((request.headers.get("Authorization"), body))
+        return web.json_response({
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "GROK"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    try:
+        env = {"GROK_KEY": "xai-test", "GROK_BASE_URL": f"http://127.0.0.1:{port}/v1"}
+        with patch.dict(os.environ, env, clear=False):
+            pm = ProviderManager()
+            pm.set_current_provider(ProviderType.GROK)
+            first = await pm.providers[ProviderType.GROK].get_response([{"role": "user", "content": "oi"}])
+            second = await pm.providers[ProviderType.GROK].get_response([{"role": "user", "content": "de novo"}])
+            await pm.aclose()
+    finally:
+        await runner.cleanup()
+
+    assert first == second == "GROK"
+    assert received[0][0] == "Bearer xai-test"
+    assert received[0][1]["model"] == "grok-beta"
+    # One pooled client served both requests
+    assert len(received) == 2
+
+
+@pytest.mark.asyncio
+async def test_gemini_model_cached_with_native_contents():
+    from src.providers import ProviderManager, ProviderType
+
+    built = []
+    configured = []
+    seen = []
+
+    class FakeModel:
+        def __init__(self, name, system_instruction=None):
+            built.append((name, system_instruction))
+        async def generate_content_async(self, contents, **kwargs):
+            seen.append(contents)
+            return types.SimpleNamespace(text='GEMINI')
+
+    fake_genai = types.SimpleNamespace(
+        configure=lambda api_key=None: configured.append(api_key),
+        GenerativeModel=FakeModel
+    )
+    messages = [
+        {"role": "system", "content": "persona"},
+        {"role": "user", "content": "oi"},
+        {"role": "assistant", "content": "olá"},
+        {"role": "user", "content": "tudo bem?"},
+    ]
+
+    with patch.dict(os.environ, {"GEMINI_KEY": "k"}, clear=False), \
+         patch.dict('sys.modules', {'google.generativeai': fake_genai}):
+        pm = ProviderManager()
+        for _ in range(3):
+            assert await pm.providers[ProviderType.GEMINI].get_response(messages, "gemini-pro") == 'GEMINI'
+
+    assert configured == ["k"]
+    assert built == [("gemini-pro", "persona")]
+    assert seen[0] == [
+        {"role": "user", "parts": ["oi"]},
+        {"role": "model", "parts": ["olá"]},
+        {"role": "user", "parts": ["tudo bem?"]},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_claude_marks_persona_and_history_prefix_cacheable():
+    from src.providers import ProviderManager, ProviderType
+
+    sent = {}
+
+    async def create(**kwargs):
+        sent.update(kwargs)
+        usage = types.SimpleNamespace(input_tokens=20, output_tokens=5, cache_read_input_tokens=1500,
+                                      cache_creation_input_tokens=0)
+        return types.SimpleNamespace(content=[types.SimpleNamespace(text='CLAUDE')], usage=usage)
+
+    mod = types.SimpleNamespace(AsyncClient=lambda api_key=None, **kwargs: types.SimpleNamespace(
+        messages=types.SimpleNamespace(create=create)))
+    history = [
+        {"role": "system", "content": "persona"},
+        {"role": "user", "content": "u1"},
+        {"role": "assistant", "content": "a1"},
+        {"role": "user", "content": "u2"},
+    ]
+    with patch.dict(os.environ, {"CLAUDE_KEY": "k"}, clear=False), \
+         patch.dict('sys.modules', {'anthropic': mod}):
+        pm = ProviderManager()
+        assert await pm.providers[ProviderType.CLAUDE].get_response(history, "claude-3-haiku") == 'CLAUDE'
+
+    assert sent["system"] == [{"type": "text", "text": "persona", "cache_control": {"type": "ephemeral"}}]
+    assert sent["messages"][0] == {"role": "user", "content": "u1"}
+    assert sent["messages"][1]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert sent["messages"][2] == {"role": "user", "content": "u2"}
+    # The caller's history is not modified
+    assert history[2] == {"role": "assistant", "content": "a1"}
+    assert pm.get_provider_status()["usage"]["cached_tokens"] == 1500
+    await pm.aclose()
+
+
+def test_claude_summary_follows_persona_breakpoint():
+    from src.providers import ProviderManager, ProviderType
+
+    pm = ProviderManager()
+    pm.prompt_caching = True
+    system, turns = pm.providers[ProviderType.CLAUDE].convert_messages([
+        {"role": "system", "content": "persona"},
+        {"role": "system", "content": "Resumo da conversa anterior:\nresumo"},
+        {"role": "user", "content": "u1"},
+    ])
+    # The persona block keeps its own breakpoint, so summary updates leave it cached
+    assert system == [
+        {"type": "text", "text": "persona", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "Resumo da conversa anterior:\nresumo"},
+    ]
+    assert turns == [{"role": "user", "content": "u1"}]
+
+
+@pytest.mark.asyncio
+async def test_max_tokens_reaches_sdk_and_cache_key():
+    from src.providers import ProviderManager, ProviderType
+
+    sent = []
+
+    async def create(**kwargs):
+        sent.append(kwargs["max_tokens"])
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content='OK'))])
+
+    mod = types.SimpleNamespace(AsyncClient=lambda api_key=None, **kwargs: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))))
+    with patch.dict(os.environ, {"OPENAI_KEY": "k", "RESPONSE_CACHE_ENABLED": "true"}, clear=False), \
+         patch.dict('sys.modules', {'openai': mod}):
+        pm = ProviderManager()
+        pm.available_providers = [ProviderType.OPENAI]
+        pm.set_current_provider(ProviderType.OPENAI)
+        messages = [{"role": "user", "content": "oi"}]
+        assert await pm.get_response(messages, max_tokens=300) == 'OK'
+        assert await pm.get_response(messages, max_tokens=300) == 'OK'
+        assert await pm.get_response(messages) == 'OK'
+        await pm.aclose()
+
+    # The second call is a cache hit; another budget is a different entry
+    assert sent == [300, 2000]
+
+
+@pytest.mark.asyncio
+async def test_reply_budget_is_clamped_to_model_window():
+    from src.providers import ProviderManager, ProviderType
+    from src.tokens import estimate_messages_tokens
+
+    sent = []
+
+    async def create(**kwargs):
+        sent.append(kwargs["max_tokens"])
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content='OK'))])
+
+    mod = types.SimpleNamespace(AsyncClient=lambda api_key=None, **kwargs: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))))
+    with patch.dict(os.environ, {"OPENAI_KEY": "k", "RESPONSE_CACHE_ENABLED": "false"}, clear=False), \
+         patch.dict('sys.modules', {'openai': mod}):
+        pm = ProviderManager()
+        pm.available_providers = [ProviderType.OPENAI]
+        pm.set_current_provider(ProviderType.OPENAI)
+        pm.set_current_model("gpt-3.5-turbo")
+        messages = [{"role": "user", "content": "palavra " * 2000}]
+        assert await pm.get_response(messages, max_tokens=4000) == 'OK'
+        assert await pm.get_response([{"role": "user", "content": "oi"}], max_tokens=300) == 'OK'
+        await pm.aclose()
+
+    # Long-form budget shrinks so prompt + reply fit gpt-3.5-turbo's 4096 window
+    assert estimate_messages_tokens(messages) + sent[0] <= 4096
+    assert sent[0] < 4000
+    assert sent[1] == 300
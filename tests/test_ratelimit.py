@@ -0,0 +1,93 @@
+import os
+import time
+import types
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from src.ratelimit import TokenBucket, ProviderLimiter, _parse_duration
+
+
+class TestParsing:
+    def test_parse_duration_formats(self):
+        assert _parse_duration("12") == 12.0
+        assert _parse_duration("6m0s") == 360.0
+        assert _parse_duration("250ms") == 0.25
+        assert _parse_duration("soon") is None
+
+
+class TestTokenBucket:
+    @pytest.mark.asyncio
+    async def test_waits_when_empty(self):
+        bucket = TokenBucket(rate_per_minute=600)  # 10 per second
+        bucket.tokens = 0
+        start = time.perf_counter()
+        await bucket.acquire(1)
+        assert time.perf_counter() - start >= 0.08
+
+    @pytest.mark.asyncio
+    async def test_disabled_bucket_never_waits(self):
+        bucket = TokenBucket(rate_per_minute=0)
+        for _ in range(100):
+            await bucket.acquire(1)
+
+    @pytest.mark.asyncio
+    async def test_block_for_delays_callers(self):
+        bucket = TokenBucket(rate_per_minute=0)
+        bucket.block_for(0.1)
+        start = time.perf_counter()
+        await bucket.acquire(1)
+        assert time.perf_counter() - start >= 0.09
+
+
+class TestProviderLimiter:
+    @pytest.mark.asyncio
+    async def test_concurrency_limit_and_queue_metrics(self):
+        limiter = ProviderLimiter("test", max_concurrency=2, rpm=0, tpm=0)
+        peak = 0
+
+        async def job():
+            nonlocal peak
+            async with limiter.admit():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(*[job() for _ in range(6)])
+        assert peak == 2
+        assert limiter.stats()["queue_wait_p95"] > 0
+
+    def test_apply_headers(self):
+        limiter = ProviderLimiter("test", max_concurrency=1, rpm=0, tpm=0)
+        limiter.apply_headers({"Retry-After": "2", "x-ratelimit-limit-requests": "500"})
+        assert limiter.throttled == 1
+        assert limiter.requests.rate_per_minute == 500
+
+
+@pytest.mark.asyncio
+async def test_openai_429_is_requeued_not_failed():
+    from src.providers import ProviderManager, ProviderType
+
+    attempts = []
+
+    async def create(**kwargs):
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            error = RuntimeError("rate limited")
+            error.status_code = 429
+            error.response = types.SimpleNamespace(status_code=429, headers={"retry-after": "0.05"})
+            raise error
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content='OK'))])
+
+    mod = types.SimpleNamespace(AsyncClient=lambda api_key=None, **kwargs: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+    ))
+    with patch.dict(os.environ, {"OPENAI_KEY": "sk-test"}, clear=False), \
+         patch.dict('sys.modules', {'openai': mod}):
+        pm = ProviderManager()
+        out = await pm.providers[ProviderType.OPENAI].get_response([{"role": "user", "content": "hi"}])
+
+    assert out == 'OK'
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.04
+    stats = pm.get_provider_status()["rate_limits"]
+    assert list(stats.values())[0]["throttled"] == 1
@@ -0,0 +1,229 @@
+import os
+import types
+import pytest
+from unittest.mock import patch
+
+from src.resilience import CircuitBreaker, CircuitState, ErrorKind, RetryPolicy, classify_error
+
+
+def _breaker(**env):
+    values = {"CIRCUIT_MIN_CALLS": "4", "CIRCUIT_ERROR_RATE": "0.5", "CIRCUIT_COOLDOWN": "0"}
+    values.update(env)
+    with patch.dict(os.environ, values):
+        return CircuitBreaker("test")
+
+
+class TestCircuitBreaker:
+    def test_opens_on_error_rate(self):
+        breaker = _breaker(CIRCUIT_COOLDOWN="60")
+        breaker.record_success(0.1)
+        breaker.record_success(0.1)
+        breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.allow_request() is False
+
+    def test_slow_calls_count_as_bad(self):
+        breaker = _breaker(CIRCUIT_SLOW_CALL_SECONDS="1", CIRCUIT_COOLDOWN="60")
+        for _ in range(4):
+            breaker.record_success(5.0)
+        assert breaker.state == CircuitState.OPEN
+
+    def test_half_open_allows_single_probe(self):
+        breaker = _breaker()
+        for _ in range(4):
+            breaker.record_failure()
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.allow_request() is True
+        assert breaker.allow_request() is False
+        breaker.record_success(0.1)
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_half_open_failure_reopens(self):
+        breaker = _breaker()
+        for _ in range(4):
+            breaker.record_failure()
+        assert breaker.allow_request() is True
+        breaker.cooldown = 60
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.times_opened == 2
+
+
+class TestFallbackChain:
+    def test_parse_provider_list(self):
+        from src.providers import ProviderManager, ProviderType
+        parsed = ProviderManager._parse_provider_list("Claude, openai,bogus,FREE,claude")
+        assert parsed == [ProviderType.CLAUDE, ProviderType.OPENAI, ProviderType.FREE]
+
+    @pytest.mark.asyncio
+    async def test_falls_back_and_skips_open_circuit(self, monkeypatch):
+        from src.providers import ProviderManager, ProviderType
+
+        env = {"CLAUDE_KEY": "k", "OPENAI_KEY": "k", "PROVIDER_FALLBACK_CHAIN": "claude,openai,free",
+               "RESPONSE_CACHE_ENABLED": "False", "CIRCUIT_MIN_CALLS": "2", "CIRCUIT_COOLDOWN": "60"}
+        with patch.dict(os.environ, env):
+            pm = ProviderManager()
+        pm.set_current_provider(ProviderType.CLAUDE)
+
+        calls = []
+
+        async def broken_claude(messages, model=None, deadline=None):
+            calls.append("claude")
+            raise ConnectionResetError("reset")
+
+        async def openai_ok(messages, model=None, deadline=None):
+            calls.append("openai")
+            return "openai"
+
+        monkeypatch.setattr(pm.providers[ProviderType.CLAUDE], "get_response", broken_claude)
+        monkeypatch.setattr(pm.providers[ProviderType.OPENAI], "get_response", openai_ok)
+
+        for _ in range(3):
+            assert await pm.get_response([{"role": "user", "content": "oi"}]) == "openai"
+
+        # Claude's circuit opened after two failures; the third request skipped it
+        assert calls.count("claude") == 2
+        assert pm.get_provider_status()["breakers"]["Claude"] == "open"
+
+    @pytest.mark.asyncio
+    async def test_request_errors_do_not_open_circuit(self, monkeypatch):
+        from src.providers import ProviderManager, ProviderType
+
+        with patch.dict(os.environ, {"CLAUDE_KEY": "k", "RESPONSE_CACHE_ENABLED": "False",
+                                     "CIRCUIT_MIN_CALLS": "2", "CIRCUIT_COOLDOWN": "60"}):
+            pm = ProviderManager()
+        pm.set_current_provider(ProviderType.CLAUDE)
+
+        async def rejected(messages, model=None, deadline=None):
+            raise _status_error(400)
+
+        monkeypatch.setattr(pm.providers[ProviderType.CLAUDE], "get_response", rejected)
+        for _ in range(4):
+            assert (await pm.get_response([{"role": "user", "content": "oi"}])).startswith("❌")
+        assert pm.get_provider_status()["breakers"]["Claude"] == "closed"
+
+    @pytest.mark.asyncio
+    async def test_sdk_error_kind_reaches_breaker(self):
+        from src.providers import ProviderManager, ProviderType
+
+        status = {"code": 401}
+
+        async def create(**kwargs):
+            raise _status_error(status["code"])
+
+        mod = types.SimpleNamespace(AsyncClient=lambda api_key=None, **kwargs: types.SimpleNamespace(
+            chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))))
+        env = {"OPENAI_KEY": "k", "RESPONSE_CACHE_ENABLED": "False", "CIRCUIT_MIN_CALLS": "2",
+               "CIRCUIT_COOLDOWN": "60", "RETRY_MAX_ATTEMPTS": "1"}
+        with patch.dict(os.environ, env), patch.dict("sys.modules", {"openai": mod}):
+            pm = ProviderManager()
+            pm.available_providers = [ProviderType.FREE, ProviderType.OPENAI]
+            pm.set_current_provider(ProviderType.OPENAI)
+            messages = [{"role": "user", "content": "oi"}]
+            for _ in range(3):
+                await pm.get_response(messages)
+            assert pm.breakers[ProviderType.OPENAI].state == CircuitState.CLOSED
+            status["code"] = 503
+            for _ in range(3):
+                await pm.get_response(messages)
+            assert pm.breakers[ProviderType.OPENAI].state == CircuitState.OPEN
+
+    @pytest.mark.asyncio
+    async def test_fallback_reply_is_not_cached(self, monkeypatch):
+        from src.providers import ProviderManager, ProviderType
+
+        env = {"CLAUDE_KEY": "k", "OPENAI_KEY": "k", "PROVIDER_FALLBACK_CHAIN": "openai",
+               "RESPONSE_CACHE_ENABLED": "True", "CIRCUIT_MIN_CALLS": "10"}
+        with patch.dict(os.environ, env):
+            pm = ProviderManager()
+        pm.set_current_provider(ProviderType.CLAUDE)
+        claude_up = False
+
+        async def claude(messages, model=None, deadline=None):
+            return "claude" if claude_up else "❌ Erro ao conectar com Claude."
+
+        async def openai_ok(messages, model=None, deadline=None):
+            return "openai"
+
+        monkeypatch.setattr(pm.providers[ProviderType.CLAUDE], "get_response", claude)
+        monkeypatch.setattr(pm.providers[ProviderType.OPENAI], "get_response", openai_ok)
+
+        messages = [{"role": "user", "content": "oi"}]
+        assert await pm.get_response(messages) == "openai"
+        claude_up = True
+        assert await pm.get_response(messages) == "claude"
+        assert await pm.get_response(messages) == "claude"
+        assert pm.cache.stats()["hits"] == 1
+
+    def test_fallback_chain_is_opt_in(self):
+        from src.providers import ProviderManager, ProviderType
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("PROVIDER_FALLBACK_CHAIN", None)
+            assert ProviderManager().fallback_chain == []
+
+
+def _status_error(status):
+    error = RuntimeError(f"HTTP {status}")
+    error.status_code = status
+    return error
+
+
+class TestRetryPolicy:
+    def test_classify_error(self):
+        assert classify_error(_status_error(503)) == ErrorKind.SERVER
+        assert classify_error(_status_error(429)) == ErrorKind.RATE_LIMIT
+        from_response = RuntimeError("429")
+        from_response.response = types.SimpleNamespace(status_code=429, headers={})
+        assert classify_error(from_response) == ErrorKind.RATE_LIMIT
+        assert classify_error(_status_error(401)) == ErrorKind.AUTH
+        assert classify_error(_status_error(400)) == ErrorKind.BAD_REQUEST
+        assert classify_error(TimeoutError()) == ErrorKind.TIMEOUT
+        assert classify_error(ConnectionResetError()) == ErrorKind.CONNECTION
+        assert classify_error(ValueError("boom")) == ErrorKind.UNKNOWN
+
+    def test_backoff_is_capped_and_jittered(self):
+        with patch.dict(os.environ, {"RETRY_BASE_DELAY": "1", "RETRY_MAX_DELAY": "4"}):
+            policy = RetryPolicy()
+        delays = [policy.backoff(10) for _ in range(50)]
+        assert all(0 <= d <= 4 for d in delays)
+        assert len(set(delays)) > 1
+
+    def test_should_retry(self):
+        with patch.dict(os.environ, {"RETRY_MAX_ATTEMPTS": "3"}):
+            policy = RetryPolicy()
+        assert policy.should_retry(ErrorKind.SERVER, 0, 0.1)
+        assert not policy.should_retry(ErrorKind.SERVER, 2, 0.1)
+        assert not policy.should_retry(ErrorKind.AUTH, 0, 0.1)
+        assert not policy.should_retry(ErrorKind.TIMEOUT, 0, 1.0, time_left=0.5)
+
+
+def _fake_openai(create):
+    return types.SimpleNamespace(AsyncClient=lambda api_key=None, **kwargs: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+    ))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status, expected_calls, ok", [(503, 2, True), (401, 1, False)])
+async def test_provider_retries_only_transient_errors(status, expected_calls, ok):
+    from src.providers import ProviderManager, ProviderType
+
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise _status_error(status)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="OK"))])
+
+    env = {"OPENAI_KEY": "sk-test", "RETRY_BASE_DELAY": "0.01"}
+    with patch.dict(os.environ, env), patch.dict('sys.modules', {'openai': _fake_openai(create)}):
+        pm = ProviderManager()
+        out = await pm.providers[ProviderType.OPENAI].get_response([{"role": "user", "content": "hi"}])
+
+    assert len(calls) == expected_calls
+    assert (out == "OK") is ok
+    retries = pm.get_provider_status()["retries"]["retries"]
+    assert retries.get("OpenAI", 0) == expected_calls - 1
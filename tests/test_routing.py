@@ -0,0 +1,77 @@
+import os
+import pytest
+from unittest.mock import patch
+
+from src.providers import ModelInfo, ProviderType
+from src.routing import ComplexityRouter
+
+CLAUDE_MODELS = [
+    ModelInfo("claude-3-haiku", ProviderType.CLAUDE, 200000, 0.0025),
+    ModelInfo("claude-3-sonnet", ProviderType.CLAUDE, 200000, 0.015),
+    ModelInfo("claude-3-opus", ProviderType.CLAUDE, 200000, 0.075),
+]
+
+
+def _router(**env):
+    values = {"MODEL_ROUTING_ENABLED": "true", "ROUTING_SIMPLE_TOKENS": "50", "ROUTING_COMPLEX_TOKENS": "500"}
+    values.update(env)
+    with patch.dict(os.environ, values):
+        return ComplexityRouter()
+
+
+def _ask(text):
+    return [{"role": "system", "content": "persona"}, {"role": "user", "content": text}]
+
+
+class TestComplexityRouter:
+    def test_short_prompt_gets_cheapest_model(self):
+        router = _router()
+        assert router.route("Claude", CLAUDE_MODELS, _ask("oi")).name == "claude-3-haiku"
+        assert router.decisions[-1].reasons == ["simple"]
+
+    def test_code_and_length_escalate(self):
+        router = _router()
+        code = "Por que isto falha?\n```python\nprint(1/0)\n```"
+        assert router.route("Claude", CLAUDE_MODELS, _ask(code)).name == "claude-3-sonnet"
+        long_code = code + " explique em detalhes" * 400
+        assert router.route("Claude", CLAUDE_MODELS, _ask(long_code)).name == "claude-3-opus"
+        assert router.stats()["by_model"] == {"claude-3-sonnet": 1, "claude-3-opus": 1}
+
+    def test_persona_counts_as_complexity(self):
+        router = _router(ROUTING_COMPLEX_PERSONAS="analyst,teacher")
+        assert router.route("Claude", CLAUDE_MODELS, _ask("oi"), persona="teacher").name == "claude-3-sonnet"
+
+    def test_escalates_when_prompt_does_not_fit(self):
+        router = _router()
+        models = [
+            ModelInfo("gpt-3.5-turbo", ProviderType.OPENAI, 4096, 0.002),
+            ModelInfo("gpt-4-turbo", ProviderType.OPENAI, 128000, 0.01),
+        ]
+        history = [{"role": "user", "content": "x" * 20000}] + _ask("oi")[1:]
+        model = router.route("OpenAI", models, history, reply_tokens=2000)
+        assert model.name == "gpt-4-turbo"
+        assert "context" in router.decisions[-1].reasons
+
+
+@pytest.mark.asyncio
+async def test_manager_routes_requests_when_enabled(monkeypatch):
+    from src.providers import ProviderManager, ProviderType
+
+    env = {"CLAUDE_KEY": "k", "MODEL_ROUTING_ENABLED": "true", "ROUTING_SIMPLE_TOKENS": "50",
+           "RESPONSE_CACHE_ENABLED": "False"}
+    with patch.dict(os.environ, env):
+        pm = ProviderManager()
+    pm.set_current_provider(ProviderType.CLAUDE)
+
+    used = []
+
+    async def claude(messages, model=None, deadline=None):
+        used.append(model)
+        return "ok"
+
+    monkeypatch.setattr(pm.providers[ProviderType.CLAUDE], "get_response", claude)
+    await pm.get_response(_ask("oi"))
+    await pm.get_response(_ask("```sql\nSELECT 1\n```"), persona="analyst")
+
+    assert used == ["claude-3-haiku", "claude-3-opus"]
+    assert pm.get_provider_status()["routing"]["by_model"] == {"claude-3-haiku": 1, "claude-3-opus": 1}
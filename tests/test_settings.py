@@ -0,0 +1,80 @@
+import os
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from src.providers import ProviderManager, ProviderType
+from src.settings import ScopedSettings, SettingsStore
+
+
+class TestSettingsStore:
+    @pytest.mark.asyncio
+    async def test_user_over_channel_over_guild(self, tmp_path):
+        store = SettingsStore(str(tmp_path / "settings.db"))
+        await store.set("guild", 1, provider="Claude", persona="analyst")
+        await store.set("channel", 2, persona="creative")
+        await store.set("user", 3, model="claude-3-opus")
+
+        resolved = await store.resolve(user_id=3, channel_id=2, guild_id=1,
+                                       defaults=ScopedSettings(persona="helpful"))
+        assert resolved == ScopedSettings(provider="Claude", model="claude-3-opus", persona="creative")
+        assert (await store.resolve(user_id=4, guild_id=9, defaults=ScopedSettings(persona="helpful"))).persona == "helpful"
+
+    @pytest.mark.asyncio
+    async def test_persisted_and_cached(self, tmp_path):
+        path = str(tmp_path / "settings.db")
+        store = SettingsStore(path)
+        await store.set("user", 7, provider="OpenAI", model="gpt-4")
+        await store.set("user", 7, model=None)
+        store.close()
+
+        reopened = SettingsStore(path)
+        assert await reopened.get("user", 7) == ScopedSettings(provider="OpenAI")
+        await reopened.get("user", 7)
+        await reopened.get("user", 8)
+        await reopened.get("user", 8)
+        assert reopened.stats() == {"hits": 2, "misses": 2, "cached": 2}
+
+        await reopened.clear("user", 7)
+        assert await SettingsStore(path).get("user", 7) is None
+
+    @pytest.mark.asyncio
+    async def test_memory_only_and_unknown_scope(self):
+        store = SettingsStore(None, cache_size=1)
+        await store.set("user", 1, persona="creative")
+        await store.set("user", 2, persona="analyst")
+        assert (await store.get("user", 1)).persona == "creative"
+        with pytest.raises(ValueError):
+            await store.set("team", 1, persona="creative")
+
+
+class TestScopedProvider:
+    def test_route_uses_requested_provider_and_model(self):
+        with patch.dict(os.environ, {"MODEL_ROUTING_ENABLED": "false"}):
+            pm = ProviderManager()
+        pm.available_providers = [ProviderType.FREE, ProviderType.OPENAI]
+        messages = [{"role": "user", "content": "oi"}]
+
+        assert pm._route(messages) is pm.current_model
+        assert pm._route(messages, provider=ProviderType.OPENAI).name == "gpt-3.5-turbo"
+        model = pm._route(messages, provider=ProviderType.OPENAI, model_name="gpt-4")
+        assert (model.provider, model.name) == (ProviderType.OPENAI, "gpt-4")
+        assert pm._provider_chain(model.provider)[0] == ProviderType.OPENAI
+        # Unavailable providers fall back to the current one
+        assert pm._route(messages, provider=ProviderType.GROK) is pm.current_model
+
+    @pytest.mark.asyncio
+    async def test_client_passes_resolved_settings(self):
+        from src.aclient import DiscordClient
+        client = DiscordClient()
+        client.provider_manager.get_response = AsyncMock(return_value="ok")
+        await client.settings.set("guild", 10, provider="Free", persona="analyst")
+        await client.settings.set("user", 1, persona="creative")
+
+        await client.handle_message("oi", 1, guild_id=10, channel_id=20)
+        kwargs = client.provider_manager.get_response.await_args.kwargs
+        assert kwargs["persona"] == "creative"
+        assert kwargs["provider"] == ProviderType.FREE
+
+        await client.handle_message("oi", 2, guild_id=10, channel_id=20)
+        assert client.provider_manager.get_response.await_args.kwargs["persona"] == "analyst"
+        client.settings.close()
@@ -0,0 +1,106 @@
+import os
+import time
+import pytest
+from unittest.mock import patch
+
+from src.resilience import ErrorKind, classify_error
+from src.simulated import SimulatedBackend, SimulatedError
+
+
+MESSAGES = [{"role": "system", "content": "persona"}, {"role": "user", "content": "olá mundo"}]
+
+
+class TestSimulatedBackend:
+    def test_latency_distributions(self):
+        for distribution in ("fixed", "uniform", "normal", "lognormal", "exponential"):
+            backend = SimulatedBackend(distribution, latency_mean=0.5, latency_stddev=0.1, seed=1)
+            samples = [backend.sample_latency() for _ in range(2000)]
+            assert all(s >= 0 for s in samples)
+            assert sum(samples) / len(samples) == pytest.approx(0.5, rel=0.1)
+
+    def test_rejects_unknown_distribution(self):
+        with pytest.raises(ValueError):
+            SimulatedBackend("pareto")
+
+    @pytest.mark.asyncio
+    async def test_complete_takes_latency_plus_generation_time(self):
+        backend = SimulatedBackend("fixed", latency_mean=0.05, tokens_per_second=200, response_tokens=10)
+        start = time.perf_counter()
+        reply = await backend.complete(MESSAGES)
+        elapsed = time.perf_counter() - start
+        assert reply.startswith("Resposta simulada: olá mundo")
+        assert len(reply.split()) == 10
+        assert elapsed >= 0.05 + 10 / 200 - 0.01
+
+    @pytest.mark.asyncio
+    async def test_stream_yields_tokens(self):
+        backend = SimulatedBackend("fixed", latency_mean=0, tokens_per_second=1000, response_tokens=5)
+        tokens = [t async for t in backend.stream(MESSAGES)]
+        assert len(tokens) == 5
+
+    @pytest.mark.asyncio
+    async def test_error_rate_raises_retryable_error(self):
+        backend = SimulatedBackend("fixed", latency_mean=0, error_rate=1.0)
+        with pytest.raises(SimulatedError) as info:
+            await backend.complete(MESSAGES)
+        assert classify_error(info.value) == ErrorKind.SERVER
+        assert backend.stats() == {"requests": 1, "errors": 1}
+
+    @pytest.mark.asyncio
+    async def test_throughput_limits_request_rate(self):
+        backend = SimulatedBackend("fixed", latency_mean=0, throughput=20, tokens_per_second=0)
+        start = time.perf_counter()
+        for _ in range(25):
+            await backend.complete(MESSAGES)
+        # 20 served in the first second's burst, the remaining 5 at 20/s
+        assert time.perf_counter() - start >= 0.2
+
+
+class TestProviderRegistry:
+    @pytest.mark.asyncio
+    async def test_simulated_provider_end_to_end(self):
+        from src.providers import ProviderManager, ProviderType
+
+        env = {"SIMULATED_PROVIDER_ENABLED": "true", "DEFAULT_PROVIDER": "simulated",
+               "SIMULATED_LATENCY_DISTRIBUTION": "fixed", "SIMULATED_LATENCY_MEAN": "0",
+               "SIMULATED_TOKENS_PER_SECOND": "0", "RESPONSE_CACHE_ENABLED": "False"}
+        with patch.dict(os.environ, env):
+            pm = ProviderManager()
+
+        assert pm.current_provider == ProviderType.SIMULATED
+        assert pm.current_model.name == "simulated"
+        reply = await pm.get_response(MESSAGES)
+        assert reply.startswith("Resposta simulada")
+        streamed = "".join([t async for t in pm.stream_response(MESSAGES)])
+        assert streamed.strip() == reply
+        assert pm.get_provider_status()["simulated"]["requests"] == 2
+
+    def test_simulated_provider_disabled_by_default(self):
+        from src.providers import ProviderManager, ProviderType
+
+        with patch.dict(os.environ, {"SIMULATED_PROVIDER_ENABLED": "false"}):
+            pm = ProviderManager()
+        assert ProviderType.SIMULATED not in pm.available_providers
+
+    @pytest.mark.asyncio
+    async def test_dispatch_goes_through_registered_class(self):
+        from src import providers
+        from src.providers import BaseProvider, ProviderManager, ProviderType
+
+        class EchoProvider(BaseProvider):
+            def check_availability(self):
+                return True
+
+            async def get_response(self, messages, model=None, deadline=None):
+                return f"{model}: {messages[-1]['content']}"
+
+        original = providers.PROVIDER_REGISTRY[ProviderType.FREE]
+        providers.register_provider(ProviderType.FREE)(EchoProvider)
+        try:
+            with patch.dict(os.environ, {"RESPONSE_CACHE_ENABLED": "False"}):
+                pm = ProviderManager()
+        finally:
+            providers.register_provider(ProviderType.FREE)(original)
+
+        assert await pm.get_response(MESSAGES) == "gpt-3.5-turbo: olá mundo"
+        assert [t async for t in pm.stream_response(MESSAGES)] == ["gpt-3.5-turbo: olá mundo"]
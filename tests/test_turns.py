@@ -0,0 +1,84 @@
+import os
+import asyncio
+import discord
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+from src.turns import TurnQueue
+
+
+class TestTurnQueue:
+    @pytest.mark.asyncio
+    async def test_rapid_messages_are_merged(self):
+        queue = TurnQueue(debounce=0.05)
+
+        async def later(text, delay):
+            await asyncio.sleep(delay)
+            return await queue.collect(1, text)
+
+        results = await asyncio.gather(queue.collect(1, "oi"), later("tudo bem?", 0.02), later("e aí", 0.04),
+                                       queue.collect(2, "outro"))
+        assert results == ["oi\ntudo bem?\ne aí", None, None, "outro"]
+        assert queue.stats()["merged"] == 2
+        assert queue.stats()["debouncing"] == 0
+
+    @pytest.mark.asyncio
+    async def test_batch_cap_starts_a_new_turn(self):
+        queue = TurnQueue(debounce=0.02, max_batch=2)
+        results = await asyncio.gather(*(queue.collect(1, str(i)) for i in range(3)))
+        assert results == ["0\n1", None, "2"]
+
+    @pytest.mark.asyncio
+    async def test_disabled_debounce_passes_through(self):
+        assert await TurnQueue(debounce=0).collect(1, "oi") == "oi"
+
+    @pytest.mark.asyncio
+    async def test_turns_run_in_order(self):
+        queue = TurnQueue()
+        order = []
+
+        async def turn(name, delay):
+            async with queue.turn(1):
+                order.append(f"start {name}")
+                await asyncio.sleep(delay)
+                order.append(f"end {name}")
+
+        await asyncio.gather(turn("a", 0.03), turn("b", 0.0), turn("c", 0.01))
+        assert order == ["start a", "end a", "start b", "end b", "start c", "end c"]
+        assert queue.stats() == {"merged": 0, "waited": 2, "active": 0, "debouncing": 0}
+
+
+class TestClientTurns:
+    @pytest.mark.asyncio
+    async def test_concurrent_messages_keep_history_in_order(self):
+        from src.aclient import DiscordClient
+        client = DiscordClient()
+        seen = []
+
+        async def fake_get_response(messages, **kwargs):
+            seen.append([m["content"] for m in messages[1:]])
+            await asyncio.sleep(0.01 if messages[-1]["content"] == "1" else 0)
+            return f"resposta {messages[-1]['content']}"
+
+        client.provider_manager.get_response = fake_get_response
+        await asyncio.gather(client.handle_message("1", 7), client.handle_message("2", 7))
+
+        assert seen == [["1"], ["1", "resposta 1", "2"]]
+        assert [m.content for m in client.conversation_histories[7]] == ["1", "resposta 1", "2", "resposta 2"]
+
+    @pytest.mark.asyncio
+    async def test_dm_burst_sends_one_request(self):
+        with patch.dict(os.environ, {"CONVERSATION_DEBOUNCE": "0.05"}):
+            from src.aclient import DiscordClient
+            client = DiscordClient()
+        client.handle_message = AsyncMock(return_value="ok")
+        channel = Mock(spec=discord.DMChannel)
+        channel.send = AsyncMock()
+
+        def dm(text):
+            return Mock(author=Mock(id=5), content=text, channel=channel)
+
+        await asyncio.gather(*(client.on_message(dm(t)) for t in ("a", "b", "c")))
+        client.handle_message.assert_awaited_once()
+        assert client.handle_message.await_args.args[:2] == ("a\nb\nc", 5)
+        channel.send.assert_awaited_once_with("ok")
@@ -0,0 +1,132 @@
+import os
+import types
+import asyncio
+import pytest
+from datetime import date
+from unittest.mock import patch
+
+from src.usage import UsageTracker, extract_usage, read_totals, set_requester
+
+
+def _ns(**kwargs):
+    return types.SimpleNamespace(**kwargs)
+
+
+class TestExtractUsage:
+    def test_sdk_shapes(self):
+        assert extract_usage(_ns(usage=_ns(prompt_tokens=10, completion_tokens=5))) == (10, 5, 0)
+        assert extract_usage(_ns(usage=_ns(input_tokens=7, output_tokens=3))) == (7, 3, 0)
+        assert extract_usage(_ns(usage_metadata=_ns(prompt_token_count=4, candidates_token_count=2))) == (4, 2, 0)
+        assert extract_usage(_ns(choices=[])) is None
+        assert extract_usage(None) is None
+
+    def test_cached_tokens(self):
+        openai_usage = _ns(prompt_tokens=2000, completion_tokens=10, prompt_tokens_details=_ns(cached_tokens=1536))
+        assert extract_usage(_ns(usage=openai_usage)) == (2000, 10, 1536)
+        # Anthropic's input_tokens excludes cache reads and writes
+        claude_usage = _ns(input_tokens=50, output_tokens=10, cache_read_input_tokens=1800, cache_creation_input_tokens=200)
+        assert extract_usage(_ns(usage=claude_usage)) == (2050, 10, 1800)
+        gemini_usage = _ns(prompt_token_count=900, candidates_token_count=5, cached_content_token_count=800)
+        assert extract_usage(_ns(usage_metadata=gemini_usage)) == (900, 5, 800)
+
+
+class TestUsageTracker:
+    @pytest.mark.asyncio
+    async def test_totals_per_dimension_include_pending(self, tmp_path):
+        tracker = UsageTracker(str(tmp_path / "usage.db"), flush_interval=60, batch_size=100)
+        set_requester(1, 10)
+        tracker.record("OpenAI", "gpt-4", 100, 50, 0.0045)
+        set_requester(2, None)
+        tracker.record("OpenAI", "gpt-4", 10, 5, 0.00045)
+        tracker.record("Free", "gpt-3.5-turbo", 10, 5, 0.0, estimated=True, cached_tokens=0)
+        tracker.record("Claude", "claude-3-haiku", 1000, 10, 0.0025, cached_tokens=900)
+
+        by_provider = await tracker.totals("provider")
+        assert by_provider["OpenAI"]["requests"] == 2
+        assert by_provider["OpenAI"]["prompt_tokens"] == 110
+        assert by_provider["Free"]["estimated_requests"] == 1
+        assert (await tracker.totals("user_id"))["1"]["cost"] == pytest.approx(0.0045)
+        assert set(await tracker.totals("guild_id")) == {"10", ""}
+        assert by_provider["Claude"]["cached_tokens"] == 900
+        assert tracker.stats()["cached_tokens"] == 900
+        assert tracker.stats()["cached_ratio"] == pytest.approx(900 / 1120, abs=1e-3)
+        await tracker.aclose()
+
+    @pytest.mark.asyncio
+    async def test_flushes_in_batches_and_accumulates(self, tmp_path):
+        db_path = str(tmp_path / "usage.db")
+        tracker = UsageTracker(db_path, flush_interval=60, batch_size=3)
+        set_requester(1)
+        for _ in range(3):
+            tracker.record("Claude", "claude-3-haiku", 10, 10, 0.001)
+        await asyncio.sleep(0.05)
+
+        assert tracker.flushes == 1
+        assert tracker.stats()["pending"] == 0
+        tracker.record("Claude", "claude-3-haiku", 10, 10, 0.001)
+        await tracker.aclose()
+
+        totals = read_totals(db_path, "model")
+        assert totals["claude-3-haiku"]["requests"] == 4
+        assert read_totals(db_path, "day")[date.today().isoformat()]["completion_tokens"] == 40
+
+    @pytest.mark.asyncio
+    async def test_flush_interval(self, tmp_path):
+        tracker = UsageTracker(str(tmp_path / "usage.db"), flush_interval=0.05, batch_size=100)
+        tracker.record("Free", "gpt-3.5-turbo", 1, 1, 0.0)
+        await asyncio.sleep(0.15)
+        assert tracker.flushes == 1
+        await tracker.aclose()
+
+
+@pytest.mark.asyncio
+async def test_provider_records_sdk_usage_and_cost():
+    from src.providers import ProviderManager, ProviderType
+
+    async def create(**kwargs):
+        return _ns(choices=[_ns(message=_ns(content="OK"))], usage=_ns(prompt_tokens=600, completion_tokens=400))
+
+    mod = _ns(AsyncClient=lambda api_key=None, **kwargs: _ns(chat=_ns(completions=_ns(create=create))))
+    with patch.dict(os.environ, {"OPENAI_KEY": "k"}), patch.dict('sys.modules', {'openai': mod}):
+        pm = ProviderManager()
+        set_requester(42, 7)
+        assert await pm.providers[ProviderType.OPENAI].get_response([{"role": "user", "content": "oi"}], "gpt-4") == "OK"
+
+    totals = (await pm.usage.totals("user_id"))["42"]
+    assert totals["prompt_tokens"] == 600 and totals["completion_tokens"] == 400
+    assert totals["estimated_requests"] == 0
+    # gpt-4 is priced at $0.03 per 1K tokens
+    assert totals["cost"] == pytest.approx(0.03)
+    await pm.aclose()
+
+
+@pytest.mark.asyncio
+async def test_free_provider_usage_is_estimated():
+    from src.providers import ProviderManager, ProviderType
+
+    async def create(**kwargs):
+        return _ns(choices=[_ns(message=_ns(content="uma resposta curta"))])
+
+    pm = ProviderManager()
+    pm.providers[ProviderType.FREE]._client = _ns(chat=_ns(completions=_ns(create=create)))
+    await pm.providers[ProviderType.FREE].get_response([{"role": "user", "content": "oi"}])
+
+    totals = (await pm.usage.totals("provider"))["Free"]
+    assert totals["estimated_requests"] == 1
+    assert totals["completion_tokens"] > 0
+    assert totals["cost"] == 0
+    await pm.aclose()
+
+
+def test_old_usage_db_gains_cached_tokens_column(tmp_path):
+    import sqlite3
+    db_path = str(tmp_path / "usage.db")
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE usage_totals (day TEXT, provider TEXT, model TEXT, user_id TEXT, guild_id TEXT, "
+               "requests INTEGER, estimated_requests INTEGER, prompt_tokens INTEGER, completion_tokens INTEGER, "
+               "cost REAL, PRIMARY KEY (day, provider, model, user_id, guild_id))")
+    db.execute("INSERT INTO usage_totals VALUES ('2024-01-01', 'OpenAI', 'gpt-4', '', '', 1, 0, 10, 5, 0.1)")
+    db.commit()
+    db.close()
+
+    assert read_totals(db_path, "provider")["OpenAI"]["cached_tokens"] == 0
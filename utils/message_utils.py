@@ -1,4 +1,5 @@
 import re
+import time
 
 async def send_split_message(channel, response: str, char_limit: int = 2000):
     """Send a message to a channel, splitting into chunks by char_limit.
@@ -39,3 +40,74 @@ async def send_response_with_images(channel, response: dict, char_limit: int = 2
             await send_split_message(channel, text, char_limit)
         if response_images and i < len(response_images):
             await send_split_message(channel, str(response_images[i]).strip(), char_limit)
+
+
+class StreamSink:
+    """Deliver streamed tokens to Discord by editing a message in place.
+
+    ``send`` is a coroutine function that posts new content and returns a
+    message object supporting ``edit(content=...)`` (e.g. ``channel.send`` or
+    ``interaction.followup.send`` with ``wait=True``). Edits are coalesced to at
+    most one per ``edit_interval`` seconds so we stay under Discord's per-channel
+    edit rate limit, and output rolls over to a new message at ``char_limit``.
+    """
+
+    def __init__(self, send, char_limit: int = 2000, edit_interval: float = 1.0):
+        self.send = send
+        self.char_limit = char_limit
+        self.edit_interval = edit_interval
+        self.messages = []
+        self._message = None
+        self._current = ""
+        self._shown = ""
+        self._last_flush = 0.0
+        self._parts = []
+
+    @property
+    def text(self) -> str:
+        """Full text written so far"""
+        return "".join(self._parts)
+
+    async def write(self, token: str):
+        """Append a token, flushing to Discord when the edit interval allows"""
+        if not token:
+            return
+        self._parts.append(token)
+        self._current += token
+
+        while len(self._current) > self.char_limit:
+            cut = self._split_point(self._current)
+            head, self._current = self._current[:cut], self._current[cut:]
+            await self._publish(head)
+            # Roll over: the next flush starts a new message
+            self._message = None
+            self._shown = ""
+
+        if time.monotonic() - self._last_flush >= self.edit_interval:
+            await self._publish(self._current)
+
+    async def finish(self) -> str:
+        """Flush any pending text and return the full response"""
+        await self._publish(self._current)
+        return self.text
+
+    def _split_point(self, text: str) -> int:
+        """Prefer breaking at a newline or space inside the limit"""
+        window = text[:self.char_limit]
+        for sep in ("\n", " "):
+            idx = window.rfind(sep)
+            if idx > self.char_limit // 2:
+                return idx + 1
+        return self.char_limit
+
+    async def _publish(self, content: str):
+        """Send or edit the active message with ``content``"""
+        self._last_flush = time.monotonic()
+        if not content.strip() or content == self._shown:
+            return
+        if self._message is None:
+            self._message = await self.send(content)
+            self.messages.append(self._message)
+        else:
+            await self._message.edit(content=content)
+        self._shown = content